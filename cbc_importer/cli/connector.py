@@ -14,7 +14,9 @@ import logging
 import os.path
 import sys
 from pathlib import Path
-from typing import Optional
+from contextlib import nullcontext
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import typer
 import yaml
@@ -23,13 +25,33 @@ from cbc_sdk.enterprise_edr import Feed
 from typer import Argument, Option
 
 from cbc_importer import __version__
-from cbc_importer.importer import process_iocs
+from cbc_importer.feed_cache import get_feed_cache, persist_feed_index
+from cbc_importer.importer import compact_feed as importer_compact_feed
+from cbc_importer.importer import (
+    LAYOUT_SEQUENTIAL,
+    MAX_REPORT_BYTES,
+    MAX_REQUEST_BYTES,
+    UploadPlan,
+    process_iocs,
+)
+from cbc_importer.journal import ImportInterrupted, ImportJournal, stop_on_sigterm
+from cbc_importer.partitions import process_partitioned_iocs
+from cbc_importer.ranking import unique_iocs, with_source
+from cbc_importer.records import IOCRecord
+from cbc_importer.retries import install_retry_policy
 from cbc_importer.stix_parsers.v1.parser import STIX1Parser
 from cbc_importer.stix_parsers.v2.parser import STIX2Parser
 from cbc_importer.taxii_configurator import TAXIIConfigurator
+from cbc_importer.throttling import install_rate_limiter
 from cbc_importer.utils import create_feed as utils_create_feed
 from cbc_importer.utils import create_watchlist as utils_create_watchlist
-from cbc_importer.utils import validate_provider_url, validate_severity
+from cbc_importer.utils import (
+    validate_layout,
+    validate_positive_int,
+    validate_provider_url,
+    validate_severity,
+    validate_size_limit,
+)
 
 DEFAULT_CONFIG_PATH = Path(__file__).parent.resolve() / "config.yml"
 
@@ -52,7 +74,7 @@ def process_stix1_file(**kwargs) -> None:
     iocs = STIX1Parser(kwargs["cb"]).parse_file(file_path)
     kwargs.update({"iocs": iocs})
     process_iocs(**kwargs)
-    logger.info(f"Successfully imported {file_path} into CBC.")
+    logger.info(f"Successfully {'planned' if kwargs.get('plan') else 'imported'} {file_path} into CBC.")
 
 
 def process_stix2_file(**kwargs) -> None:
@@ -65,36 +87,241 @@ def process_stix2_file(**kwargs) -> None:
     iocs = STIX2Parser(kwargs["cb"]).parse_file(file_path)
     kwargs.update({"iocs": iocs})
     process_iocs(**kwargs)
-    logger.info(f"Successfully imported {file_path} into CBC.")
+    logger.info(f"Successfully {'planned' if kwargs.get('plan') else 'imported'} {file_path} into CBC.")
 
 
-def process_taxii1_server(server_config: TAXIIConfigurator, cbcsdk: CBCloudAPI) -> None:
+def process_taxii1_server(
+    server_config: TAXIIConfigurator,
+    cbcsdk: CBCloudAPI,
+    journal: Optional[ImportJournal] = None,
+    plan: Optional[UploadPlan] = None,
+) -> None:
     """Processing a TAXII 1.x Server, parsing IOCs and loading them
     into a feed.
 
     Args:
         config (TAXIIConfigurator): The configuration for the TAXII Client
         cbcsdk (CBCloudAPI): The Authenticated instance of CBC
-        server_name (str): The name of the TAXII Server
+        journal (ImportJournal): (optional) The journal of the import, to continue an interrupted one
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them
     """
-    iocs = STIX1Parser(cbcsdk).parse_taxii_server(server_config.client, **server_config.search_options)
-    process_iocs(cb=cbcsdk, iocs=iocs, **server_config.cbc_feed_options)
-    logger.info(f"Successfully imported {server_config.server_name} into CBC.")
+    parser = STIX1Parser(cbcsdk)
+    if journal:
+        collections = parser.iter_taxii_collections(server_config.client, **server_config.search_options)
+        process_journaled_server(server_config, cbcsdk, collections, journal)
+    elif server_config.partitioned:
+        collections = parser.iter_taxii_collections(server_config.client, **server_config.search_options)
+        process_partitioned_server(
+            server_config, cbcsdk, ((key, chain.from_iterable(pages)) for key, pages in collections), plan=plan
+        )
+    else:
+        iocs = parser.iter_taxii_server(server_config.client, **server_config.search_options)
+        iocs = with_source(iocs, server_config.server_name, server_config.priority)
+        process_iocs(cb=cbcsdk, iocs=iocs, plan=plan, **server_config.cbc_feed_options)
+    logger.info(f"Successfully {'planned' if plan else 'imported'} {server_config.server_name} into CBC.")
 
 
-def process_taxii2_server(server_config: TAXIIConfigurator, cbcsdk: CBCloudAPI) -> None:
+def process_taxii2_server(
+    server_config: TAXIIConfigurator,
+    cbcsdk: CBCloudAPI,
+    journal: Optional[ImportJournal] = None,
+    plan: Optional[UploadPlan] = None,
+) -> None:
     """Processing a TAXII 2.0/2.1 Server, parsing IOCs and loading them
     into a feed.
 
     Args:
         config (TAXIIConfigurator): The configuration for the TAXII Client
         cbcsdk (CBCloudAPI): Authenticated instance of CBC
-        server_name (str): The name of the TAXII Server
-        stix_version (float): The version of STIX
+        journal (ImportJournal): (optional) The journal of the import, to continue an interrupted one
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them
+    """
+    parser = STIX2Parser(cbcsdk)
+    if journal:
+        collections = parser.iter_taxii_collections(server_config.client, **server_config.search_options)
+        process_journaled_server(server_config, cbcsdk, collections, journal)
+    elif server_config.partitioned:
+        collections = parser.iter_taxii_collections(server_config.client, **server_config.search_options)
+        process_partitioned_server(
+            server_config, cbcsdk, ((key, chain.from_iterable(pages)) for key, pages in collections), plan=plan
+        )
+    else:
+        iocs = parser.iter_taxii_server(server_config.client, **server_config.search_options)
+        iocs = with_source(iocs, server_config.server_name, server_config.priority)
+        process_iocs(cbcsdk, iocs, plan=plan, **server_config.cbc_feed_options)
+    logger.info(f"Successfully {'planned' if plan else 'imported'} {server_config.server_name} into CBC.")
+
+
+def process_merged_servers(
+    server_configs: List[TAXIIConfigurator],
+    cbcsdk: CBCloudAPI,
+    journal: Optional[ImportJournal] = None,
+    plan: Optional[UploadPlan] = None,
+) -> None:
+    """Processing the TAXII Servers that import into the same feed, their IOCs are loaded with a single upload.
+
+    The IOCs of the servers are merged and the duplicated IOCs are kept once, the source of every IOC is
+    recorded with the priority of its server. The servers have the same feed options, they are checked by
+    `TAXIIConfigurator.check_shared_feeds`.
+
+    Args:
+        server_configs (List[TAXIIConfigurator]): The configurations of the servers
+        cbcsdk (CBCloudAPI): Authenticated instance of CBC
+        journal (ImportJournal): (optional) The journal of the import, to continue an interrupted one
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them
+    """
+    names = ", ".join(server_config.server_name for server_config in server_configs)
+    feed_options = server_configs[0].cbc_feed_options
+    logger.info(f"Merging {names} into a single upload of feed {feed_options['feed_id']}")
+
+    if journal:
+        # the collections are spooled under the position of their server, so the source of the iocs is known
+        journal.spool(
+            (f"{index}/{key}", pages)
+            for index, server_config in enumerate(server_configs)
+            for key, pages in get_parser(server_config, cbcsdk).iter_taxii_collections(
+                server_config.client, **server_config.search_options
+            )
+        )
+        sources = ((server_configs[int(key.partition("/")[0])], iocs) for key, iocs in journal.spooled_collections())
+        iocs = chain.from_iterable(
+            with_source(spooled_iocs, server_config.server_name, server_config.priority)
+            for server_config, spooled_iocs in sources
+        )
+    else:
+        iocs = chain.from_iterable(
+            with_source(
+                get_parser(server_config, cbcsdk).iter_taxii_server(
+                    server_config.client, **server_config.search_options
+                ),
+                server_config.server_name,
+                server_config.priority,
+            )
+            for server_config in server_configs
+        )
+    # the duplicated iocs are kept once, the copy of the server with the highest priority is the one kept,
+    # the iocs are ranked by the import
+    merged = unique_iocs(iocs)
+    process_iocs(cbcsdk, merged, journal=journal, plan=plan, **feed_options)
+    if journal:
+        journal.finish()
+    logger.info(f"Successfully {'planned' if plan else 'imported'} {names} into CBC.")
+
+
+def get_parser(server_config: TAXIIConfigurator, cbcsdk: CBCloudAPI) -> Union[STIX1Parser, STIX2Parser]:
+    """Return the parser of the STIX content of a TAXII Server
+
+    Args:
+        server_config (TAXIIConfigurator): The configuration for the TAXII Client
+        cbcsdk (CBCloudAPI): Authenticated instance of CBC
+
+    Returns:
+        Union[STIX1Parser, STIX2Parser]: The parser
+    """
+    if server_config.version < 2.0:
+        return STIX1Parser(cbcsdk)
+    return STIX2Parser(cbcsdk)
+
+
+def write_plan(upload_plan: UploadPlan, plan_file: str) -> None:
+    """Write the plan of the upload to a JSON file and log its totals
+
+    Args:
+        upload_plan (UploadPlan): The plan
+        plan_file (str): The path of the file
+    """
+    totals = upload_plan.write(plan_file)["totals"]
+    logger.info(
+        f"The plan is written to {plan_file}: {totals['created']} Reports to create, {totals['updated']} to update, "
+        f"{totals['kept']} kept, {totals['deleted']} to delete, {totals['payload_bytes']} bytes "
+        f"in {totals['api_calls']} requests, {totals['dropped_iocs']} IOCs dropped."
+    )
+
+
+def group_servers(servers: List[Tuple[TAXIIConfigurator, dict]]) -> List[List[Tuple[TAXIIConfigurator, dict]]]:
+    """Group the TAXII Servers by the feed they import into, in the order of the configuration.
+
+    The partitioned servers are never grouped, their Reports are kept apart from the other servers already.
+
+    Args:
+        servers (List[Tuple[TAXIIConfigurator, dict]]): The configurations of the enabled servers
+
+    Returns:
+        List[List[Tuple[TAXIIConfigurator, dict]]]: The groups of servers
+    """
+    groups: List[List[Tuple[TAXIIConfigurator, dict]]] = []
+    by_feed: Dict[str, List[Tuple[TAXIIConfigurator, dict]]] = {}
+    for server in servers:
+        feed_id = server[0].cbc_feed_options.get("feed_id")
+        if server[0].partitioned or not feed_id:
+            groups.append([server])
+        elif feed_id in by_feed:
+            by_feed[feed_id].append(server)
+        else:
+            by_feed[feed_id] = [server]
+            groups.append(by_feed[feed_id])
+    return groups
+
+
+def process_journaled_server(
+    server_config: TAXIIConfigurator,
+    cbcsdk: CBCloudAPI,
+    collections: Iterable[Tuple[str, Iterator[List[IOCRecord]]]],
+    journal: ImportJournal,
+) -> None:
+    """Spooling the IOCs of a TAXII Server in the journal and loading them into a feed from there.
+
+    Everything that is already in the journal is skipped, the journal is deleted once the import is done.
+
+    Args:
+        server_config (TAXIIConfigurator): The configuration for the TAXII Client
+        cbcsdk (CBCloudAPI): Authenticated instance of CBC
+        collections (Iterable[Tuple[str, Iterator[List[IOCRecord]]]]): The collections of the server and
+            the parsed IOCs of their pages
+        journal (ImportJournal): The journal of the import
+    """
+    journal.spool(collections)
+    # the spool keeps the rank of the iocs, so they are ranked and bucketed as if they were not spooled
+    if server_config.partitioned:
+        process_partitioned_server(server_config, cbcsdk, journal.spooled_collections(), journal)
+    else:
+        iocs = with_source(journal.spooled_iocs(), server_config.server_name, server_config.priority)
+        process_iocs(cbcsdk, iocs, journal=journal, **server_config.cbc_feed_options)
+    journal.finish()
+
+
+def process_partitioned_server(
+    server_config: TAXIIConfigurator,
+    cbcsdk: CBCloudAPI,
+    collections: Iterable[Tuple[str, Iterable[IOCRecord]]],
+    journal: Optional[ImportJournal] = None,
+    plan: Optional[UploadPlan] = None,
+) -> None:
+    """Loading the IOCs of every collection of a TAXII Server into its own partition of the Reports of a feed.
+
+    Args:
+        server_config (TAXIIConfigurator): The configuration for the TAXII Client
+        cbcsdk (CBCloudAPI): Authenticated instance of CBC
+        collections (Iterable[Tuple[str, Iterable[IOCRecord]]]): The collections of the server and their IOCs
+        journal (ImportJournal): (optional) The journal of the import
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them
     """
-    iocs = STIX2Parser(cbcsdk).parse_taxii_server(server_config.client, **server_config.search_options)
-    process_iocs(cbcsdk, iocs, **server_config.cbc_feed_options)
-    logger.info(f"Successfully imported {server_config.server_name} into CBC.")
+    collections = (
+        (key, with_source(iocs, server_config.server_name, server_config.priority)) for key, iocs in collections
+    )
+    summary = process_partitioned_iocs(
+        cbcsdk,
+        collections,
+        server_name=server_config.server_name,
+        journal=journal,
+        plan=plan,
+        **server_config.cbc_feed_options,
+    )
+    logger.info(
+        f"{summary['partitions_changed']} partitions of {server_config.server_name} changed: "
+        f"{summary['uploaded']} Reports uploaded, {summary['deleted']} deleted, {summary['unchanged']} unchanged, "
+        f"{summary['dropped']} IOCs dropped."
+    )
 
 
 @cli.command(
@@ -109,6 +336,12 @@ def process_taxii2_server(server_config: TAXIIConfigurator, cbcsdk: CBCloudAPI)
 
         cbc-threat-intel process-file ./stix_content.xml 55IOVthAZgmQHgr8eRF9rA -c default
 
+        cbc-threat-intel process-file ./stix_content.xml 55IOVthAZgmQHgr8eRF9rA --sync
+
+        cbc-threat-intel process-file ./stix_content.xml 55IOVthAZgmQHgr8eRF9rA --plan ./plan.json
+
+        cbc-threat-intel process-file ./stix_content.xml 55IOVthAZgmQHgr8eRF9rA --sync --layout hashed -w 8
+
     """,
     no_args_is_help=True,
 )
@@ -121,6 +354,46 @@ def process_file(
     replace: Optional[bool] = Option(
         False, "--replace", "-r", help="Replacing the existing Reports in the Feed, if false it will append the results"
     ),
+    sync: Optional[bool] = Option(
+        False,
+        "--sync",
+        help="Synchronizing the Reports in the Feed with the file, only the changed Reports are uploaded",
+    ),
+    layout: Optional[str] = Option(
+        LAYOUT_SEQUENTIAL,
+        "--layout",
+        "-l",
+        help="How the IOCs are laid out in the Reports: `sequential`, `hashed` (stable Reports by IOC hash), "
+        "`daily` or `weekly` (Reports by the time the IOCs are first seen), `tiered` (appending to small delta Reports)",
+        callback=validate_layout,
+    ),
+    workers: Optional[int] = Option(
+        1,
+        "--workers",
+        "-w",
+        help="How many Reports are uploaded at the same time",
+        callback=validate_positive_int("Workers"),
+    ),
+    max_report_bytes: Optional[int] = Option(
+        MAX_REPORT_BYTES,
+        "--max-report-bytes",
+        help="The largest serialized size of a Report, the IOC count of a Report is capped as well",
+        callback=validate_size_limit,
+    ),
+    max_request_bytes: Optional[int] = Option(
+        MAX_REQUEST_BYTES,
+        "--max-request-bytes",
+        help="The largest serialized size of the request replacing the Reports",
+        callback=validate_size_limit,
+    ),
+    overflow_shards: Optional[bool] = Option(
+        False,
+        "--overflow-shards",
+        help="Putting the IOCs that do not fit into the Feed into sibling Feeds, `<name> (shard <number>)`",
+    ),
+    plan_file: Optional[str] = Option(
+        None, "--plan", help="Only plan the upload and write the plan to this JSON file, nothing is written to CBC"
+    ),
     cbc_profile: Optional[str] = Option(
         "default", "--cbc-profile", "-c", help="The CBC Profile set in the CBC Credentials"
     ),
@@ -132,6 +405,13 @@ def process_file(
         feed_id (str): the id of the feed
         severity (Optional[int]): The severity of the reports that are going to be imported
         replace: (Optional[bool]): Replacing the existing Reports in the Feed, if false it will append the results
+        sync: (Optional[bool]): Synchronizing the Reports in the Feed with the file (takes precedence over replace)
+        layout: (Optional[str]): How the IOCs are laid out in the Reports
+        workers: (Optional[int]): How many Reports are uploaded at the same time
+        max_report_bytes: (Optional[int]): The largest serialized size of a Report
+        max_request_bytes: (Optional[int]): The largest serialized size of the request replacing the Reports
+        overflow_shards: (Optional[bool]): Putting the IOCs that do not fit into the Feed into sibling Feeds
+        plan_file: (Optional[str]): Only plan the upload and write the plan to this JSON file
         cbc_profile (Optional[str]): The CBC Profile set in the CBC Credentials
 
     Raises:
@@ -139,14 +419,25 @@ def process_file(
     """
     extension = os.path.splitext(stix_file_path)[1]
     cbcsdk = CBCloudAPI(profile=cbc_profile)
+    limiter = install_rate_limiter(cbcsdk)
+    retry_policy = install_retry_policy(cbcsdk)
 
     kwargs = {
         "stix_file_path": stix_file_path,
         "feed_id": feed_id,
         "severity": severity,
         "replace": replace,
+        "sync": sync,
+        "layout": layout,
+        "workers": workers,
+        "max_report_bytes": max_report_bytes,
+        "max_request_bytes": max_request_bytes,
+        "overflow_shards": overflow_shards,
         "cb": cbcsdk,
     }
+    upload_plan = None
+    if plan_file:
+        upload_plan = kwargs["plan"] = UploadPlan()
 
     if extension == ".xml":
         process_stix1_file(**kwargs)
@@ -155,6 +446,9 @@ def process_file(
     else:
         logger.error(f"Invalid extension: `{extension}`")
         exit(1)
+    if upload_plan is not None and plan_file:
+        write_plan(upload_plan, plan_file)
+    logger.info(f"CBC requests: {limiter.metrics()}, retries: {retry_policy.metrics()}")
 
 
 @cli.command(
@@ -165,30 +459,148 @@ def process_file(
 
         cbc-threat-intel process-server --config-file=./config.yml
 
+        cbc-threat-intel process-server --config-file=./config.yml --plan ./plan.json
+
     """,
     no_args_is_help=False,
 )
-def process_server(config_file: str = Option(DEFAULT_CONFIG_PATH, help="The configuration of the servers")) -> None:
+def process_server(
+    config_file: str = Option(DEFAULT_CONFIG_PATH, help="The configuration of the servers"),
+    plan_file: Optional[str] = Option(
+        None, "--plan", help="Only plan the upload and write the plan to this JSON file, nothing is written to CBC"
+    ),
+) -> None:
     """Processing a TAXII Server
 
     Args:
         config_file (Optional[str]): configuration file for the server, uses default config path if none provided
+        plan_file (Optional[str]): Only plan the upload and write the plan to this JSON file
 
     Raises:
         ValueError: Whenever a STIX Version is incompatible
     """
     configuration = yaml.safe_load(Path(config_file).read_text())
     cbcsdk = CBCloudAPI(profile=configuration["cbc_auth_profile"], integration_name=("STIX/TAXII " + __version__))
+    limiter = install_rate_limiter(cbcsdk, **(configuration.get("rate_limit") or {}))
+    retry_policy = install_retry_policy(cbcsdk, **(configuration.get("retry") or {}))
+    if configuration.get("feed_index_ttl"):
+        persist_feed_index(cbcsdk, configuration["feed_index_ttl"])
+    journal_dir = configuration.get("journal_dir")
+    upload_plan = UploadPlan() if plan_file else None
+    if upload_plan and journal_dir:
+        # the journal would record the planned reports as uploaded
+        logger.info("The journal is not used when only planning the upload")
+        journal_dir = None
+    servers = []
     for server_configuration in configuration["servers"]:
         logger.info(f"Processing {server_configuration['name']}")
         server_config = TAXIIConfigurator(server_configuration)
         if server_config.enabled:
-            if server_config.version < 2.0:
-                process_taxii1_server(server_config, cbcsdk)
-            elif server_config.version == 2.0 or server_config.version == 2.1:
-                process_taxii2_server(server_config, cbcsdk)
+            servers.append((server_config, server_configuration))
         else:
             logger.info(f"Skipping {server_config.server_name}")
+    TAXIIConfigurator.check_shared_feeds([server_config for server_config, _ in servers])
+
+    # the servers that share a feed are merged, so the feed is uploaded once and they do not replace each other
+    for group in group_servers(servers):
+        server_configs = [server_config for server_config, _ in group]
+        journal = None
+        if journal_dir:
+            name = "+".join(server_config.server_name for server_config in server_configs)
+            journal_configuration = group[0][1] if len(group) == 1 else {"servers": [raw for _, raw in group]}
+            journal = ImportJournal.open(journal_dir, name, journal_configuration)
+        try:
+            with stop_on_sigterm(journal) if journal else nullcontext():
+                if len(server_configs) > 1:
+                    process_merged_servers(server_configs, cbcsdk, journal, upload_plan)
+                elif server_configs[0].version < 2.0:
+                    process_taxii1_server(server_configs[0], cbcsdk, journal, upload_plan)
+                elif server_configs[0].version == 2.0 or server_configs[0].version == 2.1:
+                    process_taxii2_server(server_configs[0], cbcsdk, journal, upload_plan)
+        except ImportInterrupted as e:
+            logger.error(str(e))
+            raise SystemExit(1)
+    if upload_plan is not None and plan_file:
+        write_plan(upload_plan, plan_file)
+    logger.info(
+        f"CBC requests: {limiter.metrics()}, retries: {retry_policy.metrics()}, "
+        f"feed cache: {get_feed_cache(cbcsdk).metrics()}"
+    )
+
+
+@cli.command(
+    help="""
+    Re-pack the IOCs of a feed into the fewest Reports, removing the duplicated IOCs.
+    The delta Reports of the `tiered` layout are merged into the base Reports, only the Reports
+    with the same tags are merged. The feeds of the `hashed`, `daily` and `weekly` layouts are not compacted.
+
+    Example usage:
+
+        cbc-threat-intel compact-feed 55IOVthAZgmQHgr8eRF9rA --dry-run
+
+        cbc-threat-intel compact-feed 55IOVthAZgmQHgr8eRF9rA -w 8 -c default
+
+    """,
+    no_args_is_help=True,
+)
+def compact_feed(
+    feed_id: str = Argument(None, help="The id of the feed"),
+    dry_run: Optional[bool] = Option(
+        False, "--dry-run", help="Only print the occupancy of the Reports before and after, nothing is changed"
+    ),
+    workers: Optional[int] = Option(
+        1,
+        "--workers",
+        "-w",
+        help="How many Reports are uploaded at the same time",
+        callback=validate_positive_int("Workers"),
+    ),
+    max_report_bytes: Optional[int] = Option(
+        MAX_REPORT_BYTES,
+        "--max-report-bytes",
+        help="The largest serialized size of a Report, the IOC count of a Report is capped as well",
+        callback=validate_size_limit,
+    ),
+    cbc_profile: Optional[str] = Option(
+        "default", "--cbc-profile", "-c", help="The CBC Profile set in the CBC Credentials"
+    ),
+) -> None:
+    """Re-pack the IOCs of a feed into the fewest Reports, merging the delta Reports into the base ones
+
+    Args:
+        feed_id (str): the id of the feed
+        dry_run (Optional[bool]): Only print the occupancy of the Reports before and after
+        workers (Optional[int]): How many Reports are uploaded at the same time
+        max_report_bytes (Optional[int]): The largest serialized size of a Report
+        cbc_profile (Optional[str]): The CBC Profile set in the CBC Credentials
+
+    Raises:
+        typer.Exit
+        SystemExit: If the layout of the feed is not compacted
+    """
+    cbcsdk = CBCloudAPI(profile=cbc_profile)
+    install_rate_limiter(cbcsdk)
+    install_retry_policy(cbcsdk)
+    try:
+        summary = importer_compact_feed(
+            cbcsdk,
+            feed_id,
+            dry_run=bool(dry_run),
+            workers=workers or 1,
+            max_report_bytes=max_report_bytes or MAX_REPORT_BYTES,
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        raise SystemExit(1)
+
+    typer.echo(f"Reports before: {summary['reports_before']} ({summary['fill_before']:.1%} full on average)")
+    typer.echo(f"Reports after: {summary['reports_after']} ({summary['fill_after']:.1%} full on average)")
+    typer.echo(
+        f"Reports {'to update' if dry_run else 'updated'}: {summary['updated']}, "
+        f"{'to delete' if dry_run else 'deleted'}: {summary['deleted']}, "
+        f"duplicated IOCs: {summary['duplicates']}"
+    )
+    raise typer.Exit(0)
 
 
 @cli.command(help="Shows the version of the connector")
@@ -16,9 +16,10 @@ import copy
 import os
 import sys
 import types
-from typing import List, Union, no_type_check
+from typing import List, Optional, Union, no_type_check
 
 import yaml
+from cbc_sdk.errors import CredentialError, MoreThanOneResultError, ObjectNotFoundError
 from cbc_sdk.rest_api import CBCloudAPI
 from typer import BadParameter
 
@@ -208,6 +209,40 @@ def get_cb() -> CBCloudAPI:
     return CBCloudAPI(profile=CBC_PROFILE_NAME, integration_name=("STIX/TAXII " + __version__))
 
 
+def check_feed(cb: CBCloudAPI, feed_id: str, site_name: str) -> None:
+    """Warn when the feed of a site is not found, the feeds are cached so a feed shared by sites is fetched once.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed_id (str): The id of the feed
+        site_name (str): The name of the site
+    """
+    try:
+        get_feed(cb, feed_id=feed_id)
+    except ObjectNotFoundError:
+        print(f"The feed {feed_id} of {site_name} was not found, please update the config")
+
+
+def find_feed_id(cb: CBCloudAPI, feed_name: str, site_name: str) -> Optional[str]:
+    """Return the id of the feed of a site by its name, the names are looked up in the index of the feeds.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed_name (str): The name of the feed
+        site_name (str): The name of the site
+
+    Returns:
+        str: The id of the feed, None if there is no such feed or more than one
+    """
+    try:
+        return get_feed(cb, feed_name=feed_name).id
+    except ObjectNotFoundError:
+        print(f"The feed {feed_name} of {site_name} was not found, please update the config")
+    except MoreThanOneResultError:
+        print(f"More than one feed is named {feed_name}, please update the config of {site_name}")
+    return None
+
+
 def migrate() -> None:
     """Migrate the old config.yml to the new format."""
     filepath = input(f"Please enter the path to the old config or enter for default ({OLD_CONFIG_FILE}): ")
@@ -222,6 +257,11 @@ def migrate() -> None:
         old_config = yaml.safe_load(file)
 
     data = {"cbc_auth_profile": CBC_PROFILE_NAME, "servers": []}
+    try:
+        cb = get_cb()
+    except CredentialError:
+        print("The CBC credentials are not found, the feeds are not checked")
+        cb = None
 
     # convert data to the new format
     for site_name, values in old_config["sites"].items():
@@ -248,7 +288,12 @@ def migrate() -> None:
         # add severity, feed_id, replace
         item_data["cbc_feed_options"] = {}
         # add feed name instead of feed_id
-        item_data["cbc_feed_options"]["feed_id"] = values["feed_id"]
+        feed_id = values.get("feed_id")
+        if cb and feed_id:
+            check_feed(cb, feed_id, site_name)
+        elif cb and values.get(CBC_FEED_FIELD):
+            feed_id = find_feed_id(cb, values[CBC_FEED_FIELD], site_name)
+        item_data["cbc_feed_options"]["feed_id"] = feed_id
         item_data["cbc_feed_options"]["severity"] = 5
         item_data["cbc_feed_options"]["replace"] = True
 
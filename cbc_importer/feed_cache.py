@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Cache of the feeds and their reports for the length of a run"""
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left, insort
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr import Feed, Report
+
+logger = logging.getLogger(__name__)
+
+# The directory of the persisted feed indexes, one file per org
+DEFAULT_INDEX_DIR = "~/.cbc-threat-intel/feeds"
+
+# The caches of the CBCloudAPI instances, a run uses a single instance so the cache lives as long as the run
+_CACHES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+class FeedIndex:
+    """The feeds of an org sorted by their name, so the exact and the prefix lookups are binary searches.
+
+    The index holds the raw data of the feeds (their `feedinfo`), it can be saved to a file and loaded
+    by a later run as long as it is not older than a time to live.
+    """
+
+    def __init__(self, feeds: Iterable[dict], created: Optional[float] = None) -> None:
+        """
+        Args:
+            feeds (Iterable[dict]): The raw data of the feeds
+            created (float): (optional) When the feeds were listed, defaults to now
+        """
+        self.created = time.time() if created is None else created
+        self._entries: List[Tuple[str, int]] = []
+        self._feeds: List[dict] = []
+        for info in feeds:
+            self.add(info)
+
+    def __len__(self) -> int:
+        """Return the number of the feeds"""
+        return len(self._feeds)
+
+    def add(self, info: dict) -> None:
+        """Add a feed.
+
+        Args:
+            info (dict): The raw data of the feed
+        """
+        insort(self._entries, (info["name"], len(self._feeds)))
+        self._feeds.append(dict(info))
+
+    def exact(self, name: str) -> List[dict]:
+        """Return the feeds with a name.
+
+        Args:
+            name (str): The name of the feeds
+
+        Returns:
+            List[dict]: The raw data of the feeds
+        """
+        return [info for info in self.prefix(name) if info["name"] == name]
+
+    def prefix(self, prefix: str) -> List[dict]:
+        """Return the feeds whose name starts with a prefix, sorted by their name.
+
+        Args:
+            prefix (str): The prefix of the names
+
+        Returns:
+            List[dict]: The raw data of the feeds
+        """
+        found = []
+        for position in range(bisect_left(self._entries, (prefix, -1)), len(self._entries)):
+            name, number = self._entries[position]
+            if not name.startswith(prefix):
+                break
+            found.append(dict(self._feeds[number]))
+        return found
+
+    @classmethod
+    def load(cls, path: Path, ttl: float) -> Optional["FeedIndex"]:
+        """Load an index saved by an earlier run.
+
+        Args:
+            path (Path): The file of the index
+            ttl (float): The time to live of the index in seconds
+
+        Returns:
+            FeedIndex: The index, None if there is no file, it is unreadable or it is older than the time to live
+        """
+        try:
+            data = json.loads(Path(path).read_text())
+            if time.time() - data["created"] > ttl:
+                return None
+            return cls(data["feeds"], created=data["created"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, path: Path) -> None:
+        """Replace the file of the index atomically.
+
+        Args:
+            path (Path): The file of the index
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Path(f"{path}.tmp").write_text(json.dumps({"created": self.created, "feeds": self._feeds}))
+        os.replace(f"{path}.tmp", path)
+
+
+class FeedCache:
+    """The feeds and the reports fetched through a CBCloudAPI instance, so every one is fetched from CBC once.
+
+    The reports of a feed are invalidated by every write to them through the importer, so the next read
+    fetches them again. The writes made outside of the importer must call `invalidate` themselves.
+    The names of the feeds are indexed the first time a feed is looked up by its name.
+    """
+
+    def __init__(self) -> None:
+        """Start with an empty cache"""
+        self._feeds: Dict[str, Feed] = {}
+        self._reports: Dict[str, List[Report]] = {}
+        self._index: Optional[FeedIndex] = None
+        self._lock = threading.Lock()
+        self.index_path: Optional[Path] = None
+        self.index_ttl = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get_feed(self, cb: CBCloudAPI, feed_id: str) -> Feed:
+        """Return a feed, it is fetched from CBC the first time only.
+
+        Args:
+            cb (CBCloudAPI): A reference to the CBCloudAPI object.
+            feed_id (str): The id of the feed
+
+        Returns:
+            Feed: The feed
+
+        Raises:
+            ObjectNotFoundError: If there is no such feed, the missing feeds are not cached
+        """
+        with self._lock:
+            feed = self._feeds.get(feed_id)
+            self._count(feed is not None)
+        if feed is None:
+            feed = cb.select(Feed, feed_id)
+            with self._lock:
+                self._feeds[feed_id] = feed
+        return feed
+
+    def get_reports(self, feed: Feed) -> List[Report]:
+        """Return the reports of a feed, they are fetched from CBC the first time or after they are invalidated.
+
+        Args:
+            feed (Feed): The feed
+
+        Returns:
+            List[Report]: The reports, the list is a copy which can be changed by the caller
+        """
+        with self._lock:
+            reports = self._reports.get(feed.id)
+            self._count(reports is not None)
+        if reports is None:
+            reports = feed.reports
+            with self._lock:
+                self._reports[feed.id] = reports
+        return list(reports)
+
+    def get_index(self, cb: CBCloudAPI) -> FeedIndex:
+        """Return the index of the feed names, the feeds are listed the first time only.
+
+        If the index is persisted, an index saved by an earlier run within the time to live is used instead
+        of listing the feeds.
+
+        Args:
+            cb (CBCloudAPI): A reference to the CBCloudAPI object.
+
+        Returns:
+            FeedIndex: The index
+        """
+        with self._lock:
+            index = self._index
+            self._count(index is not None)
+            if index is None and self.index_path is not None:
+                index = self._index = FeedIndex.load(self.index_path, self.index_ttl)
+        if index is None:
+            index = FeedIndex(feed._info for feed in cb.select(Feed))
+            logger.info(f"Indexed {len(index)} feeds")
+            with self._lock:
+                self._index = index
+                self._save_index()
+        return index
+
+    def add_feed(self, feed: Feed) -> None:
+        """Add a new feed to the index of the feed names, if the index is built.
+
+        Args:
+            feed (Feed): The feed
+        """
+        with self._lock:
+            if self._index is not None:
+                self._index.add(feed._info)
+                self._save_index()
+
+    def invalidate(self, feed_id: Optional[str] = None) -> None:
+        """Drop a feed and its reports from the cache, so they are fetched again.
+
+        Args:
+            feed_id (str): (optional) The id of the feed, all of the feeds are dropped by default
+        """
+        with self._lock:
+            if feed_id is None:
+                self._feeds.clear()
+                self._reports.clear()
+                self._index = None
+                if self.index_path is not None:
+                    self.index_path.unlink(missing_ok=True)
+            else:
+                self._feeds.pop(feed_id, None)
+                self._reports.pop(feed_id, None)
+
+    def metrics(self) -> dict:
+        """Return the hits and the misses of the cache.
+
+        Returns:
+            dict: The metrics
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _save_index(self) -> None:
+        """Save the index of the feed names if it is persisted, the lock is held by the caller."""
+        if self.index_path is not None and self._index is not None:
+            self._index.save(self.index_path)
+
+    def _count(self, hit: bool) -> None:
+        """Count a hit or a miss, the lock is held by the caller.
+
+        Args:
+            hit (bool): Whether the item was in the cache
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+def get_feed_cache(cb: CBCloudAPI) -> FeedCache:
+    """Return the feed cache of a CBCloudAPI instance, it is created on the first call.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+
+    Returns:
+        FeedCache: The cache
+    """
+    cache = _CACHES.get(cb)
+    if cache is None:
+        cache = _CACHES.setdefault(cb, FeedCache())
+    return cache
+
+
+def persist_feed_index(cb: CBCloudAPI, ttl: float, index_dir: str = DEFAULT_INDEX_DIR) -> None:
+    """Keep the index of the feed names of a CBCloudAPI instance in a file, so the later runs reuse it.
+
+    The index is kept in `<index_dir>/<org key>.json`. A feed created or deleted by someone else is seen once
+    the index is older than the time to live, the feeds created through the connector are added right away.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        ttl (float): The time to live of the index in seconds
+        index_dir (str): (optional) The directory of the indexes
+    """
+    cache = get_feed_cache(cb)
+    cache.index_path = Path(index_dir).expanduser() / f"{cb.credentials.org_key}.json"
+    cache.index_ttl = ttl
+
+
+def get_reports(cb: CBCloudAPI, feed: Feed) -> List[Report]:
+    """Return the reports of a feed through the feed cache of a CBCloudAPI instance.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed
+
+    Returns:
+        List[Report]: The reports
+    """
+    return get_feed_cache(cb).get_reports(feed)
+
+
+def invalidate_feed(cb: CBCloudAPI, feed_id: Optional[str] = None) -> None:
+    """Drop a feed and its reports from the feed cache of a CBCloudAPI instance, after they are written.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed_id (str): (optional) The id of the feed, all of the feeds are dropped by default
+    """
+    get_feed_cache(cb).invalidate(feed_id)
@@ -12,135 +12,2077 @@
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
 
 """Helpers to import everything in CBC"""
+import hashlib
+import json
 import logging
+import math
+import threading
+import time
 import uuid
-from typing import List
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
 
 from cbc_sdk import CBCloudAPI
-from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2, Feed, Report
-from cbc_sdk.errors import ObjectNotFoundError
+from cbc_sdk.enterprise_edr.threat_intelligence import Feed, Report
+from cbc_sdk.errors import ObjectNotFoundError, ServerError
 
+from cbc_importer.feed_cache import get_reports, invalidate_feed
+from cbc_importer.journal import ImportJournal
+from cbc_importer.merging import merge_equality_iocs
+from cbc_importer.ranking import count_by_source, get_rank, rank_top_iocs
+from cbc_importer.records import IOCRecord, ioc_key, ioc_raw_data
+from cbc_importer.retries import get_retry_policy
 from cbc_importer.utils import get_feed
 
 logger = logging.getLogger(__name__)
 
-# Constants for the batch sizes of reports and IOCs
+# Constants for the batch sizes of reports and IOCs, they are hard caps on top of the size limits
 IOCS_BATCH_SIZE = 1000
 REPORTS_BATCH_SIZE = 10000
 
+# Constants for the serialized size of the reports and of the requests uploading them
+MAX_REPORT_BYTES = 1024 * 1024
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+# The size of the chunks in which the body replacing the reports of a feed is sent
+REQUEST_CHUNK_BYTES = 64 * 1024
+# The room left in a report for everything but its iocs (title, description, tags...)
+REPORT_OVERHEAD_BYTES = 1024
+
+# Constants for the layouts of the iocs in the reports
+LAYOUT_SEQUENTIAL = "sequential"
+LAYOUT_HASHED = "hashed"
+LAYOUT_DAILY = "daily"
+LAYOUT_WEEKLY = "weekly"
+LAYOUT_TIERED = "tiered"
+LAYOUTS = [LAYOUT_SEQUENTIAL, LAYOUT_HASHED, LAYOUT_DAILY, LAYOUT_WEEKLY, LAYOUT_TIERED]
+# The layouts grouping the iocs by the time they are first seen, with the length of their buckets in days
+TIME_LAYOUTS = {LAYOUT_DAILY: 1, LAYOUT_WEEKLY: 7}
+
+# The reports that are at least this full are not re-packed by the compaction
+COMPACT_FULL_FILL = 0.95
+
+# The tag of the delta reports of the tiered layout, the reports without it are the base reports
+DELTA_REPORT_TAG = "delta"
+# The delta reports of the tiered layout that are kept before they are merged into the base reports
+MAX_DELTA_REPORTS = 10
+
+# The average fill of the reports in the hashed layout, it leaves room for the uneven size of the buckets
+HASH_LOAD_FACTOR = 0.75
+
+# The uploader of the reports of a feed, or the recorder of the plan standing in for it when only planning
+Uploader = Union["ReportUploader", "PlannedUploader"]
+
+
+class PackingLimits(NamedTuple):
+    """The limits of the serialized size of the reports and of the requests uploading them"""
+
+    report_bytes: int = MAX_REPORT_BYTES
+    request_bytes: int = MAX_REQUEST_BYTES
+
+    @property
+    def iocs_bytes(self) -> int:
+        """The serialized size left for the iocs of a report"""
+        return max(self.report_bytes - REPORT_OVERHEAD_BYTES, 1)
+
 
 def process_iocs(
     cb: CBCloudAPI,
-    iocs: List[IOC_V2],
+    iocs: Iterable[IOCRecord],
     severity: int,
     feed_id: str,
     replace: bool,
+    sync: bool = False,
+    layout: str = LAYOUT_SEQUENTIAL,
+    workers: int = 1,
+    journal: Optional[ImportJournal] = None,
+    max_report_bytes: int = MAX_REPORT_BYTES,
+    max_request_bytes: int = MAX_REQUEST_BYTES,
+    overflow_shards: bool = False,
+    overflow: Optional[List[dict]] = None,
+    retention_days: Optional[int] = None,
+    max_delta_reports: Optional[int] = None,
+    merge_values: Optional[int] = None,
+    plan: Optional["UploadPlan"] = None,
 ) -> None:
     """Create reports and add the iocs to the reports.
 
-    If replace is True - replace all of the reports in a feed.
-    If replace is False, then append - so fill any reports with iocs < IOCS_BATCH_SIZE and create additional reports,
-        if needed.
-    If the iocs are >= IOCS_BATCH_SIZE, then create multiple reports.
-    If the number of reports are >= REPORTS_BATCH_SIZE, then raise an error, this will not create addtional feeds.
+    `iocs` can be any iterable, including a generator that yields the iocs as they are parsed. The iocs are
+    ranked from the most to the least valuable (see `cbc_importer.ranking`) before they are placed, only as
+    many of them as a full feed can hold are kept while they are read (see `rank_top_iocs`), and replacing
+    keeps the raw data of all of the reports until the request is sent.
+
+    If replace is True - replace all of the reports in a feed. The report bodies are built locally
+        and all of them are uploaded to CBC with a single request.
+    If replace is False, then append - so fill the free room of the existing reports and create additional reports,
+        if needed. The layout is planned with first-fit decreasing (see `plan_append`) and its fill ratio is logged
+        before anything is uploaded. Only the reports that are filled up or created are uploaded, one by one,
+        the rest of the reports in the feed are left untouched.
+    If sync is True (it takes precedence over replace), then make the feed hold exactly the iocs - compare them
+        with the iocs in the existing reports and upload or delete only the reports that differ.
+    The reports are packed by the serialized size of their iocs, up to `max_report_bytes` per report
+    and IOCS_BATCH_SIZE iocs as a hard cap, so a report of long urls or queries holds fewer iocs than
+    a report of ip addresses.
+    If the number of reports are >= REPORTS_BATCH_SIZE, then stop. The iocs that do not fit are the lowest
+    ranked ones, they are dropped and counted by source, unless `overflow_shards` is set, then they go in
+    sibling feeds (see `cbc_importer.sharding`).
+
+    With the `sequential` layout the iocs are put in the reports in the order of their rank. With the `hashed`
+    layout every ioc goes to a report picked by the hash of its content and the reports have deterministic ids,
+    so a new or removed ioc changes only the report of its bucket. This needs all of the iocs at once.
+    With the `daily` and `weekly` layouts the iocs are grouped by the day or the week they are first seen
+    (see `_time_bucketed_feed_reports`), so the old iocs expire by deleting whole reports once they are
+    older than `retention_days`. This needs all of the iocs at once too.
+    With the `tiered` layout appending puts the new iocs in new delta reports and leaves the rest of the feed
+    untouched, so they are in CBC after a single small upload. Once there are more than `max_delta_reports`
+    delta reports, they are merged into the base reports by `compact_feed`. Replacing and synchronizing
+    lay out the feed sequentially, which makes all of its reports base reports.
+
+    With `merge_values` the equality iocs of the same field are merged into iocs of up to that many values
+    after they are ranked (see `cbc_importer.merging`), so the same values take far fewer iocs and reports. When
+    appending, the values that are already in the feed are left out of the merged iocs.
 
     Args:
         cb (CBCloudAPI): A reference to the CBCloudAPI object.
-        iocs (list): list of iocs
+        iocs (Iterable[IOCRecord]): iterable of iocs
         severity (int): The severity of the Report
         feed_id (str): id of an existing feed to be used for the import
         replace (bool): Replacing the existing Reports in the Feed, if false it will append the results
+        sync (bool): (optional, default False) Synchronizing the Reports in the Feed with the iocs
+        layout (str): (optional, default `sequential`) How the iocs are laid out in the reports, one of `LAYOUTS`
+        workers (int): (optional, default 1) How many reports are uploaded or deleted at the same time
+        journal (ImportJournal): (optional) The journal of the import, the uploaded reports are recorded in it.
+            When appending, the iocs of the reports it recorded before the import was interrupted are skipped.
+        max_report_bytes (int): (optional) The largest serialized size of a report
+        max_request_bytes (int): (optional) The largest serialized size of the request replacing the reports,
+            the reports that do not fit are uploaded one by one after it
+        overflow_shards (bool): (optional) Put the iocs that do not fit into the feed into sibling feeds,
+            it needs the `sequential` layout
+        overflow (List[dict]): (optional) Collects the raw data of the iocs that do not fit into the feed,
+            instead of dropping them
+        retention_days (int): (optional) How many days the iocs are kept in the feed, it needs
+            the `daily` or the `weekly` layout
+        max_delta_reports (int): (optional, default MAX_DELTA_REPORTS) How many delta reports are kept
+            before they are merged into the base reports, it needs the `tiered` layout
+        merge_values (int): (optional) Merge the equality iocs of the same field into iocs of up to this many
+            values, it needs the `sequential` or the `tiered` layout and no overflow shards
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them, nothing is
+            written to CBC. The overflow shards are not created then, the iocs that overflow are counted
+            as dropped and a due merge of the delta reports is only marked in the plan
 
     Raises:
         ObjectNotFoundError: Whenever a Feed as not Found
         SystemExit: If there is an Error within the function
+        ReportUploadError: If some of the reports failed to upload or delete
+        ValueError: If the layout is not one of `LAYOUTS` or the options do not suit it
+        ImportInterrupted: If the import is stopped through the journal
     """
-    reports = []
-    counter_r = 1
-    start, end = 0, 0
+    _check_layout(layout, overflow_shards, retention_days, max_delta_reports, merge_values)
+    if overflow_shards and plan is None:
+        # imported here, the sharding depends on this module
+        from cbc_importer.sharding import process_sharded_iocs
+
+        return process_sharded_iocs(
+            cb,
+            iocs,
+            severity,
+            feed_id,
+            replace,
+            sync=sync,
+            workers=workers,
+            journal=journal,
+            max_report_bytes=max_report_bytes,
+            max_request_bytes=max_request_bytes,
+        )
+
+    try:
+        feed = get_feed(cb, feed_id=feed_id)
+    except ObjectNotFoundError:
+        logger.error(f"Feed was not found with id: {feed_id}")
+        raise SystemExit(1)
+
+    limits = PackingLimits(max_report_bytes, max_request_bytes)
+    if layout == LAYOUT_HASHED:
+        with _uploader(cb, feed, workers, journal, plan) as uploader:
+            _hashed_feed_reports(cb, feed, iter(iocs), severity, replace, sync, uploader, limits)
+        return
+    if layout in TIME_LAYOUTS:
+        with _uploader(cb, feed, workers, journal, plan) as uploader:
+            _time_bucketed_feed_reports(
+                cb, feed, iter(iocs), severity, replace, sync, uploader, limits, layout, retention_days
+            )
+        return
+
+    # the most valuable iocs are placed first, so the ones that do not fit into a full feed are the least valuable.
+    # A full feed holds at most this many iocs, the rest are left out while the iocs are read.
+    max_iocs = REPORTS_BATCH_SIZE * IOCS_BATCH_SIZE * (merge_values or 1)
+    ranked_out: List[dict] = []
+    ranked_out_sources: Counter = Counter()
+
+    def leave_out(iocs: List[IOCRecord]) -> None:
+        ranked_out_sources.update(get_rank(ioc).source or "unknown" for ioc in iocs)
+        if overflow is not None:
+            ranked_out.extend(map(ioc_raw_data, iocs))
+
+    ranked = rank_top_iocs(iocs, max_iocs, leave_out)
+    if merge_values:
+        known_values = None if sync or replace else equality_values(get_reports(cb, feed))
+        merged = merge_equality_iocs(ranked, merge_values, limits.iocs_bytes, known_values)
+        logger.info(f"Merged {len(ranked)} iocs into {len(merged)} iocs of up to {merge_values} values")
+        ranked = merged
+    sources = count_by_source(ranked)
+    if len(sources) > 1:
+        by_source = ", ".join(f"{source}: {count}" for source, count in sources.items())
+        logger.info(f"Importing {len(ranked)} iocs into feed {feed.name} ({by_source})")
+    left_out: List[dict] = []
+    delta_count = 0
+    with _uploader(cb, feed, workers, journal, plan) as uploader:
+        if sync:
+            _sync_feed_reports(cb, feed, iter(ranked), severity, uploader, limits, left_out)
+        elif replace:
+            _replace_feed_reports(cb, feed, iter(ranked), severity, uploader, limits, left_out)
+        elif layout == LAYOUT_TIERED:
+            delta_count = _append_delta_reports(cb, feed, iter(ranked), severity, uploader, limits, left_out)
+        else:
+            _append_feed_reports(cb, feed, iter(ranked), severity, uploader, limits, left_out)
+
+    left_out_count = len(left_out) + sum(ranked_out_sources.values())
+    if left_out_count:
+        left_out_sources = ranked_out_sources + Counter(count_by_source(ranked, left_out))
+        by_source = ", ".join(f"{source}: {count}" for source, count in left_out_sources.items())
+        if isinstance(uploader, PlannedUploader):
+            uploader.dropped_iocs += left_out_count
+        if overflow is None:
+            logger.warning(f"The feed {feed.name} is full, {left_out_count} iocs are dropped ({by_source})")
+        else:
+            logger.info(f"The feed {feed.name} is full, {left_out_count} iocs overflow ({by_source})")
+            overflow.extend(left_out)
+            overflow.extend(ranked_out)
+
+    # the merge starts after all of the delta reports are uploaded, it reads them back from the feed
+    if delta_count > (max_delta_reports or MAX_DELTA_REPORTS):
+        if isinstance(uploader, PlannedUploader):
+            uploader.compaction = True
+        else:
+            logger.info(f"The feed {feed.name} has {delta_count} delta reports, merging them into the base reports")
+            compact_feed(cb, feed.id, workers=workers, max_report_bytes=max_report_bytes)
+
+
+def _check_layout(
+    layout: str,
+    overflow_shards: bool,
+    retention_days: Optional[int],
+    max_delta_reports: Optional[int],
+    merge_values: Optional[int] = None,
+) -> None:
+    """Check the layout of an import and the options that need a specific layout.
+
+    Args:
+        layout (str): The layout of the reports
+        overflow_shards (bool): Whether the iocs overflow into sibling feeds
+        retention_days (int): How many days the iocs are kept in the feed
+        max_delta_reports (int): How many delta reports are kept
+        merge_values (int): (optional) The largest number of values of a merged ioc
 
+    Raises:
+        ValueError: If the layout is not one of `LAYOUTS` or the options do not suit it
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Layout must be one of: {', '.join(LAYOUTS)}")
+    if retention_days is not None and layout not in TIME_LAYOUTS:
+        raise ValueError("The retention needs the `daily` or the `weekly` layout")
+    if max_delta_reports is not None and layout != LAYOUT_TIERED:
+        raise ValueError("The delta reports need the `tiered` layout")
+    if overflow_shards and layout != LAYOUT_SEQUENTIAL:
+        raise ValueError("The overflow shards need the `sequential` layout")
+    if merge_values and (layout not in (LAYOUT_SEQUENTIAL, LAYOUT_TIERED) or overflow_shards):
+        raise ValueError("Merging the iocs needs the `sequential` or the `tiered` layout and no overflow shards")
+
+
+def _uploader(
+    cb: CBCloudAPI, feed: Feed, workers: int, journal: Optional[ImportJournal], plan: Optional["UploadPlan"]
+) -> Uploader:
+    """Return the uploader of the reports of a feed, or the recorder of the plan when only planning.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed the reports belong to
+        workers (int): The number of reports uploaded at the same time
+        journal (ImportJournal): The journal in which the finished requests are recorded
+        plan (UploadPlan): The plan of the run, if only planning
+
+    Returns:
+        Uploader: The uploader, a `PlannedUploader` when planning
+    """
+    if plan is not None:
+        return plan.uploader(cb, feed)
+    return ReportUploader(cb, feed, workers, journal)
+
+
+def compact_feed(
+    cb: CBCloudAPI,
+    feed_id: str,
+    dry_run: bool = False,
+    workers: int = 1,
+    max_report_bytes: int = MAX_REPORT_BYTES,
+) -> dict:
+    """Re-pack the iocs of a feed into the fewest reports, removing the duplicated iocs.
+
+    The delta reports of the `tiered` layout are merged into the base reports.
+
+    The feed is read once and the changes are planned with `plan_compaction`. The updated reports are
+    uploaded first and the emptied reports are deleted only after all of the uploads finished,
+    so no ioc is missing from the feed in the meantime.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed_id (str): The id of the feed
+        dry_run (bool): (optional) Only plan the changes, nothing is sent to CBC
+        workers (int): (optional) The number of reports uploaded or deleted at the same time
+        max_report_bytes (int): (optional) The largest serialized size of a report
+
+    Returns:
+        dict: The summary of the changes
+
+    Raises:
+        SystemExit: If the feed is not found
+        ValueError: If the reports of the feed are laid out in buckets, see `plan_compaction`
+        ReportUploadError: If some of the reports failed to upload or delete
+    """
     try:
         feed = get_feed(cb, feed_id=feed_id)
     except ObjectNotFoundError:
         logger.error(f"Feed was not found with id: {feed_id}")
         raise SystemExit(1)
 
-    iocs_list = []
-
-    # if we need to append the iocs instead of replacing, then first fill any existing reports
-    # with iocs count less than IOCS_BATCH_SIZE
-    if not replace:
-        for item in feed.reports:
-            if item.iocs_total_count < IOCS_BATCH_SIZE:
-                start, end = end, end + (IOCS_BATCH_SIZE - item.iocs_total_count)
-                iocs_list = iocs[start:end]
-
-                if not iocs_list:
-                    # if there are no more new iocs to be added, but still iocs_total_count < IOCS_BATCH_SIZE
-                    # then just add the report
-                    reports.append(item)
-                else:
-                    # create a new report with the existing iocs + new ones up to IOCS_BATCH_SIZE
-                    report = create_report(cb, feed, counter_r, severity, iocs_list, item.iocs_v2)
-                    reports.append(report)
-            else:
-                # if the report is full (IOCS_BATCH_SIZE iocs) just added it as is.
-                reports.append(item)
-            counter_r += 1
-
-    # make the reports with batches of iocs per IOCS_BATCH_SIZE or less
+    reports, deleted_ids, summary = plan_compaction(cb, feed, get_reports(cb, feed), PackingLimits(max_report_bytes))
+    if not dry_run:
+        with ReportUploader(cb, feed, workers) as uploader:
+            for report in reports:
+                uploader.put(report)
+        with ReportUploader(cb, feed, workers) as uploader:
+            for report_id in deleted_ids:
+                uploader.delete(report_id)
+
+    logger.info(
+        f"{'Planned compaction' if dry_run else 'Compacted'} feed {feed.name}: {summary['updated']} reports updated, "
+        f"{summary['deleted']} deleted, {summary['unchanged']} unchanged, "
+        f"{summary['duplicates']} duplicated iocs removed."
+    )
+    return summary
+
+
+def _append_delta_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    uploader: Uploader,
+    limits: PackingLimits,
+    overflow: Optional[List[dict]] = None,
+) -> int:
+    """Append the iocs that are not in the feed yet into new delta reports, the existing reports are untouched.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed to append to
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports
+        overflow (List[dict]): (optional) Collects the iocs that do not fit into the feed
+
+    Returns:
+        int: The number of the delta reports in the feed, including the new ones
+    """
+    existing_reports = get_reports(cb, feed)
+    seen = {ioc_key(ioc_data) for item in existing_reports for ioc_data in item._info.get("iocs_v2") or []}
+    delta_count = sum(1 for item in existing_reports if is_delta_report(item._info))
+
+    def new_iocs() -> Iterator[dict]:
+        for ioc in iocs:
+            raw = ioc_raw_data(ioc)
+            key = ioc_key(raw)
+            if key not in seen:
+                seen.add(key)
+                yield raw
+
+    reports_count = len(existing_reports)
+    added_count = iocs_count = 0
+    stream = IOCStream(new_iocs())
+    for iocs_list in stream.batches(IOCS_BATCH_SIZE, limits.iocs_bytes):
+        if reports_count >= REPORTS_BATCH_SIZE:
+            _feed_full(iocs_list + list(stream.rest()), overflow)
+            break
+        report = build_report(cb, feed, severity, iocs_list)
+        report["tags"] = [DELTA_REPORT_TAG]
+        uploader.put(report)
+        reports_count += 1
+        added_count += 1
+        iocs_count += len(iocs_list)
+
+    logger.info(
+        f"Appended {iocs_count} iocs to feed {feed.name} in {added_count} delta reports, "
+        f"the feed has {delta_count + added_count} delta reports."
+    )
+    return delta_count + added_count
+
+
+def is_delta_report(report: dict) -> bool:
+    """Return whether a report is a delta report of the tiered layout.
+
+    Args:
+        report (dict): The body of the report
+
+    Returns:
+        bool: True if the report is tagged as a delta report
+    """
+    return DELTA_REPORT_TAG in (report.get("tags") or [])
+
+
+def _replace_feed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    uploader: Uploader,
+    limits: PackingLimits,
+    overflow: Optional[List[dict]] = None,
+) -> None:
+    """Replace all of the reports in the feed with new reports holding the iocs.
+
+    The reports are uploaded with a single request, unless they are larger than `limits.request_bytes`.
+    Then the first request replaces the reports with the ones that fit and the rest are uploaded one by one.
+    The reports hold the iocs as they come until they are sent (see `PendingReport`), so the raw data
+    of the iocs is built for one report at a time.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed whose reports are replaced
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports and the requests
+        overflow (List[dict]): (optional) Collects the iocs that do not fit into the feed
+    """
+    reports: List[PendingReport] = []
+    stream = IOCStream(iocs)
+
+    # make the reports with batches of iocs up to the size limit and IOCS_BATCH_SIZE
     # do not allow the report count to be > REPORTS_BATCH_SIZE
-    # if replace = False and if there are still iocs to be added, create new reports for them
-    # if replace = True, then add all the iocs as new reports and replace the existing reports with the new ones
-    while counter_r <= REPORTS_BATCH_SIZE:
-        if counter_r != 1 and not iocs_list:
-            # we have exhausted all the iocs, so break the loop
+    # the reports keep the iocs as they come, their bodies are built one at a time while they are sent
+    for iocs_list in stream.batches(IOCS_BATCH_SIZE, limits.iocs_bytes):
+        if len(reports) >= REPORTS_BATCH_SIZE:
+            _feed_full([ioc_raw_data(ioc) for ioc in iocs_list + list(stream.rest())], overflow)
+            break
+        reports.append(PendingReport(build_report(cb, feed, severity, []), iocs_list, stream.taken_bytes))
+
+    # split off the reports that do not fit into the request
+    request_bytes = 0
+    for count, report in enumerate(reports):
+        request_bytes += report.size()
+        if count and request_bytes > limits.request_bytes:
+            reports, remaining_reports = reports[:count], reports[count:]
             break
+    else:
+        remaining_reports = []
+
+    # add reports to the current feed, this is the only request that uploads them
+    uploader.replace(reports)
+    if remaining_reports:
+        logger.info(f"The reports do not fit into one request, uploading {len(remaining_reports)} of them one by one")
+        for report in remaining_reports:
+            uploader.put(report.body())
+
+
+def _append_feed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    uploader: Uploader,
+    limits: PackingLimits,
+    overflow: Optional[List[dict]] = None,
+) -> None:
+    """Append the iocs to the feed, uploading only the reports that change.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed to which the iocs are appended
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports
+        overflow (List[dict]): (optional) Collects the iocs that do not fit into the feed
+    """
+    existing_reports = get_reports(cb, feed)
+    raw_iocs: Iterable[dict] = map(ioc_raw_data, iocs)
+
+    journal = uploader.journal
+    if journal and journal.uploaded_reports:
+        # the iocs of the reports uploaded before the import was interrupted are already in the feed
+        appended = {
+            ioc_key(ioc_data)
+            for item in existing_reports
+            if item.id in journal.uploaded_reports
+            for ioc_data in item._info.get("iocs_v2") or []
+        }
+        raw_iocs = (raw for raw in raw_iocs if ioc_key(raw) not in appended)
+
+    reports, summary = plan_append(cb, feed, existing_reports, raw_iocs, severity, limits, overflow)
+    logger.info(
+        f"Appending {summary['iocs_added']} iocs to feed {feed.name}: {summary['updated']} reports updated, "
+        f"{summary['added']} added, {summary['unchanged']} unchanged, the reports are "
+        f"{summary['fill_before']:.1%} full before and {summary['fill_after']:.1%} full after."
+    )
+    for report in reports:
+        uploader.put(report)
+
+
+def _sync_feed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    uploader: Uploader,
+    limits: PackingLimits,
+    overflow: Optional[List[dict]] = None,
+) -> None:
+    """Synchronize the reports of the feed with the iocs, uploading or deleting only the reports that differ.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed which is synchronized
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports
+        overflow (List[dict]): (optional) Collects the iocs that do not fit into the feed
+    """
+    desired_iocs: Dict[tuple, dict] = {}
+    for raw in map(ioc_raw_data, iocs):
+        desired_iocs.setdefault(ioc_key(raw), raw)
+
+    reports, deleted_ids, summary = plan_sync(cb, feed, get_reports(cb, feed), desired_iocs, severity, limits, overflow)
+    _apply_changes(feed, reports, deleted_ids, summary, uploader)
+
+
+def _hashed_feed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    replace: bool,
+    sync: bool,
+    uploader: Uploader,
+    limits: PackingLimits,
+) -> None:
+    """Lay out the iocs in the reports of the feed by the hash of their content.
+
+    When replacing, all of the reports are uploaded with a single request. Otherwise, the built reports are
+    compared with the existing ones by id and only the reports whose bucket changed are uploaded or deleted.
+    When appending, the iocs already in the feed are kept. The number of buckets of the existing reports
+    is kept while the count of the iocs stays within a factor of two of it, see `hash_buckets_count`.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed whose reports are built
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        replace (bool): Replacing the existing Reports in the Feed, if false it will append the results
+        sync (bool): Synchronizing the Reports in the Feed with the iocs
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports
+    """
+    desired_iocs: Dict[tuple, dict] = {}
+    existing_reports = [] if replace and not sync else get_reports(cb, feed)
+    if not replace and not sync:
+        for item in existing_reports:
+            for ioc_data in item._info.get("iocs_v2") or []:
+                desired_iocs.setdefault(ioc_key(ioc_data), ioc_data)
+    for raw in map(ioc_raw_data, iocs):
+        desired_iocs.setdefault(ioc_key(raw), raw)
+
+    # keep the number of buckets of the existing reports while it fits, otherwise every report gets a new id
+    current_count = existing_buckets_count(feed, existing_reports)
+    buckets_count = hash_buckets_count(len(desired_iocs), current_count)
+    reports = build_hashed_reports(cb, feed, severity, desired_iocs.values(), buckets_count, limits)
+    if replace and not sync:
+        uploader.replace([PendingReport.from_body(report) for report in reports])
+        return
+
+    reports, deleted_ids, summary = plan_hashed_sync(existing_reports, reports)
+    _apply_changes(feed, reports, deleted_ids, summary, uploader)
+
+
+def _time_bucketed_feed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    iocs: Iterator[IOCRecord],
+    severity: int,
+    replace: bool,
+    sync: bool,
+    uploader: Uploader,
+    limits: PackingLimits,
+    layout: str,
+    retention_days: Optional[int] = None,
+) -> None:
+    """Lay out the iocs in the reports of the feed by the day or the week they are first seen.
+
+    A new ioc is first seen when its indicator was created, or now if the parser does not know it
+    (see `cbc_importer.ranking.IOCRank`). The iocs already in the reports of the layout keep their bucket,
+    the iocs of the other reports (for example, the feed was laid out sequentially before) are put in
+    the bucket of the timestamp of their report. The buckets older than `retention_days` are left out,
+    so their reports are deleted and nothing else is rewritten.
+
+    When replacing, all of the reports are uploaded with a single request. Otherwise, the built reports are
+    compared with the existing ones by id and only the reports whose bucket changed are uploaded or deleted.
+    When appending, the iocs already in the feed are kept until they expire.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed whose reports are built
+        iocs (Iterator[IOCRecord]): iterator of iocs
+        severity (int): The severity of the Report
+        replace (bool): Replacing the existing Reports in the Feed, if false it will append the results
+        sync (bool): Synchronizing the Reports in the Feed with the iocs
+        uploader (ReportUploader): The uploader of the reports
+        limits (PackingLimits): The size limits of the reports
+        layout (str): The layout, one of `TIME_LAYOUTS`
+        retention_days (int): (optional) How many days the iocs are kept, by default they are kept forever
+    """
+    now = time.time()
+    existing_reports = [] if replace and not sync else get_reports(cb, feed)
+    first_seen = existing_time_buckets(existing_reports, layout)
+
+    desired_iocs: Dict[tuple, Tuple[int, dict]] = {}
+    if not replace and not sync:
+        for key, (bucket, ioc_data) in first_seen.items():
+            desired_iocs[key] = bucket, ioc_data
+    for ioc in iocs:
+        raw = ioc_raw_data(ioc)
+        key = ioc_key(raw)
+        if key not in desired_iocs:
+            known = first_seen.get(key)
+            bucket = known[0] if known else time_bucket(get_rank(ioc).first_seen or now, layout)
+            desired_iocs[key] = bucket, raw
+
+    buckets: Dict[int, List[dict]] = {}
+    expired = 0
+    oldest = time_bucket(now - retention_days * 86400, layout) if retention_days else None
+    for bucket, ioc_data in desired_iocs.values():
+        if oldest is not None and bucket < oldest:
+            expired += 1
+            continue
+        buckets.setdefault(bucket, []).append(ioc_data)
+    if expired:
+        logger.info(f"{expired} iocs are older than the retention of {retention_days} days, they are left out.")
+
+    reports = build_time_bucketed_reports(cb, feed, severity, buckets, layout, limits)
+    if replace and not sync:
+        uploader.replace([PendingReport.from_body(report) for report in reports])
+        return
+
+    reports, deleted_ids, summary = plan_hashed_sync(existing_reports, reports)
+    _apply_changes(feed, reports, deleted_ids, summary, uploader)
+
+
+def _apply_changes(feed: Feed, reports: List[dict], deleted_ids: List[str], summary: dict, uploader: Uploader) -> None:
+    """Upload and delete the planned reports of the feed and log a summary of the changes.
+
+    Args:
+        feed (Feed): The feed which is changed
+        reports (List[dict]): The bodies of the reports to upload
+        deleted_ids (List[str]): The ids of the reports to delete
+        summary (dict): The summary of the changes
+        uploader (ReportUploader): The uploader of the reports
+    """
+    for report in reports:
+        uploader.put(report)
+    for report_id in deleted_ids:
+        uploader.delete(report_id)
+
+    logger.info(
+        f"Synchronized feed {feed.name}: {summary['added']} reports added, {summary['updated']} updated, "
+        f"{summary['deleted']} deleted, {summary['unchanged']} unchanged "
+        f"({summary['iocs_added']} iocs added, {summary['iocs_removed']} iocs removed)."
+    )
+
+
+def plan_sync(
+    cb: CBCloudAPI,
+    feed: Feed,
+    existing_reports: List[Report],
+    desired_iocs: Dict[tuple, dict],
+    severity: int,
+    limits: PackingLimits = PackingLimits(),
+    overflow: Optional[List[dict]] = None,
+    max_reports: Optional[int] = None,
+) -> Tuple[List[dict], List[str], dict]:
+    """Compare the existing reports of a feed with the desired iocs and plan the changes, nothing is sent to CBC.
+
+    The existing reports keep the iocs that are still desired, the iocs that are no longer desired
+    are removed from them and the reports left empty are deleted. The new iocs fill the reports
+    that are updated anyway and then go in new reports.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed which is synchronized
+        existing_reports (List[Report]): The current reports of the feed
+        desired_iocs (Dict[tuple, dict]): The raw data of the iocs that the feed should hold, by `ioc_key`.
+            The iocs that are already in the feed are removed from it.
+        severity (int): The severity of the Report
+        limits (PackingLimits): (optional) The size limits of the reports
+        overflow (List[dict]): (optional) Collects the new iocs that do not fit into the feed
+        max_reports (int): (optional, default REPORTS_BATCH_SIZE) The largest number of reports, no new report
+            is added beyond it
+
+    Returns:
+        Tuple[List[dict], List[str], dict]: The bodies of the reports to upload, the ids of the reports
+            to delete and a summary of the changes.
+    """
+    max_reports = REPORTS_BATCH_SIZE if max_reports is None else max_reports
+    summary = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0, "iocs_added": 0, "iocs_removed": 0, "dropped": 0}
+    changed_reports, deleted_ids = [], []
+
+    for item in existing_reports:
+        existing_iocs = item._info.get("iocs_v2") or []
+        kept_iocs = [ioc for ioc in existing_iocs if desired_iocs.pop(ioc_key(ioc), None) is not None]
+        summary["iocs_removed"] += len(existing_iocs) - len(kept_iocs)
+
+        if not kept_iocs:
+            deleted_ids.append(item.id)
+        elif len(kept_iocs) < len(existing_iocs) or item._info.get("severity") != severity:
+            changed_reports.append(build_report(cb, feed, severity, kept_iocs, like=item))
+        else:
+            summary["unchanged"] += 1
+
+    # the new iocs first fill the free slots of the reports that are uploaded anyway
+    new_iocs = IOCStream(desired_iocs.values())
+    for report in changed_reports:
+        added_iocs = new_iocs.take(
+            IOCS_BATCH_SIZE - len(report["iocs_v2"]), limits.iocs_bytes - iocs_size(report["iocs_v2"]), fresh=False
+        )
+        report["iocs_v2"] += added_iocs
+        summary["iocs_added"] += len(added_iocs)
+    summary["updated"] = len(changed_reports)
+    summary["deleted"] = len(deleted_ids)
+
+    reports_count = summary["updated"] + summary["unchanged"]
+    new_reports = []
+    for iocs_list in new_iocs.batches(IOCS_BATCH_SIZE, limits.iocs_bytes):
+        if reports_count >= max_reports:
+            dropped = iocs_list + list(new_iocs.rest())
+            summary["dropped"] = len(dropped)
+            _feed_full(dropped, overflow)
+            break
+        new_reports.append(build_report(cb, feed, severity, iocs_list))
+        summary["iocs_added"] += len(iocs_list)
+        reports_count += 1
+    summary["added"] = len(new_reports)
+
+    return changed_reports + new_reports, deleted_ids, summary
+
+
+def plan_append(
+    cb: CBCloudAPI,
+    feed: Feed,
+    existing_reports: List[Report],
+    iocs: Iterable[dict],
+    severity: int,
+    limits: PackingLimits = PackingLimits(),
+    overflow: Optional[List[dict]] = None,
+    max_reports: Optional[int] = None,
+) -> Tuple[List[dict], dict]:
+    """Plan where the appended iocs go in the reports of a feed, nothing is sent to CBC.
+
+    The iocs are placed with first-fit decreasing: from the largest to the smallest, every ioc goes in the
+    first report with room left for it, by count and by size. The existing reports come first, the ones with
+    the most room left at the front, since an updated report is sent again with all of its iocs. New reports
+    are opened only when an ioc does not fit anywhere, so the free room of the feed is used before the
+    report count grows.
+
+    The fill of a report is the larger of its share of IOCS_BATCH_SIZE and its share of the size limit.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed to which the iocs are appended
+        existing_reports (List[Report]): The current reports of the feed
+        iocs (Iterable[dict]): The raw data of the iocs to append
+        severity (int): The severity of the Report
+        limits (PackingLimits): (optional) The size limits of the reports
+        overflow (List[dict]): (optional) Collects the iocs that do not fit into the feed
+        max_reports (int): (optional, default REPORTS_BATCH_SIZE) The largest number of reports, no new report
+            is opened beyond it
+
+    Returns:
+        Tuple[List[dict], dict]: The bodies of the reports to upload and a summary of the plan.
+    """
+    summary: Dict[str, Any] = {"added": 0, "updated": 0, "unchanged": 0, "iocs_added": 0}
+    bins = [_ReportBin(limits, item) for item in existing_reports]
+    summary["fill_before"] = _average_fill(bins)
+    bins, dropped = _first_fit_decreasing(bins, iocs, limits, max_reports)
+    summary["dropped"] = len(dropped)
+    if dropped:
+        _feed_full(dropped, overflow)
+    summary["iocs_added"] = sum(len(bin_.added_iocs) for bin_ in bins)
+
+    reports = []
+    for bin_ in bins:
+        if not bin_.added_iocs:
+            summary["unchanged"] += 1
+            continue
+        report = build_report(cb, feed, severity, bin_.existing_iocs + bin_.added_iocs, like=bin_.report)
+        if bin_.report is not None:
+            summary["updated"] += 1
+        else:
+            summary["added"] += 1
+        reports.append(report)
+
+    summary["fill_after"] = _average_fill(bins)
+    return reports, summary
+
+
+def plan_compaction(
+    cb: CBCloudAPI, feed: Feed, existing_reports: List[Report], limits: PackingLimits = PackingLimits()
+) -> Tuple[List[dict], List[str], dict]:
+    """Plan re-packing the iocs of a feed into the fewest reports, nothing is sent to CBC.
+
+    The duplicated iocs are removed, the first copy in the order of the reports is kept. The reports that
+    are at least COMPACT_FULL_FILL full are left as they are, unless they held duplicates. Of the rest, the
+    emptiest reports are emptied into the free room of the fuller ones for as long as their iocs fit, then
+    the emptied reports are deleted. The delta reports of the `tiered` layout are always emptied, the iocs
+    that do not fit into the base reports go in new base reports. Only the reports with the same severity
+    and the same tags, apart from the tag of the delta reports, are merged, so for example the partitions
+    (see `cbc_importer.partitions`) stay apart. The rebuilt reports keep their title and their tags.
+    The `hashed`, `daily` and `weekly` layouts are not compacted, their reports have deterministic ids
+    and merging them would move the iocs out of their buckets.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed which is compacted
+        existing_reports (List[Report]): The current reports of the feed
+        limits (PackingLimits): (optional) The size limits of the reports
+
+    Returns:
+        Tuple[List[dict], List[str], dict]: The bodies of the reports to upload, the ids of the reports
+            to delete and a summary of the changes.
+
+    Raises:
+        ValueError: If the reports are laid out in buckets
+    """
+    layout = bucketed_layout(feed, existing_reports)
+    if layout is not None:
+        raise ValueError(f"The reports of feed {feed.name} have the `{layout}` layout, which is not compacted")
+    summary: Dict[str, Any] = {"updated": 0, "deleted": 0, "unchanged": 0, "duplicates": 0}
+    seen = set()
+    # the delta reports and the base reports of every severity and tags
+    groups: Dict[Tuple[int, Tuple[str, ...]], Tuple[List[_ReportBin], List[_ReportBin]]] = {}
+    deleted_ids = []
+    for item in existing_reports:
+        existing_iocs = item._info.get("iocs_v2") or []
+        kept_iocs = []
+        for ioc in existing_iocs:
+            key = ioc_key(ioc)
+            if key not in seen:
+                seen.add(key)
+                kept_iocs.append(ioc)
+        summary["duplicates"] += len(existing_iocs) - len(kept_iocs)
+        if not kept_iocs:
+            deleted_ids.append(item.id)
+            continue
+        bin_ = _ReportBin(limits, item, kept_iocs)
+        bin_.changed = len(kept_iocs) < len(existing_iocs)
+        tags = tuple(sorted(set(item._info.get("tags") or []) - {DELTA_REPORT_TAG}))
+        deltas, bases = groups.setdefault((item._info.get("severity"), tags), ([], []))
+        (deltas if is_delta_report(item._info) else bases).append(bin_)
+
+    bins_before = [_ReportBin(limits, item) for item in existing_reports]
+    summary["reports_before"] = len(bins_before)
+    summary["fill_before"] = _average_fill(bins_before)
+
+    kept_bins = []
+    existing_by_id: Dict[str, Report] = {item.id: item for item in existing_reports}
+    for group, (deltas, bases) in groups.items():
+        partial = sorted((bin_ for bin_ in bases if bin_.fill < COMPACT_FULL_FILL), key=lambda bin_: bin_.fill)
+        kept_bins += [(group, bin_) for bin_ in bases if bin_.fill >= COMPACT_FULL_FILL]
+
+        # the donors are the delta reports and the emptiest reports whose iocs fit into the free room of the rest
+        donors = 0
+        moved_count = sum(IOCS_BATCH_SIZE - bin_.free_count for bin_ in deltas)
+        moved_bytes = sum(bin_.capacity_bytes - bin_.free_bytes for bin_ in deltas)
+        free_count = sum(bin_.free_count for bin_ in partial)
+        free_bytes = sum(bin_.free_bytes for bin_ in partial)
+        for bin_ in partial:
+            used_count, used_bytes = IOCS_BATCH_SIZE - bin_.free_count, bin_.capacity_bytes - bin_.free_bytes
+            free_count -= bin_.free_count
+            free_bytes -= bin_.free_bytes
+            if moved_count + used_count > free_count or moved_bytes + used_bytes > free_bytes:
+                break
+            moved_count += used_count
+            moved_bytes += used_bytes
+            donors += 1
+
+        donor_bins = deltas + partial[:donors]
+        moved_iocs = [ioc for bin_ in donor_bins for ioc in bin_.existing_iocs]
+        receivers, _ = _first_fit_decreasing(partial[donors:], moved_iocs, limits)
+        # the iocs that did not fit after all go in new reports, they reuse the ids of the donors
+        donor_ids = [bin_.report_id for bin_ in donor_bins if bin_.report_id is not None]
+        for bin_ in receivers:
+            if bin_.report_id is None:
+                bin_.report_id = donor_ids.pop() if donor_ids else str(uuid.uuid4())
+        deleted_ids += donor_ids
+        kept_bins += [(group, bin_) for bin_ in receivers]
+
+    reports = []
+    for (severity, tags), bin_ in kept_bins:
+        if not bin_.added_iocs and not bin_.changed:
+            summary["unchanged"] += 1
+            continue
+        # a new report takes the place of the donor whose id it reuses
+        like = existing_by_id.get(bin_.report_id) if bin_.report_id is not None else None
+        report = build_report(cb, feed, severity, bin_.existing_iocs + bin_.added_iocs, like=like)
+        report["id"] = bin_.report_id
+        # the delta reports become base reports
+        report["tags"] = list(tags)
+        reports.append(report)
+    summary["updated"] = len(reports)
+    summary["deleted"] = len(deleted_ids)
+    summary["reports_after"] = len(kept_bins)
+    summary["fill_after"] = _average_fill([bin_ for _, bin_ in kept_bins])
+    return reports, deleted_ids, summary
+
+
+def _first_fit_decreasing(
+    bins: List["_ReportBin"], iocs: Iterable[dict], limits: PackingLimits, max_reports: Optional[int] = None
+) -> Tuple[List["_ReportBin"], List[dict]]:
+    """Place the iocs into the reports with first-fit decreasing, new reports are opened when needed.
+
+    The reports with the most room left come first, the new ones come after all of the existing ones.
+    If the feed cannot hold all of the iocs, they are placed again with first-fit in the order they come
+    instead, so the iocs that are left out are the last ones - the lowest ranked (see `cbc_importer.ranking`).
+
+    Args:
+        bins (List[_ReportBin]): The reports with the iocs they hold
+        iocs (Iterable[dict]): The raw data of the iocs to place, from the most to the least valuable
+        limits (PackingLimits): The size limits of the reports
+        max_reports (int): (optional, default REPORTS_BATCH_SIZE) The largest number of reports
+
+    Returns:
+        Tuple[List[_ReportBin], List[dict]]: All of the reports, including the new ones, and
+            the iocs that do not fit because the feed is full
+    """
+    max_reports = REPORTS_BATCH_SIZE if max_reports is None else max_reports
+    items = [(ioc_size(ioc), ioc) for ioc in iocs]
+    placed, dropped = _first_fit(bins, sorted(items, key=lambda item: item[0], reverse=True), limits, max_reports)
+    if dropped:
+        for bin_ in bins:
+            bin_.reset()
+        placed, dropped = _first_fit(bins, items, limits, max_reports)
+    return placed, dropped
+
+
+def _first_fit(
+    bins: List["_ReportBin"], items: List[Tuple[int, dict]], limits: PackingLimits, max_reports: int
+) -> Tuple[List["_ReportBin"], List[dict]]:
+    """Place the iocs into the first report with room for them, in the order they come.
+
+    Args:
+        bins (List[_ReportBin]): The reports with the iocs they hold
+        items (List[Tuple[int, dict]]): The serialized sizes and the raw data of the iocs to place
+        limits (PackingLimits): The size limits of the reports
+        max_reports (int): The largest number of reports
+
+    Returns:
+        Tuple[List[_ReportBin], List[dict]]: All of the reports, including the new ones, and
+            the iocs that do not fit because the feed is full
+    """
+    smallest = min((size for size, _ in items), default=0)
+    bins = list(bins)
+    dropped = []
+    open_bins = sorted(
+        (bin_ for bin_ in bins if bin_.fits(smallest)),
+        key=lambda bin_: (bin_.free_count, bin_.free_bytes),
+        reverse=True,
+    )
+
+    for size, ioc in items:
+        target = next((bin_ for bin_ in open_bins if bin_.fits(size)), None)
+        if target is None:
+            if len(bins) >= max_reports:
+                dropped.append(ioc)
+                continue
+            if size > limits.iocs_bytes:
+                logger.warning(f"IOC {ioc.get('id')} is larger than the size limit of a report ({size} bytes)")
+            target = _ReportBin(limits, capacity_bytes=max(limits.iocs_bytes, size))
+            bins.append(target)
+            open_bins.append(target)
+        target.add(ioc, size)
+        if not target.fits(smallest):
+            open_bins.remove(target)
+    return bins, dropped
+
+
+def _average_fill(bins: List["_ReportBin"]) -> float:
+    """Return the average fill of the reports.
+
+    Args:
+        bins (List[_ReportBin]): The reports
+
+    Returns:
+        float: The average fill, 0 if there are no reports
+    """
+    return sum(bin_.fill for bin_ in bins) / len(bins) if bins else 0.0
+
+
+class _ReportBin:
+    """The room left in a report while the iocs are planned"""
+
+    __slots__ = (
+        "report",
+        "report_id",
+        "existing_iocs",
+        "added_iocs",
+        "changed",
+        "free_count",
+        "free_bytes",
+        "capacity_bytes",
+    )
+
+    def __init__(
+        self,
+        limits: PackingLimits,
+        report: Optional[Report] = None,
+        iocs: Optional[List[dict]] = None,
+        capacity_bytes: int = 0,
+    ) -> None:
+        """
+        Args:
+            limits (PackingLimits): The size limits of the reports
+            report (Report): (optional) The existing report, None for a new report
+            iocs (List[dict]): (optional) The iocs it holds, by default the iocs of the existing report
+            capacity_bytes (int): (optional) The size limit of the iocs of a new report
+        """
+        self.report = report
+        self.report_id = report.id if report is not None else None
+        if iocs is None:
+            iocs = (report._info.get("iocs_v2") or []) if report is not None else []
+        self.existing_iocs = iocs
+        self.added_iocs: List[dict] = []
+        self.changed = False
+        self.capacity_bytes = capacity_bytes or limits.iocs_bytes
+        self.free_count = IOCS_BATCH_SIZE - len(self.existing_iocs)
+        self.free_bytes = self.capacity_bytes - iocs_size(self.existing_iocs)
+
+    @property
+    def fill(self) -> float:
+        """How full the report is, by count or by size, whichever is fuller"""
+        return max(1 - self.free_count / IOCS_BATCH_SIZE, 1 - self.free_bytes / self.capacity_bytes)
+
+    def fits(self, size: int) -> bool:
+        """Return whether an ioc of the size fits into the report.
+
+        Args:
+            size (int): The serialized size of the ioc
+
+        Returns:
+            bool: True if there is room left for it
+        """
+        return self.free_count > 0 and self.free_bytes >= size
+
+    def add(self, ioc: dict, size: int) -> None:
+        """Put an ioc into the report.
+
+        Args:
+            ioc (dict): The raw data of the ioc
+            size (int): The serialized size of the ioc
+        """
+        self.added_iocs.append(ioc)
+        self.free_count -= 1
+        self.free_bytes -= size
+
+    def reset(self) -> None:
+        """Take the added iocs out of the report again."""
+        self.free_count += len(self.added_iocs)
+        self.free_bytes += iocs_size(self.added_iocs)
+        self.added_iocs = []
+
+
+def plan_hashed_sync(existing_reports: List[Report], reports: List[dict]) -> Tuple[List[dict], List[str], dict]:
+    """Compare the existing reports of a feed with the reports of the hashed layout, nothing is sent to CBC.
+
+    The reports are matched by their deterministic ids, a report is uploaded only if it is new or
+    its iocs or severity differ from the existing report with the same id. The iocs are compared by
+    their content only, the parsers may give the same ioc a new id on every run.
+
+    Args:
+        existing_reports (List[Report]): The current reports of the feed
+        reports (List[dict]): The bodies of the reports built by `build_hashed_reports`
+
+    Returns:
+        Tuple[List[dict], List[str], dict]: The bodies of the reports to upload, the ids of the reports
+            to delete and a summary of the changes.
+    """
+    summary = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0, "iocs_added": 0, "iocs_removed": 0}
+    existing_by_id = {item.id: item._info for item in existing_reports}
+    changed_reports = []
+
+    for report in reports:
+        existing = existing_by_id.pop(report["id"], None)
+        new_keys = {ioc_key(ioc) for ioc in report["iocs_v2"]}
+        old_keys = {ioc_key(ioc) for ioc in existing.get("iocs_v2") or []} if existing else set()
+        summary["iocs_added"] += len(new_keys - old_keys)
+        summary["iocs_removed"] += len(old_keys - new_keys)
+
+        if existing is None:
+            summary["added"] += 1
+        elif new_keys != old_keys or existing.get("severity") != report["severity"]:
+            summary["updated"] += 1
+        else:
+            summary["unchanged"] += 1
+            continue
+        changed_reports.append(report)
+
+    # whatever is left is not part of the layout anymore
+    for existing in existing_by_id.values():
+        summary["iocs_removed"] += len(existing.get("iocs_v2") or [])
+    summary["deleted"] = len(existing_by_id)
+    return changed_reports, list(existing_by_id), summary
+
+
+def build_hashed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    severity: int,
+    iocs: Iterable[dict],
+    buckets_count: Optional[int] = None,
+    limits: PackingLimits = PackingLimits(),
+) -> List[dict]:
+    """Build the bodies of the reports, assigning every ioc to a report by the hash of its content.
+
+    The number of buckets only grows in powers of two, so it stays the same while the count of the iocs
+    changes within the same range and the same iocs always end up in the same reports with the same ids.
+    If the iocs of a bucket do not fit into a report, the rest go in additional reports of that bucket.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): Feed to which the reports will be added
+        severity (int): The severity of the Reports
+        iocs (Iterable[dict]): The raw data of the iocs, without duplicates
+        buckets_count (int): (optional) The number of buckets, by default it is picked by the count of the iocs
+        limits (PackingLimits): (optional) The size limits of the reports
 
-        # if case we need to replace all the reports or just create more reports as part of the append procedure
-        start, end = end, end + IOCS_BATCH_SIZE
-        iocs_list = iocs[start:end]
+    Returns:
+        List[dict]: The bodies of the reports, ordered by bucket
+    """
+    iocs = list(iocs)
+    buckets_count = buckets_count or hash_buckets_count(len(iocs))
+    buckets: Dict[int, List[dict]] = {}
+    for ioc_data in iocs:
+        buckets.setdefault(ioc_bucket(ioc_key(ioc_data), buckets_count), []).append(ioc_data)
 
-        if iocs_list:
-            report = create_report(cb, feed, counter_r, severity, iocs_list)
+    reports: List[dict] = []
+    for bucket in sorted(buckets):
+        # the order inside of the bucket is fixed too, so the same iocs make the same report
+        bucket_iocs = sorted(buckets[bucket], key=ioc_key)
+        for part, iocs_list in enumerate(IOCStream(bucket_iocs).batches(IOCS_BATCH_SIZE, limits.iocs_bytes)):
+            if len(reports) >= REPORTS_BATCH_SIZE:
+                logger.info("The feed is full, it is possible that not all iocs are imported.")
+                return reports
+            report = build_report(cb, feed, severity, iocs_list)
+            report["id"] = hashed_report_id(feed, buckets_count, bucket, part)
             reports.append(report)
-            counter_r += 1
-    else:
+    return reports
+
+
+def hash_buckets_count(iocs_count: int, current_count: Optional[int] = None) -> int:
+    """Return the number of buckets of the hashed layout for a number of iocs.
+
+    It is the smallest power of two that keeps the reports filled to HASH_LOAD_FACTOR on average,
+    but not more than what fits into REPORTS_BATCH_SIZE.
+
+    Changing the number of buckets gives every report a new id, so the whole feed is uploaded again.
+    To avoid that when the count of the iocs hovers around a threshold, the current number of buckets
+    is kept while it is within a factor of two of the ideal one. A fuller bucket just spills into
+    additional reports of that bucket.
+
+    Args:
+        iocs_count (int): The number of the iocs
+        current_count (int): (optional) The number of buckets of the existing reports
+
+    Returns:
+        int: The number of buckets
+    """
+    needed = max(1, math.ceil(iocs_count / (IOCS_BATCH_SIZE * HASH_LOAD_FACTOR)))
+    max_buckets = 2 ** int(math.log2(REPORTS_BATCH_SIZE))
+    ideal = min(2 ** math.ceil(math.log2(needed)), max_buckets)
+    if current_count and ideal // 2 <= current_count <= ideal * 2:
+        return current_count
+    return ideal
+
+
+def existing_buckets_count(feed: Feed, existing_reports: List[Report]) -> Optional[int]:
+    """Return the number of buckets of the existing reports of the hashed layout.
+
+    The number is not stored in CBC, it is found by matching the ids of the reports
+    with the deterministic ids of the first report of every bucket.
+
+    Args:
+        feed (Feed): The feed of the reports
+        existing_reports (List[Report]): The current reports of the feed
+
+    Returns:
+        int | None: The number of buckets or None if the reports are not laid out by hash
+    """
+    existing_ids = {item.id for item in existing_reports}
+    if not existing_ids:
+        return None
+    max_buckets = 2 ** int(math.log2(REPORTS_BATCH_SIZE))
+    buckets_count = 1
+    while buckets_count <= max_buckets:
+        if any(hashed_report_id(feed, buckets_count, bucket) in existing_ids for bucket in range(buckets_count)):
+            return buckets_count
+        buckets_count *= 2
+    return None
+
+
+def bucketed_layout(feed: Feed, existing_reports: List[Report]) -> Optional[str]:
+    """Return the layout of the existing reports of a feed if they are laid out in buckets.
+
+    Like the number of buckets (see `existing_buckets_count`), the layout is not stored in CBC, it is found
+    by matching the ids of the reports with the deterministic ids of the layouts.
+
+    Args:
+        feed (Feed): The feed of the reports
+        existing_reports (List[Report]): The current reports of the feed
+
+    Returns:
+        str | None: `hashed`, `daily` or `weekly`, None if the reports are not laid out in buckets
+    """
+    if existing_buckets_count(feed, existing_reports) is not None:
+        return LAYOUT_HASHED
+    for item in existing_reports:
+        for layout in TIME_LAYOUTS:
+            # every bucket has a first report, its timestamp is the start of the bucket
+            bucket = time_bucket(item._info.get("timestamp") or 0, layout)
+            if item.id == time_bucket_report_id(feed, layout, bucket):
+                return layout
+    return None
+
+
+def ioc_bucket(key: tuple, buckets_count: int) -> int:
+    """Return the bucket of an ioc, the hash is stable between the runs.
+
+    Args:
+        key (tuple): The key of the ioc, as returned by `ioc_key`
+        buckets_count (int): The number of buckets
+
+    Returns:
+        int: The bucket of the ioc
+    """
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % buckets_count
+
+
+def hashed_report_id(feed: Feed, buckets_count: int, bucket: int, part: int = 0) -> str:
+    """Return the deterministic id of a report of the hashed layout.
+
+    Args:
+        feed (Feed): Feed to which the report belongs
+        buckets_count (int): The number of buckets
+        bucket (int): The bucket of the report
+        part (int): The number of the report within the bucket
+
+    Returns:
+        str: The id of the report
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{feed.id}/{buckets_count}/{bucket}/{part}"))
+
+
+def build_time_bucketed_reports(
+    cb: CBCloudAPI,
+    feed: Feed,
+    severity: int,
+    buckets: Dict[int, List[dict]],
+    layout: str,
+    limits: PackingLimits = PackingLimits(),
+) -> List[dict]:
+    """Build the bodies of the reports of the time buckets, nothing is sent to CBC.
+
+    Every bucket gets its reports with deterministic ids and the start of the bucket as their timestamp.
+    If the iocs of a bucket do not fit into a report, the rest go in additional reports of that bucket.
+    The newest buckets come first, so the oldest ones are dropped when the feed is full.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): Feed to which the reports will be added
+        severity (int): The severity of the Reports
+        buckets (Dict[int, List[dict]]): The raw data of the iocs by the start of their bucket, without duplicates
+        layout (str): The layout, one of `TIME_LAYOUTS`
+        limits (PackingLimits): (optional) The size limits of the reports
+
+    Returns:
+        List[dict]: The bodies of the reports, from the newest bucket to the oldest
+    """
+    reports: List[dict] = []
+    for bucket in sorted(buckets, reverse=True):
+        # the order inside of the bucket is fixed, so the same iocs make the same report
+        bucket_iocs = sorted(buckets[bucket], key=ioc_key)
+        for part, iocs_list in enumerate(IOCStream(bucket_iocs).batches(IOCS_BATCH_SIZE, limits.iocs_bytes)):
+            if len(reports) >= REPORTS_BATCH_SIZE:
+                logger.info("The feed is full, the iocs of the oldest buckets are not imported.")
+                return reports
+            report = build_report(cb, feed, severity, iocs_list)
+            report["id"] = time_bucket_report_id(feed, layout, bucket, part)
+            report["timestamp"] = bucket
+            report["title"] = f"Report {feed.name} ({layout} {time.strftime('%Y-%m-%d', time.gmtime(bucket))})"
+            reports.append(report)
+    return reports
+
+
+def existing_time_buckets(existing_reports: List[Report], layout: str) -> Dict[tuple, Tuple[int, dict]]:
+    """Return the bucket of every ioc in the existing reports of a feed.
+
+    The reports of the layout have the start of their bucket as their timestamp, the iocs of the other
+    reports are put in the bucket of the timestamp of their report.
+
+    Args:
+        existing_reports (List[Report]): The current reports of the feed
+        layout (str): The layout, one of `TIME_LAYOUTS`
+
+    Returns:
+        Dict[tuple, Tuple[int, dict]]: The start of the bucket and the raw data of the iocs by their key
+    """
+    first_seen: Dict[tuple, Tuple[int, dict]] = {}
+    for item in existing_reports:
+        bucket = time_bucket(item._info.get("timestamp") or 0, layout)
+        for ioc_data in item._info.get("iocs_v2") or []:
+            known = first_seen.get(ioc_key(ioc_data))
+            if known is None or bucket < known[0]:
+                first_seen[ioc_key(ioc_data)] = bucket, ioc_data
+    return first_seen
+
+
+def time_bucket(timestamp: float, layout: str) -> int:
+    """Return the start of the time bucket of a timestamp, in UTC.
+
+    Args:
+        timestamp (float): The POSIX timestamp
+        layout (str): The layout, one of `TIME_LAYOUTS`
+
+    Returns:
+        int: The POSIX timestamp of the start of the bucket
+    """
+    days = int(timestamp // 86400)
+    if layout == LAYOUT_WEEKLY:
+        # the weeks start on Monday, the 1st of January 1970 is a Thursday
+        days -= (days + 3) % TIME_LAYOUTS[LAYOUT_WEEKLY]
+    return days * 86400
+
+
+def time_bucket_report_id(feed: Feed, layout: str, bucket: int, part: int = 0) -> str:
+    """Return the deterministic id of a report of a time bucket.
+
+    Args:
+        feed (Feed): Feed to which the report belongs
+        layout (str): The layout, one of `TIME_LAYOUTS`
+        bucket (int): The start of the bucket
+        part (int): The number of the report within the bucket
+
+    Returns:
+        str: The id of the report
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{feed.id}/{layout}/{bucket}/{part}"))
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable into lists of `size` items, the last list may be shorter.
+
+    Only one batch is materialised at a time, so this is safe to use on generators.
+
+    Args:
+        iterable (Iterable): the items to be split
+        size (int): the maximum size of a batch
+
+    Yields:
+        list: the next batch of items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _feed_full(iocs: List[dict], overflow: Optional[List[dict]]) -> None:
+    """Handle the iocs that do not fit into a full feed, they are dropped unless they are collected.
+
+    Args:
+        iocs (List[dict]): The raw data of the iocs that do not fit
+        overflow (List[dict]): The list collecting them, None to drop them
+    """
+    if overflow is None:
         logger.info("The feed is full, it is possible that not all iocs are imported.")
+    else:
+        overflow.extend(iocs)
 
-    # add reports to the current feed
-    feed.replace_reports(reports)
 
+def equality_values(reports: Iterable[Report]) -> Set[Tuple[str, str]]:
+    """Return the fields and the values of the equality iocs of reports.
 
-def create_report(
-    cb: CBCloudAPI, feed: Feed, number_of_report: int, severity: int, new_iocs: List[IOC_V2], existing_iocs: int = None
-) -> Report:
-    """Create reports and add the iocs to the reports.
+    Args:
+        reports (Iterable[Report]): The reports
+
+    Returns:
+        Set[Tuple[str, str]]: The field and the value of every value of the equality iocs
+    """
+    return {
+        (ioc_data.get("field") or "", value)
+        for report in reports
+        for ioc_data in report._info.get("iocs_v2") or []
+        if ioc_data["match_type"] == "equality"
+        for value in ioc_data["values"]
+    }
+
+
+def ioc_size(ioc: Union[dict, IOCRecord]) -> int:
+    """Return the serialized size of an ioc in a report, including its separator.
+
+    Args:
+        ioc (dict | IOCRecord): The raw data of the ioc, or the ioc
+
+    Returns:
+        int: The size in bytes
+    """
+    return len(json.dumps(ioc_raw_data(ioc), separators=(",", ":"))) + 1
+
+
+def iocs_size(iocs: Iterable[dict]) -> int:
+    """Return the serialized size of the iocs of a report.
+
+    Args:
+        iocs (Iterable[dict]): The raw data of the iocs
+
+    Returns:
+        int: The size in bytes
+    """
+    return sum(ioc_size(ioc) for ioc in iocs)
+
+
+def report_size(report: dict) -> int:
+    """Return the serialized size of a report in a request, including its separator.
+
+    Args:
+        report (dict): The body of the report
+
+    Returns:
+        int: The size in bytes
+    """
+    return len(json.dumps(report, separators=(",", ":"))) + 1
+
+
+class IOCStream:
+    """Hands out the iocs in batches that fit into the limits of a report.
+
+    The iocs are read lazily, only the ioc that did not fit into the previous batch is held back.
+    The iocs are handed out as they come, the raw data or the records.
+    """
+
+    def __init__(self, iocs: Iterable[Any]) -> None:
+        """
+        Args:
+            iocs (Iterable[dict | IOCRecord]): The raw data of the iocs, or the iocs
+        """
+        self._iocs = iter(iocs)
+        self._held: Optional[Any] = None
+        self.taken_bytes = 0
+
+    def take(self, max_count: int, max_bytes: int, fresh: bool = True) -> List[Any]:
+        """Take the next iocs that fit into the count and the size.
+
+        Args:
+            max_count (int): The largest number of iocs
+            max_bytes (int): The largest serialized size of the iocs
+            fresh (bool): Whether the iocs go in a new report. A new report takes an ioc that is larger
+                than `max_bytes` on its own, so that it is not stuck, a report that is being filled up does not.
+
+        Returns:
+            List[dict | IOCRecord]: The iocs, empty if there are no more iocs or the first one does not fit.
+                Their serialized size is kept in `taken_bytes`.
+        """
+        batch: List[Any] = []
+        batch_bytes = 0
+        while len(batch) < max_count:
+            ioc = self._held if self._held is not None else next(self._iocs, None)
+            self._held = None
+            if ioc is None:
+                break
+            size = ioc_size(ioc)
+            if batch_bytes + size > max_bytes and (batch or not fresh):
+                self._held = ioc
+                break
+            if size > max_bytes:
+                logger.warning(
+                    f"IOC {ioc_raw_data(ioc).get('id')} is larger than the size limit of a report ({size} bytes)"
+                )
+            batch.append(ioc)
+            batch_bytes += size
+        self.taken_bytes = batch_bytes
+        return batch
+
+    def rest(self) -> Iterator[Any]:
+        """Return the iocs that are not taken yet.
+
+        Yields:
+            dict | IOCRecord: The raw data of an ioc, or the ioc
+        """
+        if self._held is not None:
+            held, self._held = self._held, None
+            yield held
+        yield from self._iocs
+
+    def batches(self, max_count: int, max_bytes: int) -> Iterator[List[Any]]:
+        """Split the rest of the iocs into batches for new reports.
+
+        Args:
+            max_count (int): The largest number of iocs in a batch
+            max_bytes (int): The largest serialized size of the iocs in a batch
+
+        Yields:
+            List[dict | IOCRecord]: The next batch of iocs
+        """
+        while True:
+            batch = self.take(max_count, max_bytes)
+            if not batch:
+                return
+            yield batch
+
+
+def build_report(
+    cb: CBCloudAPI, feed: Feed, severity: int, iocs: Iterable[dict], like: Optional[Report] = None
+) -> dict:
+    """Build the body of a report locally, nothing is sent to CBC.
 
     Args:
         cb (CBCloudAPI): A reference to the CBCloudAPI object.
         feed (Feed): Feed to which the report will be added
-        number_of_report (int): The current report number
         severity (int): The severity of the Report
-        new_iocs (list): List of the new iocs that needs to be added
-        existing_iocs (list): (optional) List of existing iocs
+        iocs (Iterable[dict]): The raw data of the iocs in the report
+        like (Report): (optional) The existing report that is rebuilt, its id, title and tags are kept
 
     Returns:
-        Report: The created report
-
+        dict: The body of the report
     """
     # use the builder so that the data is properly formed
     builder = Report.create(cb, f"Report {feed.name}", feed.summary, severity)
     report_data = builder._report_body
 
     # add the iocs
-    report_data["iocs_v2"] = existing_iocs if existing_iocs else []
-    [report_data["iocs_v2"].append(ioc._info) for ioc in new_iocs]
+    report_data["iocs_v2"] = list(iocs)
 
     # add id for the report, because the builder is not include it
     report_data["id"] = str(uuid.uuid4())
+    if like is not None:
+        report_data["id"] = like.id
+        report_data["title"] = like._info.get("title") or report_data["title"]
+        report_data["tags"] = list(like._info.get("tags") or [])
+    return report_data
+
+
+def replace_reports(cb: CBCloudAPI, feed: Feed, reports: List["PendingReport"]) -> None:
+    """Replace all of the reports in a feed with a single request.
+
+    Unlike `Feed.replace_reports` this works with the raw report bodies, so
+    no `Report` and `IOC_V2` objects are created for the upload. The body of
+    every report is built and serialized while it is sent (see `ReportsPayload`),
+    so the body is never held in memory as a whole. The transient errors are
+    retried with the retry policy of `cb`.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed whose reports are replaced
+        reports (List[PendingReport]): The reports
+
+    Raises:
+        InvalidObjectError: If any of the reports is not valid, nothing is sent then
+        CircuitOpenError: If the reports of the feed failed too many times in a row
+    """
+    # validate locally, a single malformed ioc would otherwise fail the whole request on the server
+    for report in reports:
+        Feed._validate_report_rawdata([report.body()])
+    url = Report.urlobject.format(cb.credentials.org_key, feed.id)
+    try:
+        get_retry_policy(cb).call(f"POST {url}", post_payload, cb, url, ReportsPayload(reports))
+    finally:
+        invalidate_feed(cb, feed.id)
+
+
+class PendingReport:
+    """A report whose body is built only when it is sent, until then it holds the iocs as they came.
+
+    The size of the report is known from the size of its iocs, which is counted while they are packed
+    (see `IOCStream`), so it is not serialized to measure it.
+    """
+
+    __slots__ = ("header", "iocs", "iocs_bytes")
+
+    def __init__(self, header: dict, iocs: List[Any], iocs_bytes: int) -> None:
+        """
+        Args:
+            header (dict): The body of the report without its iocs, for example from `build_report`
+            iocs (List[dict | IOCRecord]): The raw data of the iocs, or the iocs
+            iocs_bytes (int): The serialized size of the iocs, see `iocs_size`
+        """
+        self.header = {key: value for key, value in header.items() if key != "iocs_v2"}
+        self.iocs = iocs
+        self.iocs_bytes = iocs_bytes
+
+    @classmethod
+    def from_body(cls, report: dict) -> "PendingReport":
+        """Wrap the body of a report that is already built.
+
+        Args:
+            report (dict): The body of the report
+
+        Returns:
+            PendingReport: The report
+        """
+        iocs = report.get("iocs_v2") or []
+        return cls(report, iocs, iocs_size(iocs))
+
+    @property
+    def id(self) -> str:
+        """The id of the report"""
+        return self.header["id"]
+
+    def body(self) -> dict:
+        """Build the body of the report, the iocs come last.
+
+        Returns:
+            dict: The body, a new dictionary on every call
+        """
+        return dict(self.header, iocs_v2=[ioc_raw_data(ioc) for ioc in self.iocs])
+
+    def size(self) -> int:
+        """Return the serialized size of the report in a request like `report_size`, without building its body.
+
+        Returns:
+            int: The size in bytes
+        """
+        header_bytes = len(json.dumps(self.header, separators=(",", ":"))) - len("}")
+        # the iocs are joined by commas, the last one has no separator
+        iocs_bytes = max(self.iocs_bytes - 1, 0)
+        return header_bytes + len(',"iocs_v2":[') + iocs_bytes + len("]}") + 1
+
+
+class ReportsPayload:
+    """The JSON body replacing the reports of a feed, it is built and serialized as it is sent.
+
+    Only one report and one chunk of the body are in memory at a time, instead of the whole body of up to
+    `MAX_REQUEST_BYTES`. The body can be iterated more than once, so a retried request builds it again.
+    Its length is counted from the sizes of the reports, so it is sent with a `Content-Length` rather than
+    with a chunked transfer encoding.
+    """
+
+    def __init__(self, reports: List[PendingReport], chunk_bytes: int = REQUEST_CHUNK_BYTES) -> None:
+        """
+        Args:
+            reports (List[PendingReport]): The reports
+            chunk_bytes (int): The size of the chunks of the body
+        """
+        self.reports = reports
+        self.chunk_bytes = chunk_bytes
+        self._length: Optional[int] = None
+
+    def __len__(self) -> int:
+        """Return the length of the body in bytes, the bodies of the reports are not built for it"""
+        if self._length is None:
+            self._length = len(b'{"reports":[]}') + sum(report.size() for report in self.reports)
+            self._length -= 1 if self.reports else 0
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Serialize the body.
+
+        Yields:
+            bytes: The next chunk of the body
+        """
+        chunk = bytearray(b'{"reports":[')
+        for count, report in enumerate(self.reports):
+            if count:
+                chunk += b","
+            chunk += json.dumps(report.body(), separators=(",", ":")).encode()
+            if len(chunk) >= self.chunk_bytes:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += b"]}"
+        yield bytes(chunk)
+
+
+def post_payload(cb: CBCloudAPI, url: str, payload: ReportsPayload) -> Any:
+    """Send a streamed JSON body, `cb.post_object` serializes its whole body before sending it.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        url (str): The URL of the request
+        payload (ReportsPayload): The body of the request
+
+    Returns:
+        Any: The response
+
+    Raises:
+        ServerError: If the response holds an error message
+    """
+    result = cb.session.http_request("POST", url, headers={"Content-Type": "application/json"}, data=payload)
+    try:
+        response = result.json()
+    except ValueError:
+        return result
+    if isinstance(response, dict) and "errorMessage" in response:
+        raise ServerError(error_code=result.status_code, message=response["errorMessage"])
+    return result
+
+
+def put_report(cb: CBCloudAPI, feed: Feed, report: dict) -> None:
+    """Create or update a single report of a feed, the other reports of the feed are not sent.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed the report belongs to
+        report (dict): The body of the report
+
+    Raises:
+        InvalidObjectError: If the report is not valid, nothing is sent then
+        CircuitOpenError: If the reports of the feed failed too many times in a row
+    """
+    Feed._validate_report_rawdata([report])
+    url = Report.urlobject.format(cb.credentials.org_key, feed.id)
+    try:
+        get_retry_policy(cb).call(f"PUT {url}", cb.put_object, f"{url}/{report['id']}", report)
+    finally:
+        invalidate_feed(cb, feed.id)
+
+
+def delete_report(cb: CBCloudAPI, feed: Feed, report_id: str) -> None:
+    """Delete a single report of a feed, a report that is already gone is not an error.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The feed the report belongs to
+        report_id (str): The id of the report
+
+    Raises:
+        CircuitOpenError: If the reports of the feed failed too many times in a row
+    """
+    url = Report.urlobject.format(cb.credentials.org_key, feed.id)
+    try:
+        get_retry_policy(cb).call(f"DELETE {url}", cb.delete_object, f"{url}/{report_id}")
+    except ObjectNotFoundError:
+        # a retried request may find the report deleted by the attempt that timed out
+        logger.info(f"Report {report_id} of feed {feed.id} is already deleted")
+    finally:
+        invalidate_feed(cb, feed.id)
+
+
+class ReportUploadError(Exception):
+    """Raised when some of the reports failed to upload or delete, holds all of the errors."""
+
+    def __init__(self, errors: List[Tuple[str, BaseException]]) -> None:
+        """
+        Args:
+            errors (List[Tuple[str, BaseException]]): The ids of the failed reports and their errors
+        """
+        self.errors = errors
+        super().__init__(f"{len(errors)} report(s) failed: " + "; ".join(f"{id_}: {e}" for id_, e in errors))
+
+
+class ReportUploader:
+    """Uploads and deletes single reports of a feed with a bounded pool of workers.
+
+    At most `workers` requests run at the same time and at most twice as many are queued, so the
+    caller is slowed down instead of piling up report bodies in memory. The reports do not depend
+    on each other, so they complete in any order. A failed report does not stop the rest, all
+    of the errors are raised together as `ReportUploadError` when the uploader is closed.
+
+    Example:
+        with ReportUploader(cb, feed, workers=4) as uploader:
+            uploader.put(report)
+    """
+
+    def __init__(self, cb: CBCloudAPI, feed: Feed, workers: int = 1, journal: Optional[ImportJournal] = None) -> None:
+        """
+        Args:
+            cb (CBCloudAPI): A reference to the CBCloudAPI object.
+            feed (Feed): The feed the reports belong to
+            workers (int): The number of reports uploaded at the same time
+            journal (ImportJournal): (optional) The journal in which the finished requests are recorded
+        """
+        self.cb = cb
+        self.feed = feed
+        self.journal = journal
+        self.workers = max(1, workers)
+        self.errors: List[Tuple[str, BaseException]] = []
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-upload")
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ReportUploader":
+        """Start using the uploader"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Wait for all of the requests, raise the errors only if there is no other exception"""
+        self.close(raise_errors=exc_type is None)
+
+    def put(self, report: dict) -> None:
+        """Queue the upload of a report, blocks while the queue is full.
+
+        Args:
+            report (dict): The body of the report
+        """
+        self._submit(report["id"], put_report, self.cb, self.feed, report)
+
+    def delete(self, report_id: str) -> None:
+        """Queue the deletion of a report, blocks while the queue is full.
+
+        Args:
+            report_id (str): The id of the report
+        """
+        self._submit(report_id, delete_report, self.cb, self.feed, report_id)
+
+    def replace(self, reports: List[PendingReport]) -> None:
+        """Replace all of the reports of the feed with a single request, it waits for the request.
+
+        Args:
+            reports (List[PendingReport]): The reports
+        """
+        if self.journal:
+            self.journal.check()
+        replace_reports(self.cb, self.feed, reports)
+        if self.journal:
+            for report in reports:
+                self.journal.record_report(report.id)
+
+    def close(self, raise_errors: bool = True) -> None:
+        """Wait for all of the queued requests to finish.
+
+        Args:
+            raise_errors (bool): Whether to raise the errors of the failed requests
+
+        Raises:
+            ReportUploadError: If some of the reports failed
+        """
+        self._executor.shutdown(wait=True)
+        if self.errors and raise_errors:
+            for report_id, error in self.errors:
+                logger.error(f"Report {report_id} of feed {self.feed.id} failed: {error}")
+            raise ReportUploadError(self.errors)
+
+    def _submit(self, report_id: str, func: Callable, *args) -> None:
+        """Run a request in the pool once there is a free slot.
+
+        Args:
+            report_id (str): The id of the report, used for the errors
+            func (Callable): The request to run
+            *args: The arguments of the request
+
+        Raises:
+            ImportInterrupted: If the import is stopped through the journal
+        """
+        if self.journal:
+            self.journal.check()
+        self._slots.acquire()
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda done: self._done(report_id, done))
+
+    def _done(self, report_id: str, future: Future) -> None:
+        """Free the slot of a finished request and keep its error.
+
+        Args:
+            report_id (str): The id of the report
+            future (Future): The finished request
+        """
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                self.errors.append((report_id, error))
+        elif self.journal:
+            self.journal.record_report(report_id)
+
+
+class PlannedUploader:
+    """Records the requests of an import into a feed instead of sending them, it stands in for `ReportUploader`.
+
+    The reports of the feed are read to tell the created reports from the updated ones, nothing is written.
+    """
+
+    def __init__(self, cb: CBCloudAPI, feed: Feed) -> None:
+        """
+        Args:
+            cb (CBCloudAPI): A reference to the CBCloudAPI object.
+            feed (Feed): The feed the reports belong to
+        """
+        self.feed = feed
+        self.journal = None
+        self.existing = {item._info["id"]: len(item._info.get("iocs_v2") or []) for item in get_reports(cb, feed)}
+        self.reports: Dict[str, dict] = {}
+        self.deleted: List[str] = []
+        self.calls = {"replace": 0, "put": 0, "delete": 0}
+        self.payload_bytes = 0
+        self.replaced = False
+        self.dropped_iocs = 0
+        self.compaction = False
+
+    def __enter__(self) -> "PlannedUploader":
+        """Start recording"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Nothing to wait for"""
+
+    def put(self, report: dict) -> None:
+        """Record the upload of a report.
+
+        Args:
+            report (dict): The body of the report
+        """
+        self.calls["put"] += 1
+        self._record(report["id"], report.get("title"), len(report.get("iocs_v2") or []), report_size(report))
+
+    def delete(self, report_id: str) -> None:
+        """Record the deletion of a report.
+
+        Args:
+            report_id (str): The id of the report
+        """
+        self.calls["delete"] += 1
+        self.deleted.append(report_id)
+
+    def replace(self, reports: List[PendingReport]) -> None:
+        """Record the replacement of all of the reports of the feed.
+
+        Args:
+            reports (List[PendingReport]): The reports
+        """
+        self.calls["replace"] += 1
+        self.replaced = True
+        for report in reports:
+            self._record(report.id, report.header.get("title"), len(report.iocs), report.size())
+
+    def close(self, raise_errors: bool = True) -> None:
+        """Nothing to wait for, the plan has no errors.
+
+        Args:
+            raise_errors (bool): Unused
+        """
+
+    def summary(self) -> dict:
+        """Return the plan of the feed.
+
+        Returns:
+            dict: The reports created, updated, kept and deleted, their iocs, the payload and the requests
+        """
+        written = set(self.reports)
+        if self.replaced:
+            # replacing the reports removes every report that is not uploaded again
+            deleted = [report_id for report_id in self.existing if report_id not in written]
+        else:
+            deleted = [report_id for report_id in self.deleted if report_id not in written]
+        actions = [report["action"] for report in self.reports.values()]
+        kept = [report_id for report_id in self.existing if report_id not in written and report_id not in deleted]
+        return {
+            "feed_id": self.feed.id,
+            "feed_name": self.feed.name,
+            "reports_before": len(self.existing),
+            "reports_after": len(kept) + len(self.reports),
+            "created": actions.count("create"),
+            "updated": actions.count("update"),
+            "kept": len(kept),
+            "deleted": len(deleted),
+            "iocs_uploaded": sum(report["iocs"] for report in self.reports.values()),
+            "iocs_after": sum(self.existing[report_id] for report_id in kept)
+            + sum(report["iocs"] for report in self.reports.values()),
+            "dropped_iocs": self.dropped_iocs,
+            "payload_bytes": self.payload_bytes,
+            "api_calls": dict(self.calls, total=sum(self.calls.values())),
+            "compaction": self.compaction,
+            "reports": list(self.reports.values()),
+            "deleted_reports": deleted,
+        }
+
+    def _record(self, report_id: str, title: Optional[str], iocs: int, size: int) -> None:
+        """Record a report that is uploaded.
+
+        Args:
+            report_id (str): The id of the report
+            title (str): The title of the report
+            iocs (int): The number of the iocs of the report
+            size (int): The serialized size of the report
+        """
+        self.payload_bytes += size
+        self.reports[report_id] = {
+            "id": report_id,
+            "title": title,
+            "action": "update" if report_id in self.existing else "create",
+            "iocs": iocs,
+            "bytes": size,
+        }
+
+
+class UploadPlan:
+    """The plan of the uploads of a run, the imports record their requests in it instead of sending them.
+
+    Example:
+        plan = UploadPlan()
+        process_iocs(cb, iocs, 5, feed_id, True, plan=plan)
+        plan.write("plan.json")
+    """
+
+    def __init__(self) -> None:
+        """Start with an empty plan"""
+        self._feeds: Dict[str, PlannedUploader] = {}
+
+    def uploader(self, cb: CBCloudAPI, feed: Feed) -> PlannedUploader:
+        """Return the recorder of the requests to a feed, a feed imported more than once keeps one recorder.
+
+        Args:
+            cb (CBCloudAPI): A reference to the CBCloudAPI object.
+            feed (Feed): The feed
+
+        Returns:
+            PlannedUploader: The recorder
+        """
+        if feed.id not in self._feeds:
+            self._feeds[feed.id] = PlannedUploader(cb, feed)
+        return self._feeds[feed.id]
+
+    def to_dict(self) -> dict:
+        """Return the plan of all of the feeds and their totals.
+
+        Returns:
+            dict: The plan
+        """
+        feeds = [uploader.summary() for uploader in self._feeds.values()]
+        totals = {
+            key: sum(feed[key] for feed in feeds)
+            for key in ("created", "updated", "kept", "deleted", "iocs_uploaded", "dropped_iocs", "payload_bytes")
+        }
+        totals["api_calls"] = sum(feed["api_calls"]["total"] for feed in feeds)
+        return {"feeds": feeds, "totals": totals}
+
+    def write(self, path: str) -> dict:
+        """Write the plan to a JSON file.
+
+        Args:
+            path (str): The path of the file
 
-    # create a report with all the data
-    report = Report(cb, initial_data=report_data, feed_id=feed.id)
-    report.save()
-    return report
+        Returns:
+            dict: The plan
+        """
+        plan = self.to_dict()
+        with open(path, "w") as file:
+            json.dump(plan, file, indent=2)
+        return plan
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Checkpoints of the imports, so an interrupted import continues where it stopped"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from cbc_importer.ranking import IOCRank, get_rank
+from cbc_importer.records import IOCRecord, ioc_raw_data
+
+logger = logging.getLogger(__name__)
+
+PHASE_PARSING = "parsing"
+PHASE_UPLOADING = "uploading"
+
+
+class ImportInterrupted(Exception):
+    """Raised when the import is stopped, the journal holds everything that is done so far."""
+
+
+class ImportJournal:
+    """On-disk journal of the import of one server.
+
+    The import has two phases. While parsing, the iocs of every page (or content block) of a collection are
+    written to a spool segment and the page is recorded, and the collections whose pages are all spooled are
+    recorded as completed. While uploading, the spooled iocs are imported and the ids of the uploaded reports
+    are recorded. A restarted import skips the completed collections without polling them, does not spool
+    the pages of a partially completed collection twice and, once the parsing is complete, does not contact
+    the TAXII server at all.
+
+    The journal is kept in its own directory:
+
+    - `state.json`: the phase, the fingerprint of the configuration and the completed collections,
+      it is replaced atomically;
+    - `pages.log` and `reports.log`: the spooled pages and the uploaded reports, one JSON line each,
+      they are only appended to;
+    - `spool/*.jsonl`: the raw data and the rank of the iocs, one segment per page.
+
+    The journal is deleted when the import finishes. A journal made for a different configuration is discarded.
+    """
+
+    def __init__(self, directory: Path, fingerprint: str) -> None:
+        """
+        Args:
+            directory (Path): The directory of the journal
+            fingerprint (str): The fingerprint of the configuration of the import
+        """
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint
+        self.phase = PHASE_PARSING
+        self.completed_collections: Set[str] = set()
+        self.spooled_pages: List[Tuple[str, int, str]] = []
+        self.uploaded_reports: Set[str] = set()
+        self._pages: Set[Tuple[str, int]] = set()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def open(cls, journal_dir: str, name: str, configuration: dict) -> "ImportJournal":
+        """Open the journal of a server, it continues the journal of an unfinished import.
+
+        Args:
+            journal_dir (str): The directory of all of the journals
+            name (str): The name of the server
+            configuration (dict): The configuration of the server
+
+        Returns:
+            ImportJournal: The journal
+        """
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        fingerprint = hashlib.sha256(json.dumps(configuration, sort_keys=True, default=str).encode()).hexdigest()
+        return cls(Path(journal_dir).expanduser() / slug, fingerprint)
+
+    @property
+    def resumed(self) -> bool:
+        """Whether the journal continues an unfinished import"""
+        return bool(self.spooled_pages or self.completed_collections or self.phase != PHASE_PARSING)
+
+    def spool(self, collections: Iterable[Tuple[str, Iterator[list]]]) -> None:
+        """Parse the collections into the spool, skipping everything that is already spooled.
+
+        Args:
+            collections (Iterable[Tuple[str, Iterator[list]]]): The keys of the collections and
+                the parsed iocs of their pages, as yielded by the `iter_taxii_collections` of the parsers
+
+        Raises:
+            ImportInterrupted: If the import is stopped
+        """
+        if self.phase != PHASE_PARSING:
+            logger.info("The parsing is complete in the journal, the server is not polled")
+            return
+        # the state marks the directory as a journal of this configuration, the pages are useless without it
+        self._save_state()
+        for key, pages in collections:
+            self.check()
+            if key in self.completed_collections:
+                logger.info(f"Skipping the completed collection {key}")
+                continue
+            for number, iocs in enumerate(pages):
+                if (key, number) not in self._pages:
+                    self._spool_page(key, number, iocs)
+                self.check()
+            self.completed_collections.add(key)
+            self._save_state()
+        self.phase = PHASE_UPLOADING
+        self._save_state()
+
+    def spooled_iocs(self) -> Iterator[IOCRecord]:
+        """Read the spooled iocs with their rank, segment by segment.
+
+        Yields:
+            IOCRecord: An ioc
+        """
+        yield from self._read_segments([segment for _, _, segment in self.spooled_pages])
+
+    def spooled_collections(self) -> Iterator[Tuple[str, Iterator[IOCRecord]]]:
+        """Read the spooled iocs with their rank, collection by collection.
+
+        Yields:
+            Tuple[str, Iterator[IOCRecord]]: The key of a collection and its iocs
+        """
+        segments: Dict[str, List[str]] = {}
+        for key, _, segment in self.spooled_pages:
+            segments.setdefault(key, []).append(segment)
+        for key, key_segments in segments.items():
+            yield key, self._read_segments(key_segments)
+
+    def _read_segments(self, segments: List[str]) -> Iterator[IOCRecord]:
+        """Read the iocs in some of the segments of the spool.
+
+        Args:
+            segments (List[str]): The names of the segments
+
+        Yields:
+            IOCRecord: An ioc, with its rank
+        """
+        for segment in segments:
+            with open(self.directory / "spool" / segment) as spool_file:
+                for line in spool_file:
+                    entry = json.loads(line)
+                    ioc = IOCRecord.from_dict(entry["ioc"])
+                    ioc.rank = IOCRank(**entry["rank"])
+                    yield ioc
+
+    def record_report(self, report_id: str) -> None:
+        """Record an uploaded report.
+
+        Args:
+            report_id (str): The id of the report
+        """
+        with self._lock:
+            self.uploaded_reports.add(report_id)
+            self._append("reports.log", report_id)
+
+    def check(self) -> None:
+        """Stop the import if it is requested.
+
+        Raises:
+            ImportInterrupted: If the import is stopped
+        """
+        if self._stop.is_set():
+            raise ImportInterrupted(f"The import is stopped, the checkpoint is in {self.directory}")
+
+    def stop(self) -> None:
+        """Request the import to stop at the next checkpoint."""
+        self._stop.set()
+
+    def finish(self) -> None:
+        """Delete the journal of the finished import."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _spool_page(self, key: str, number: int, iocs: List[IOCRecord]) -> None:
+        """Write the iocs of a page to a new segment and record the page.
+
+        The rank of an ioc is written next to its raw data, so the ioc is ranked the same when it is read back.
+
+        Args:
+            key (str): The key of the collection
+            number (int): The number of the page in the collection
+            iocs (List[IOCRecord]): The iocs
+        """
+        segment = f"{len(self.spooled_pages):06d}.jsonl"
+        path = self.directory / "spool" / segment
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(f"{path}.tmp", "w") as spool_file:
+            for ioc in iocs:
+                spool_file.write(json.dumps({"ioc": ioc_raw_data(ioc), "rank": get_rank(ioc)._asdict()}) + "\n")
+        os.replace(f"{path}.tmp", path)
+        # the page is recorded only after its segment is complete
+        self._append("pages.log", [key, number, segment])
+        self.spooled_pages.append((key, number, segment))
+        self._pages.add((key, number))
+
+    def _append(self, log: str, entry) -> None:
+        """Append an entry to a log of the journal.
+
+        Args:
+            log (str): The name of the log
+            entry: The entry, it must be serializable to JSON
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / log, "a") as log_file:
+            log_file.write(json.dumps(entry) + "\n")
+            log_file.flush()
+
+    def _save_state(self) -> None:
+        """Replace the state of the journal atomically."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        state = {
+            "fingerprint": self.fingerprint,
+            "phase": self.phase,
+            "completed_collections": sorted(self.completed_collections),
+        }
+        path = self.directory / "state.json"
+        Path(f"{path}.tmp").write_text(json.dumps(state))
+        os.replace(f"{path}.tmp", path)
+
+    def _load(self) -> None:
+        """Load the journal of an unfinished import, discard it if it was made for another configuration."""
+        path = self.directory / "state.json"
+        if not path.exists():
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        state = json.loads(path.read_text())
+        if state.get("fingerprint") != self.fingerprint:
+            logger.info(f"The configuration changed, discarding the journal in {self.directory}")
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+
+        self.phase = state["phase"]
+        self.completed_collections = set(state["completed_collections"])
+        for key, number, segment in self._read("pages.log"):
+            self.spooled_pages.append((key, number, segment))
+            self._pages.add((key, number))
+        self.uploaded_reports = set(self._read("reports.log"))
+        logger.info(
+            f"Resuming the import from {self.directory}: {len(self.completed_collections)} collections and "
+            f"{len(self.spooled_pages)} pages spooled, {len(self.uploaded_reports)} reports uploaded"
+        )
+
+    def _read(self, log: str) -> Iterator:
+        """Read the entries of a log, a partially written last entry is skipped.
+
+        Args:
+            log (str): The name of the log
+
+        Yields:
+            The entries of the log
+        """
+        path = self.directory / log
+        if not path.exists():
+            return
+        with open(path) as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping a partially written entry of {path}")
+
+
+@contextmanager
+def stop_on_sigterm(journal: ImportJournal) -> Iterator[ImportJournal]:
+    """Stop the import gracefully on SIGTERM, the previous handler is restored afterwards.
+
+    Args:
+        journal (ImportJournal): The journal of the import
+
+    Yields:
+        ImportJournal: The journal
+    """
+
+    def handler(signum, frame):
+        logger.warning("Received SIGTERM, stopping the import at the next checkpoint")
+        journal.stop()
+
+    previous = signal.signal(signal.SIGTERM, handler)
+    try:
+        yield journal
+    finally:
+        signal.signal(signal.SIGTERM, previous)
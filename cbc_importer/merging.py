@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Merging the equality iocs of the same field into iocs of many values"""
+import json
+import uuid
+from json.encoder import encode_basestring_ascii  # type: ignore[attr-defined]
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.ranking import get_rank
+from cbc_importer.records import IOCRecord, ioc_raw_data
+
+# The serialized size of the id of a merged ioc, a UUID
+MERGED_ID_BYTES = 36
+
+
+class _MergedIOC:
+    """An ioc of `merge_equality_iocs` while its values are gathered"""
+
+    __slots__ = ("position", "first", "size", "values")
+
+    def __init__(self, position: int, first: IOCRecord, size: int) -> None:
+        """
+        Args:
+            position (int): The position of the ioc in the merged iocs
+            first (IOCRecord): The ioc of its first value, it gives the field and the rank
+            size (int): The serialized size of the ioc without its values
+        """
+        self.position = position
+        self.first = first
+        self.size = size
+        self.values: List[str] = []
+
+
+def merge_equality_iocs(
+    iocs: Iterable[Union[IOCRecord, IOC_V2]],
+    max_values: int,
+    max_bytes: int,
+    known_values: Optional[Set[Tuple[str, str]]] = None,
+) -> List[IOCRecord]:
+    """Merge the equality iocs of every field into iocs of many values, the other iocs are kept as they are.
+
+    The values of a field are taken in the order of the iocs and every value is kept once per field.
+    A merged ioc holds up to `max_values` values and its raw data takes up to `max_bytes`, so it fits into
+    a report. It is put where its first value was and it gets the rank of the ioc of that value, so ranked
+    iocs stay ranked. Its id is derived from its field and its values, so the same values make the same
+    ioc on every run. An ioc whose values are not merged with others is kept as it is. The iocs with a link
+    are not merged, the link would only fit one of them.
+
+    Args:
+        iocs (Iterable[IOCRecord | IOC_V2]): The iocs, for example ranked by `cbc_importer.ranking.rank_iocs`
+        max_values (int): The largest number of values of a merged ioc
+        max_bytes (int): The largest serialized size of a merged ioc
+        known_values (Set[Tuple[str, str]]): (optional) The fields and the values that are left out,
+            for example the ones already in the feed
+
+    Returns:
+        List[IOCRecord]: The iocs
+    """
+    seen: Dict[str, Set[str]] = {}
+    for field, value in known_values or ():
+        seen.setdefault(field, set()).add(value)
+    merged_iocs: List[IOCRecord] = []
+    merging: Dict[str, _MergedIOC] = {}
+    pending: List[_MergedIOC] = []
+    for ioc in map(_as_record, iocs):
+        if ioc.match_type != "equality" or ioc.link is not None:
+            merged_iocs.append(ioc)
+            continue
+        field = ioc.field or ""
+        field_seen = seen.setdefault(field, set())
+        merged = merging.get(field)
+        for value in ioc.values:
+            if value in field_seen:
+                continue
+            field_seen.add(value)
+            # the value as `json.dumps` writes it, and its separator
+            size = len(encode_basestring_ascii(value)) + 1
+            if merged is None or len(merged.values) >= max_values or merged.size + size > max_bytes:
+                merged = merging[field] = _MergedIOC(len(merged_iocs), ioc, _merged_overhead(field))
+                # the ioc holds the place of the merged ioc, it stays if nothing is merged into it
+                merged_iocs.append(ioc)
+                pending.append(merged)
+            merged.values.append(value)
+            merged.size += size
+
+    for merged in pending:
+        first = merged.first
+        if merged.values != first.values:
+            ioc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, "\n".join([first.field or "", *merged.values])))
+            merged_iocs[merged.position] = IOCRecord(
+                ioc_id, "equality", merged.values, field=first.field, rank=first.rank
+            )
+    return merged_iocs
+
+
+def _as_record(ioc: Union[IOCRecord, IOC_V2]) -> IOCRecord:
+    """Return an ioc as a record, with its rank.
+
+    Args:
+        ioc (IOCRecord | IOC_V2): The ioc
+
+    Returns:
+        IOCRecord: The record
+    """
+    if isinstance(ioc, IOCRecord):
+        return ioc
+    record = IOCRecord.from_dict(ioc_raw_data(ioc))
+    record.rank = get_rank(ioc)
+    return record
+
+
+def _merged_overhead(field: str) -> int:
+    """Return the serialized size of a merged ioc without its values, including its separator.
+
+    Args:
+        field (str): The field of the ioc
+
+    Returns:
+        int: The size in bytes
+    """
+    raw = {"id": "0" * MERGED_ID_BYTES, "match_type": "equality", "values": [], "field": field}
+    return len(json.dumps(raw, separators=(",", ":"))) + 1
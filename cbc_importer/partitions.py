@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Partitions of the reports of a feed by the server and the collection their iocs come from"""
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import Report
+from cbc_sdk.errors import ObjectNotFoundError
+
+from cbc_importer.feed_cache import get_reports
+from cbc_importer.importer import (
+    LAYOUT_SEQUENTIAL,
+    MAX_REPORT_BYTES,
+    MAX_REQUEST_BYTES,
+    REPORTS_BATCH_SIZE,
+    PackingLimits,
+    PlannedUploader,
+    ReportUploader,
+    Uploader,
+    UploadPlan,
+    equality_values,
+    plan_append,
+    plan_sync,
+)
+from cbc_importer.journal import ImportJournal
+from cbc_importer.merging import merge_equality_iocs
+from cbc_importer.ranking import rank_iocs
+from cbc_importer.records import IOCRecord, ioc_key, ioc_raw_data
+from cbc_importer.utils import get_feed
+
+logger = logging.getLogger(__name__)
+
+# The prefix of the tags marking the partition of a report
+PARTITION_TAG_PREFIX = "partition-"
+
+
+def partition_tag(server_name: str, collection: str) -> str:
+    """Return the tag of the reports of a partition, it is short and stable between the runs.
+
+    Args:
+        server_name (str): The name of the server
+        collection (str): The key of the collection, as yielded by the `iter_taxii_collections` of the parsers
+
+    Returns:
+        str: The tag
+    """
+    digest = hashlib.sha256(f"{server_name}/{collection}".encode("utf-8")).hexdigest()[:16]
+    return f"{PARTITION_TAG_PREFIX}{digest}"
+
+
+def group_partitions(existing_reports: Iterable[Report]) -> Dict[str, List[Report]]:
+    """Group the reports of a feed by their partition, the reports without a partition are left out.
+
+    Args:
+        existing_reports (Iterable[Report]): The current reports of the feed
+
+    Returns:
+        Dict[str, List[Report]]: The reports by the tag of their partition
+    """
+    partitions: Dict[str, List[Report]] = {}
+    for item in existing_reports:
+        tag = next((tag for tag in item._info.get("tags") or [] if tag.startswith(PARTITION_TAG_PREFIX)), None)
+        if tag is not None:
+            partitions.setdefault(tag, []).append(item)
+    return partitions
+
+
+def process_partitioned_iocs(
+    cb: CBCloudAPI,
+    collections: Iterable[Tuple[str, Iterable[IOCRecord]]],
+    severity: int,
+    feed_id: str,
+    replace: bool,
+    server_name: str,
+    sync: bool = False,
+    layout: str = LAYOUT_SEQUENTIAL,
+    workers: int = 1,
+    journal: Optional[ImportJournal] = None,
+    max_report_bytes: int = MAX_REPORT_BYTES,
+    max_request_bytes: int = MAX_REQUEST_BYTES,
+    merge_values: Optional[int] = None,
+    plan: Optional[UploadPlan] = None,
+) -> dict:
+    """Import the iocs of every collection into its own partition of the reports of a feed.
+
+    The reports of a partition are tagged with `partition_tag` and hold only the iocs of their collection.
+    Only the partitions of the collections that are imported are changed, the reports of the other
+    collections and servers are left alone. When replacing or synchronizing, a partition is synchronized
+    with the iocs of its collection, so only the reports whose iocs changed are uploaded or deleted.
+    When appending, the iocs that are not in the partition yet fill its reports.
+
+    The feed holds at most REPORTS_BATCH_SIZE reports across all of its partitions. The partitions share
+    the reports the feed has room for in the order of the collections, a partition can always keep as many
+    reports as it had. The iocs that do not fit are the lowest ranked ones of their partition, they are
+    dropped and counted by partition.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        collections (Iterable[Tuple[str, Iterable[IOCRecord]]]): The keys of the collections and their iocs
+        severity (int): The severity of the Reports
+        feed_id (str): The id of the feed
+        replace (bool): Replacing the reports of the partitions, if false it will append the iocs
+        server_name (str): The name of the server the collections come from
+        sync (bool): (optional) Synchronizing the reports of the partitions with the iocs
+        layout (str): (optional) The layout of the reports, only `sequential` is supported
+        workers (int): (optional) The number of reports uploaded or deleted at the same time
+        journal (ImportJournal): (optional) The journal of the import, the uploaded reports are recorded in it
+        max_report_bytes (int): (optional) The largest serialized size of a report
+        max_request_bytes (int): (optional) The largest serialized size of a request
+        merge_values (int): (optional) Merge the equality iocs of the same field into iocs of up to this many
+            values, as in `process_iocs`
+        plan (UploadPlan): (optional) Record the requests in the plan instead of sending them
+
+    Returns:
+        dict: The number of the reports uploaded, deleted and unchanged, of the partitions changed and of the iocs
+            dropped, in total and by the collections with dropped iocs
+
+    Raises:
+        SystemExit: If the feed is not found
+        ValueError: If the layout is not `sequential`
+        ReportUploadError: If some of the reports failed to upload or delete
+    """
+    if layout != LAYOUT_SEQUENTIAL:
+        raise ValueError("The partitions need the `sequential` layout")
+    try:
+        feed = get_feed(cb, feed_id=feed_id)
+    except ObjectNotFoundError:
+        logger.error(f"Feed was not found with id: {feed_id}")
+        raise SystemExit(1)
+
+    limits = PackingLimits(max_report_bytes, max_request_bytes)
+    all_reports = get_reports(cb, feed)
+    partitions = group_partitions(all_reports)
+    # the room of the feed for new reports, the reports of a partition are given back to it while it is planned
+    free_reports = REPORTS_BATCH_SIZE - len(all_reports)
+    totals = {"uploaded": 0, "deleted": 0, "unchanged": 0, "partitions_changed": 0, "dropped": 0}
+    dropped_by_partition: Dict[str, int] = {}
+    uploader: Uploader = plan.uploader(cb, feed) if plan is not None else ReportUploader(cb, feed, workers, journal)
+    with uploader:
+        for collection, iocs in collections:
+            tag = partition_tag(server_name, collection)
+            existing_reports = partitions.get(tag, [])
+            max_reports = max(free_reports, 0) + len(existing_reports)
+            dropped: List[dict] = []
+            # the most valuable iocs are placed first, as in `process_iocs`
+            ranked = rank_iocs(iocs)
+            if merge_values:
+                known_values = None if replace or sync else equality_values(existing_reports)
+                ranked = merge_equality_iocs(ranked, merge_values, limits.iocs_bytes, known_values)
+            if replace or sync:
+                desired_iocs: Dict[tuple, dict] = {}
+                for raw in map(ioc_raw_data, ranked):
+                    desired_iocs.setdefault(ioc_key(raw), raw)
+                reports, deleted_ids, summary = plan_sync(
+                    cb, feed, existing_reports, desired_iocs, severity, limits, dropped, max_reports
+                )
+            else:
+                known = {ioc_key(ioc_data) for item in existing_reports for ioc_data in item._info.get("iocs_v2") or []}
+                new_iocs = []
+                for raw in map(ioc_raw_data, ranked):
+                    key = ioc_key(raw)
+                    if key not in known:
+                        known.add(key)
+                        new_iocs.append(raw)
+                reports, summary = plan_append(
+                    cb, feed, existing_reports, new_iocs, severity, limits, dropped, max_reports
+                )
+                deleted_ids = []
+            free_reports = max_reports - (summary["added"] + summary["updated"] + summary["unchanged"])
+
+            for report in reports:
+                report["tags"] = [tag]
+                report["title"] = f"Report {feed.name} ({server_name} / {collection})"
+                uploader.put(report)
+            for report_id in deleted_ids:
+                uploader.delete(report_id)
+
+            logger.info(
+                f"Partition {server_name} / {collection} of feed {feed.name}: {len(reports)} reports uploaded, "
+                f"{len(deleted_ids)} deleted, {summary['unchanged']} unchanged."
+            )
+            totals["uploaded"] += len(reports)
+            totals["deleted"] += len(deleted_ids)
+            totals["unchanged"] += summary["unchanged"]
+            totals["partitions_changed"] += bool(reports or deleted_ids)
+            if dropped:
+                logger.warning(
+                    f"The feed {feed.name} is full, {len(dropped)} iocs of partition {server_name} / {collection} "
+                    "are dropped"
+                )
+                if isinstance(uploader, PlannedUploader):
+                    uploader.dropped_iocs += len(dropped)
+                totals["dropped"] += len(dropped)
+                dropped_by_partition[collection] = len(dropped)
+    return dict(totals, dropped_by_partition=dropped_by_partition)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Ranking of the iocs, so the least valuable ones are dropped when a feed cannot hold all of them"""
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from cbc_importer.records import IOCRecord, ioc_key, record_key
+
+# The confidence of the STIX 1 vocabulary on the 0-100 scale of STIX 2
+STIX1_CONFIDENCE = {"high": 85, "medium": 50, "low": 15, "none": 0, "unknown": 0}
+
+
+class IOCRank(NamedTuple):
+    """Where and when an ioc comes from and how valuable it is, nothing of it is uploaded to CBC"""
+
+    source: str = ""
+    priority: int = 0
+    timestamp: float = 0.0
+    confidence: int = 0
+    first_seen: float = 0.0
+
+
+def latest_timestamp(*dates: Optional[datetime]) -> float:
+    """Return the latest of the dates as a POSIX timestamp, the missing dates are skipped.
+
+    Args:
+        *dates (datetime): The dates, for example `created`, `modified` and `valid_from` of a STIX indicator
+
+    Returns:
+        float: The timestamp, 0 if there are no dates
+    """
+    return max((date.timestamp() for date in dates if date is not None), default=0.0)
+
+
+def get_rank(ioc: IOCRecord) -> IOCRank:
+    """Return the rank of an ioc, the iocs without one rank the lowest.
+
+    Args:
+        ioc (IOCRecord): The ioc
+
+    Returns:
+        IOCRank: The rank
+    """
+    rank = ioc.rank if isinstance(ioc, IOCRecord) else getattr(ioc, "_rank", None)
+    return rank or IOCRank()
+
+
+def set_rank(ioc: IOCRecord, **kwargs) -> IOCRecord:
+    """Update the rank of an ioc, the rank is kept outside of the data that is uploaded.
+
+    Args:
+        ioc (IOCRecord): The ioc
+        **kwargs: The fields of `IOCRank` to change
+
+    Returns:
+        IOCRecord: The ioc
+    """
+    rank = get_rank(ioc)._replace(**kwargs)
+    if isinstance(ioc, IOCRecord):
+        ioc.rank = rank
+    else:
+        ioc._rank = rank
+    return ioc
+
+
+def with_source(iocs: Iterable[IOCRecord], source: str, priority: int = 0) -> Iterator[IOCRecord]:
+    """Record the source of the iocs and its priority, as the iocs are consumed.
+
+    Args:
+        iocs (Iterable[IOCRecord]): The iocs
+        source (str): The name of the source
+        priority (int): The priority of the source, the iocs of a higher priority are kept first
+
+    Yields:
+        IOCRecord: The iocs
+    """
+    for ioc in iocs:
+        yield set_rank(ioc, source=source, priority=priority)
+
+
+def rank_key(ioc: IOCRecord) -> tuple:
+    """Return the sort key of an ioc, the most valuable iocs come first.
+
+    The iocs are ordered by the priority of their source, then by recency, then by confidence.
+
+    Args:
+        ioc (IOCRecord): The ioc
+
+    Returns:
+        tuple: The sort key
+    """
+    rank = get_rank(ioc)
+    return -rank.priority, -rank.timestamp, -rank.confidence
+
+
+def rank_iocs(iocs: Iterable[IOCRecord]) -> List[IOCRecord]:
+    """Sort the iocs from the most to the least valuable, the iocs that rank the same keep their order.
+
+    Args:
+        iocs (Iterable[IOCRecord]): The iocs
+
+    Returns:
+        List[IOCRecord]: The sorted iocs
+    """
+    return sorted(iocs, key=rank_key)
+
+
+def rank_top_iocs(
+    iocs: Iterable[IOCRecord], max_count: int, leave_out: Optional[Callable[[List[IOCRecord]], None]] = None
+) -> List[IOCRecord]:
+    """Sort the iocs like `rank_iocs`, but keep only the `max_count` most valuable ones.
+
+    The iocs are held as they come and ranked once twice `max_count` of them are held, then the ones beyond
+    `max_count` are left out. So at most twice `max_count` iocs are held however many there are, and iocs
+    that all fit are ranked once at the end. The iocs kept are the same as the first `max_count` of `rank_iocs`.
+
+    Args:
+        iocs (Iterable[IOCRecord]): The iocs
+        max_count (int): The largest number of iocs that are kept
+        leave_out (Callable[[List[IOCRecord]], None]): (optional) Called with every batch of the iocs that are
+            left out, by default they are dropped
+
+    Returns:
+        List[IOCRecord]: The most valuable iocs, sorted
+    """
+    held: List[IOCRecord] = []
+    for ioc in iocs:
+        held.append(ioc)
+        if len(held) >= 2 * max_count:
+            held = _keep_top(held, max_count, leave_out)
+    return _keep_top(held, max_count, leave_out)
+
+
+def _keep_top(
+    iocs: List[IOCRecord], max_count: int, leave_out: Optional[Callable[[List[IOCRecord]], None]]
+) -> List[IOCRecord]:
+    """Sort the iocs and leave out the ones beyond `max_count`, see `rank_top_iocs`."""
+    iocs.sort(key=rank_key)
+    if len(iocs) > max_count:
+        if leave_out is not None:
+            leave_out(iocs[max_count:])
+        del iocs[max_count:]
+    return iocs
+
+
+def unique_iocs(iocs: Iterable[IOCRecord]) -> List[IOCRecord]:
+    """Drop the iocs whose content repeats another ioc, the most valuable copy is kept, the first among equals.
+
+    The iocs are not ranked, the kept copy takes the place of the first copy.
+
+    Args:
+        iocs (Iterable[IOCRecord]): The iocs, for example the iocs merged from several servers
+
+    Returns:
+        List[IOCRecord]: The iocs without the duplicates
+    """
+    unique: Dict[tuple, IOCRecord] = {}
+    for ioc in iocs:
+        key = record_key(ioc)
+        kept = unique.get(key)
+        if kept is None or rank_key(ioc) < rank_key(kept):
+            unique[key] = ioc
+    return list(unique.values())
+
+
+def count_by_source(iocs: List[IOCRecord], raw_iocs: Optional[List[dict]] = None) -> Dict[str, int]:
+    """Count the iocs of every source among the raw data of some of the iocs.
+
+    Args:
+        iocs (List[IOCRecord]): The iocs
+        raw_iocs (List[dict]): (optional) The raw data of some of the iocs, for example the ones that are dropped,
+            by default all of the iocs are counted
+
+    Returns:
+        Dict[str, int]: The count of the iocs by source
+    """
+    if raw_iocs is None:
+        return dict(Counter(get_rank(ioc).source or "unknown" for ioc in iocs))
+    # the raw data of a record is built anew for every use, so the iocs are matched by their content
+    selected = Counter(ioc_key(raw) for raw in raw_iocs)
+    counts: Counter = Counter()
+    for ioc in iocs:
+        key = record_key(ioc)
+        if selected[key]:
+            selected[key] -= 1
+            counts[get_rank(ioc).source or "unknown"] += 1
+    return dict(counts)
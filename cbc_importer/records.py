@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""The iocs as they are passed from the parsers to the importer"""
+import uuid
+from typing import TYPE_CHECKING, List, Optional, Union
+
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+if TYPE_CHECKING:
+    from cbc_importer.ranking import IOCRank
+
+
+class IOCRecord:
+    """An ioc between the parsers and the importer, it becomes the raw data of an `IOC_V2` when it is uploaded.
+
+    Unlike `IOC_V2` the record holds no reference to a `CBCloudAPI` object and no dictionary, so it is
+    small and it can be pickled, for example to hand it over to another process. The importer takes
+    `IOC_V2` objects as well, see `ioc_raw_data`.
+    """
+
+    __slots__ = ("id", "match_type", "values", "field", "link", "rank")
+
+    def __init__(
+        self,
+        ioc_id: str,
+        match_type: str,
+        values: List[str],
+        field: Optional[str] = None,
+        link: Optional[str] = None,
+        rank: Optional["IOCRank"] = None,
+    ) -> None:
+        """
+        Args:
+            ioc_id (str): The id of the ioc
+            match_type (str): `equality`, `regex` or `query`
+            values (List[str]): The values matched by the ioc
+            field (str): (optional) The field matched by the ioc, the `query` iocs have none
+            link (str): (optional) A link to the source of the ioc
+            rank (IOCRank): (optional) Where the ioc comes from and how valuable it is, it is not uploaded
+        """
+        self.id = ioc_id
+        self.match_type = match_type
+        self.values = values
+        self.field = field
+        self.link = link
+        self.rank = rank
+
+    @classmethod
+    def create_equality(cls, ioc_id: Optional[str], field: str, *values: str) -> "IOCRecord":
+        """Create an `equality` ioc, like `IOC_V2.create_equality`.
+
+        Args:
+            ioc_id (str): The id of the ioc, a UUID is generated if it is None
+            field (str): The field matched by the ioc
+            *values (str): The values matched by the ioc
+
+        Returns:
+            IOCRecord: The ioc
+        """
+        return cls(ioc_id or str(uuid.uuid4()), "equality", list(values), field=field)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IOCRecord":
+        """Create an ioc from its raw data, for example the data spooled by the journal.
+
+        Args:
+            data (dict): The raw data of the ioc
+
+        Returns:
+            IOCRecord: The ioc
+        """
+        return cls(data["id"], data["match_type"], list(data["values"]), data.get("field"), data.get("link"))
+
+    def to_dict(self) -> dict:
+        """Return the raw data of the ioc, as it is uploaded to CBC.
+
+        Returns:
+            dict: The raw data, a new dictionary on every call
+        """
+        data = {"id": self.id, "match_type": self.match_type, "values": list(self.values)}
+        if self.field is not None:
+            data["field"] = self.field
+        if self.link is not None:
+            data["link"] = self.link
+        return data
+
+    def __eq__(self, other: object) -> bool:
+        """Compare the iocs by all of their data, including the rank"""
+        if not isinstance(other, IOCRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self) -> int:
+        """Hash the ioc by its content, like `ioc_key`, so the equal iocs have the same hash"""
+        return hash(record_key(self))
+
+    def __repr__(self) -> str:
+        """Return the representation of the ioc"""
+        return f"IOCRecord({self.id!r}, {self.match_type!r}, {self.values!r}, field={self.field!r})"
+
+
+def ioc_raw_data(ioc: Union[IOCRecord, IOC_V2, dict]) -> dict:
+    """Return the raw data of an ioc, as it is uploaded to CBC.
+
+    The data of a record is built on every call, so a caller that needs it twice keeps it.
+
+    Args:
+        ioc (IOCRecord | IOC_V2 | dict): The ioc, the raw data is returned as it is
+
+    Returns:
+        dict: The raw data
+    """
+    if isinstance(ioc, dict):
+        return ioc
+    return ioc.to_dict() if isinstance(ioc, IOCRecord) else ioc._info
+
+
+def ioc_key(ioc: dict) -> tuple:
+    """Return a key identifying an ioc by its content, regardless of its id.
+
+    Args:
+        ioc (dict): The raw data of the ioc
+
+    Returns:
+        tuple: The key of the ioc
+    """
+    return ioc["match_type"], ioc.get("field") or "", tuple(ioc["values"])
+
+
+def record_key(ioc: Union[IOCRecord, IOC_V2]) -> tuple:
+    """Return the key of an ioc like `ioc_key`, the raw data of a record is not built for it.
+
+    Args:
+        ioc (IOCRecord | IOC_V2): The ioc
+
+    Returns:
+        tuple: The key of the ioc
+    """
+    if isinstance(ioc, IOCRecord):
+        return ioc.match_type, ioc.field or "", tuple(ioc.values)
+    return ioc_key(ioc._info)
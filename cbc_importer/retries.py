@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Retrying the writes to CBC"""
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict
+
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.errors import ClientError, ConnectionError, ServerError, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# The retry policies of the CBCloudAPI instances, so all of the writes through an instance share the circuits
+_POLICIES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# The client errors that are worth retrying, the rest of them fail the same way every time
+RETRYABLE_STATUS_CODES = {408, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint failed too many times in a row and its requests are not sent for a while."""
+
+    def __init__(self, endpoint: str, retry_in: float) -> None:
+        """
+        Args:
+            endpoint (str): The endpoint whose circuit is open
+            retry_in (float): The seconds until a request is allowed again
+        """
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(f"The circuit of `{endpoint}` is open, retry in {retry_in:.1f}s")
+
+
+class RetryPolicy:
+    """Retries the failed writes with jittered exponential backoff and breaks the circuit of failing endpoints.
+
+    Only the transient errors are retried: the server errors, the timeouts, the connection errors and the
+    client errors in `RETRYABLE_STATUS_CODES`. The delay before the attempt `n` is picked at random between 0
+    and `min(max_delay, base_delay * 2 ** (n - 1))`, so the workers do not retry at the same time.
+
+    Every endpoint has its own circuit. After `failure_threshold` failed attempts in a row the circuit opens
+    and the requests to the endpoint fail with `CircuitOpenError` without being sent. After `reset_timeout`
+    seconds one request is let through, the circuit closes if it succeeds and opens again if it fails.
+
+    The requests must be idempotent, which is why the report ids are set when the bodies are built
+    and a retried request sends the same body with the same ids.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        failure_threshold: int = 10,
+        reset_timeout: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        """
+        Args:
+            attempts (int): The number of attempts of a request, including the first one
+            base_delay (float): The longest delay in seconds before the first retry
+            max_delay (float): The longest delay in seconds before any retry
+            failure_threshold (int): The failed attempts in a row that open the circuit of an endpoint
+            reset_timeout (float): The seconds the circuit stays open
+            clock (Callable): The monotonic clock, used in tests
+            sleep (Callable): The sleep function, used in tests
+            jitter (Callable): The random delay between two values, used in tests
+        """
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retries = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._jitter = jitter
+        self._failures: Dict[str, int] = {}
+        self._opened_at: Dict[str, float] = {}
+        self._trials: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def call(self, endpoint: str, func: Callable, *args, **kwargs) -> Any:
+        """Run a request, retrying it on the transient errors.
+
+        Args:
+            endpoint (str): The endpoint of the request, it selects the circuit
+            func (Callable): The request
+            *args: The arguments of the request
+            **kwargs: The keyword arguments of the request
+
+        Returns:
+            Any: The result of the request
+
+        Raises:
+            CircuitOpenError: If the circuit of the endpoint is open
+            Exception: The error of the last attempt or any error that is not retried
+        """
+        for attempt in range(1, self.attempts + 1):
+            self._enter(endpoint)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e):
+                    self._leave(endpoint, success=True)
+                    raise
+                self._leave(endpoint, success=False)
+                if attempt == self.attempts:
+                    raise
+                delay = self._jitter(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                logger.warning(f"`{endpoint}` failed ({e}), retrying in {delay:.2f}s ({attempt}/{self.attempts})")
+                with self._lock:
+                    self.retries += 1
+                self._sleep(delay)
+            else:
+                self._leave(endpoint, success=True)
+                return result
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Return whether an error is transient and the request can be sent again.
+
+        Args:
+            error (Exception): The error of the request
+
+        Returns:
+            bool: True if the request can be retried
+        """
+        if isinstance(error, (ServerError, TimeoutError, ConnectionError)):
+            return True
+        return isinstance(error, ClientError) and error.error_code in RETRYABLE_STATUS_CODES
+
+    def metrics(self) -> dict:
+        """Return the count of the retries and the endpoints whose circuit is open.
+
+        Returns:
+            dict: The retries and the open circuits
+        """
+        with self._lock:
+            return {"retries": self.retries, "open_circuits": sorted(self._opened_at)}
+
+    def _enter(self, endpoint: str) -> None:
+        """Check the circuit of the endpoint before a request.
+
+        Args:
+            endpoint (str): The endpoint of the request
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or it is half-open and its trial request is running
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(endpoint)
+            if opened_at is None:
+                return
+            retry_in = opened_at + self.reset_timeout - self._clock()
+            if retry_in > 0 or self._trials.get(endpoint):
+                raise CircuitOpenError(endpoint, max(retry_in, 0.0))
+            # half-open, this request is the trial
+            self._trials[endpoint] = True
+
+    def _leave(self, endpoint: str, success: bool) -> None:
+        """Update the circuit of the endpoint after a request.
+
+        Args:
+            endpoint (str): The endpoint of the request
+            success (bool): Whether the request reached the server and did not fail with a transient error
+        """
+        with self._lock:
+            trial = self._trials.pop(endpoint, False)
+            if success:
+                self._failures.pop(endpoint, None)
+                if self._opened_at.pop(endpoint, None) is not None:
+                    logger.info(f"The circuit of `{endpoint}` is closed")
+                return
+            self._failures[endpoint] = self._failures.get(endpoint, 0) + 1
+            if trial or self._failures[endpoint] >= self.failure_threshold:
+                self._opened_at[endpoint] = self._clock()
+                logger.error(f"`{endpoint}` failed {self._failures[endpoint]} times in a row, opening its circuit")
+
+
+def install_retry_policy(cb: CBCloudAPI, **kwargs) -> RetryPolicy:
+    """Set the retry policy of the writes through a CBCloudAPI instance.
+
+    Calling this again for the same instance returns the policy that is already installed.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        **kwargs: The arguments of `RetryPolicy`
+
+    Returns:
+        RetryPolicy: The retry policy of the instance
+    """
+    if cb not in _POLICIES:
+        _POLICIES[cb] = RetryPolicy(**kwargs)
+    return _POLICIES[cb]
+
+
+def get_retry_policy(cb: CBCloudAPI) -> RetryPolicy:
+    """Return the retry policy of a CBCloudAPI instance, the default one is installed if there is none.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+
+    Returns:
+        RetryPolicy: The retry policy of the instance
+    """
+    return install_retry_policy(cb)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Overflow of the iocs into sibling feeds when a feed is full"""
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import Feed
+from cbc_sdk.errors import ObjectNotFoundError
+
+from cbc_importer.feed_cache import get_reports
+from cbc_importer.importer import MAX_REPORT_BYTES, MAX_REQUEST_BYTES, process_iocs
+from cbc_importer.journal import ImportJournal
+from cbc_importer.ranking import rank_iocs
+from cbc_importer.records import IOCRecord, ioc_key, ioc_raw_data
+from cbc_importer.utils import create_feed, get_feed
+
+logger = logging.getLogger(__name__)
+
+# The manifests of the sharded feeds, one file per base feed
+DEFAULT_MANIFEST_DIR = "~/.cbc-threat-intel/shards"
+
+
+def shard_name(base_name: str, number: int) -> str:
+    """Return the name of a shard of a feed.
+
+    Args:
+        base_name (str): The name of the base feed
+        number (int): The number of the shard, starting from 1
+
+    Returns:
+        str: The name of the shard
+    """
+    return f"{base_name} (shard {number})"
+
+
+def shard_number(base_name: str, feed: Feed) -> Optional[int]:
+    """Return the number of a shard of a feed.
+
+    Args:
+        base_name (str): The name of the base feed
+        feed (Feed): The feed that may be a shard
+
+    Returns:
+        int: The number of the shard, None if the feed is not a shard of the base feed
+    """
+    match = re.fullmatch(rf"{re.escape(base_name)} \(shard (\d+)\)", feed.name)
+    return int(match.group(1)) if match else None
+
+
+def ioc_digest(ioc: dict) -> str:
+    """Return a short digest of the content of an ioc, used as its key in the manifest.
+
+    Args:
+        ioc (dict): The raw data of the ioc
+
+    Returns:
+        str: The digest
+    """
+    return hashlib.sha256(json.dumps(ioc_key(ioc)).encode()).hexdigest()[:16]
+
+
+class ShardManifest:
+    """The shards of a feed and the shard that holds each of the iocs.
+
+    The manifest is kept in `<manifest_dir>/<feed id>.json` and replaced atomically. The shards
+    are listed by their feed ids, the base feed first, and the iocs point at the shards by position.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Args:
+            path (Path): The file of the manifest
+        """
+        self.path = Path(path)
+        self.shards: List[str] = []
+        self.iocs: Dict[str, int] = {}
+        if self.path.exists():
+            manifest = json.loads(self.path.read_text())
+            self.shards = manifest["shards"]
+            self.iocs = manifest["iocs"]
+
+    @classmethod
+    def open(cls, manifest_dir: str, feed_id: str) -> "ShardManifest":
+        """Open the manifest of a base feed, it is empty if there is none yet.
+
+        Args:
+            manifest_dir (str): The directory of the manifests
+            feed_id (str): The id of the base feed
+
+        Returns:
+            ShardManifest: The manifest
+        """
+        return cls(Path(manifest_dir).expanduser() / f"{feed_id}.json")
+
+    def save(self) -> None:
+        """Replace the manifest atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        Path(f"{self.path}.tmp").write_text(json.dumps({"shards": self.shards, "iocs": self.iocs}))
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def find_shards(cb: CBCloudAPI, feed: Feed, manifest: ShardManifest) -> List[Feed]:
+    """Return the base feed and its shards, in the order they are filled.
+
+    The shards in the manifest keep their order. The feeds that are named as shards of the base feed
+    but are not in the manifest (for example, the manifest was lost) follow them, their iocs are read
+    into the manifest so they are not added to another shard.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The base feed
+        manifest (ShardManifest): The manifest of the base feed
+
+    Returns:
+        List[Feed]: The base feed and its shards
+    """
+    siblings = {
+        sibling.id: sibling
+        for sibling in get_feed(cb, feed_name=feed.name, return_all=True)
+        if shard_number(feed.name, sibling) is not None
+    }
+    shards = [feed] + [siblings.pop(feed_id) for feed_id in manifest.shards[1:] if feed_id in siblings]
+
+    # the iocs of the shards that are gone are added again
+    kept = {feed_id: position for position, feed_id in enumerate(shard.id for shard in shards)}
+    manifest.iocs = {
+        digest: kept[manifest.shards[position]]
+        for digest, position in manifest.iocs.items()
+        if position < len(manifest.shards) and manifest.shards[position] in kept
+    }
+    for sibling in sorted(siblings.values(), key=lambda sibling: shard_number(feed.name, sibling) or 0):
+        logger.info(f"Adding the shard {sibling.name} to the manifest of feed {feed.name}")
+        for report in get_reports(cb, sibling):
+            for ioc in report._info.get("iocs_v2") or []:
+                manifest.iocs.setdefault(ioc_digest(ioc), len(shards))
+        shards.append(sibling)
+    manifest.shards = [shard.id for shard in shards]
+    return shards
+
+
+def create_shard(cb: CBCloudAPI, feed: Feed, shards: List[Feed]) -> Feed:
+    """Create the next shard of a feed, it copies the properties of the base feed.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        feed (Feed): The base feed
+        shards (List[Feed]): The base feed and its existing shards
+
+    Returns:
+        Feed: The new shard
+    """
+    number = max((shard_number(feed.name, shard) or 0 for shard in shards), default=0) + 1
+    name = shard_name(feed.name, number)
+    logger.info(f"The feed {feed.name} and its shards are full, creating the shard {name}")
+    return create_feed(cb, name=name, provider_url=feed.provider_url, summary=feed.summary, category=feed.category)
+
+
+def process_sharded_iocs(
+    cb: CBCloudAPI,
+    iocs: Iterable[IOCRecord],
+    severity: int,
+    feed_id: str,
+    replace: bool,
+    sync: bool = False,
+    workers: int = 1,
+    journal: Optional[ImportJournal] = None,
+    max_report_bytes: int = MAX_REPORT_BYTES,
+    max_request_bytes: int = MAX_REQUEST_BYTES,
+    manifest_dir: str = DEFAULT_MANIFEST_DIR,
+) -> None:
+    """Import the iocs into a feed and, once it is full, into its shards.
+
+    The shards are sibling feeds named after the base feed, "<name> (shard <number>)", they are created
+    when the base feed and the existing shards are full. The manifest of the base feed records which
+    shard holds each ioc, so a later run sends every known ioc to its shard and only the new iocs fill
+    the shards from the first one on. When appending, the known iocs are skipped and only the shards that
+    get new iocs are uploaded. When replacing or synchronizing, every shard is given the iocs it holds,
+    the shards whose iocs are all gone are emptied.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        iocs (Iterable[IOCRecord]): The iocs
+        severity (int): The severity of the Reports
+        feed_id (str): The id of the base feed
+        replace (bool): Replacing the Reports in the feeds
+        sync (bool): (optional) Synchronizing the Reports in the feeds with the iocs
+        workers (int): (optional) The number of reports uploaded or deleted at the same time
+        journal (ImportJournal): (optional) The journal of the import
+        max_report_bytes (int): (optional) The largest serialized size of a report
+        max_request_bytes (int): (optional) The largest serialized size of the request replacing the reports
+        manifest_dir (str): (optional) The directory of the manifests
+
+    Raises:
+        SystemExit: If the base feed is not found
+    """
+    try:
+        feed = get_feed(cb, feed_id=feed_id)
+    except ObjectNotFoundError:
+        logger.error(f"Feed was not found with id: {feed_id}")
+        raise SystemExit(1)
+
+    manifest = ShardManifest.open(manifest_dir, feed.id)
+    shards = find_shards(cb, feed, manifest)
+    appending = not replace and not sync
+
+    # the most valuable new iocs fill the first shards with room
+    assigned: Dict[int, List[IOCRecord]] = {}
+    carry = []
+    for ioc in rank_iocs(iocs):
+        position = manifest.iocs.get(ioc_digest(ioc_raw_data(ioc)))
+        if position is None:
+            carry.append(ioc)
+        elif not appending:
+            assigned.setdefault(position, []).append(ioc)
+    # replacing and synchronizing place all of the iocs again, appending keeps the known ones
+    placements = manifest.iocs if appending else {}
+
+    position = 0
+    while position < len(shards) or carry:
+        if position == len(shards):
+            shards.append(create_shard(cb, feed, shards))
+        shard_iocs = assigned.pop(position, []) + carry
+        if appending and not shard_iocs:
+            position += 1
+            continue
+
+        overflow: List[dict] = []
+        process_iocs(
+            cb,
+            shard_iocs,
+            severity,
+            shards[position].id,
+            replace,
+            sync=sync,
+            workers=workers,
+            journal=journal,
+            max_report_bytes=max_report_bytes,
+            max_request_bytes=max_request_bytes,
+            overflow=overflow,
+        )
+        # the raw data of a record is built anew for every use, so the overflowing iocs are matched by their content
+        overflowed = {ioc_digest(ioc) for ioc in overflow}
+        carry = []
+        for ioc in shard_iocs:
+            digest = ioc_digest(ioc_raw_data(ioc))
+            if digest in overflowed:
+                carry.append(ioc)
+            else:
+                placements[digest] = position
+        position += 1
+
+    manifest.shards = [shard.id for shard in shards]
+    manifest.iocs = placements
+    manifest.save()
+    logger.info(f"The iocs of feed {feed.name} are in {len(shards)} feeds: {', '.join(s.name for s in shards)}")
@@ -11,14 +11,12 @@
 # * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
 import logging
-import uuid
 from io import BytesIO
-from typing import List, Union
+from typing import Iterator, List, Tuple, Union
 
 from cabby import Client10, Client11
 from cabby.entities import Collection
 from cbc_sdk import CBCloudAPI
-from cbc_sdk.enterprise_edr import IOC_V2
 from cybox.core.observable import Observables
 from cybox.objects.address_object import Address
 from cybox.objects.domain_name_object import DomainName
@@ -29,6 +27,8 @@ from lxml.etree import XMLSyntaxError
 from sdv import validate_xml
 from stix.core import Indicators, STIXPackage
 
+from cbc_importer.ranking import STIX1_CONFIDENCE, latest_timestamp, set_rank
+from cbc_importer.records import IOCRecord
 from cbc_importer.stix_parsers.v1.object_parsers import (
     AddressParser,
     DomainNameParser,
@@ -41,7 +41,7 @@ logger = logging.getLogger(__name__)
 
 class STIX1Parser:
     """Parser for translating STIX Indicator
-    objects to `cbc_sdk.enterprise_edr.IOC_V2`.
+    objects to `cbc_importer.records.IOCRecord`.
 
     The parser can be used for STIX 1.x
     by default the client that can be used is for 1.0 and 1.2.
@@ -60,9 +60,9 @@ class STIX1Parser:
             cbcapi (CBCloudAPI): [description]
         """
         self.cbcapi = cbcapi
-        self.iocs: List[IOC_V2] = []
+        self.iocs: List[IOCRecord] = []
 
-    def parse_file(self, file: str) -> List[IOC_V2]:
+    def parse_file(self, file: str) -> List[IOCRecord]:
         """Parsing STIX 1x content
 
         Args:
@@ -72,7 +72,7 @@ class STIX1Parser:
             ValueError: If the XML file is not valid or empty.
 
         Returns:
-           List[IOC_V2] of parsed STIX Objects into IOCs.
+           List[IOCRecord] of parsed STIX Objects into IOCs.
         """
         if validate_xml(file).is_valid:
             stix_package = STIXPackage.from_xml(file)
@@ -92,7 +92,7 @@ class STIX1Parser:
         collections: Union[list, str] = "*",
         collection_management_uri: str = None,
         **kwargs,
-    ) -> List[IOC_V2]:
+    ) -> List[IOCRecord]:
         """Parsing a TAXII Server
 
         It uses the default discovery services and it finds the Feed Management Service
@@ -109,36 +109,118 @@ class STIX1Parser:
                 support content range.
 
         Returns:
-            List[IOC_V2]: List of parsed Indicators into IOCs
+            List[IOCRecord]: List of parsed Indicators into IOCs
+        """
+        iocs = list(self.iter_taxii_server(client, collections, collection_management_uri, **kwargs))
+        self.iocs += iocs
+        return self.iocs
+
+    def iter_taxii_server(
+        self,
+        client: Union[Client11, Client10],
+        collections: Union[list, str] = "*",
+        collection_management_uri: str = None,
+        **kwargs,
+    ) -> Iterator[IOCRecord]:
+        """Lazily parsing a TAXII Server
+
+        Same as `parse_taxii_server`, but the IOCs are yielded block by block as they are
+        polled from the server, so the whole collection is never held in memory.
+
+        Args:
+            client (Union[Client11, Client10]): authenticated cabby client
+            collections (list | str): the list of collections to be gathered
+            collection_management_uri (str): the uri for the collection management
+            **kwargs (dict): commonly used for `begin_date` and `end_date` to
+                support content range.
+
+        Yields:
+            IOCRecord: parsed Indicators into IOCs
+        """
+        for _, blocks in self.iter_taxii_collections(client, collections, collection_management_uri, **kwargs):
+            for iocs in blocks:
+                yield from iocs
+
+    def iter_taxii_collections(
+        self,
+        client: Union[Client11, Client10],
+        collections: Union[list, str] = "*",
+        collection_management_uri: str = None,
+        **kwargs,
+    ) -> Iterator[Tuple[str, Iterator[List[IOCRecord]]]]:
+        """Lazily parsing a TAXII Server collection by collection and block by block
+
+        A collection is not polled until its blocks are iterated, so a collection
+        can be skipped without polling it.
+
+        Args:
+            client (Union[Client11, Client10]): authenticated cabby client
+            collections (list | str): the list of collections to be gathered
+            collection_management_uri (str): the uri for the collection management
+            **kwargs (dict): commonly used for `begin_date` and `end_date` to
+                support content range.
+
+        Yields:
+            Tuple[str, Iterator[List[IOCRecord]]]: the name of the collection and the parsed IOCs of its blocks
         """
         # `get_collections` needs management path
         collections_to_gather = self._get_collections(
             client.get_collections(uri=collection_management_uri), collections
         )
         for collection_name in collections_to_gather:
-            content_block = client.poll(collection_name, **kwargs)
-            for block in content_block:
-                try:
-                    xml_content = etree.parse(BytesIO(block.content))
-                    stix_package = STIXPackage.from_xml(xml_content)
-
-                    indicators = stix_package.indicators
-                    observables = stix_package.observables
-
-                    if indicators and len(indicators) > 0:
-                        self._parse_stix_indicators(indicators)
-                    elif observables and len(observables) > 0:
-                        self._parse_stix_observable(observables)
-
-                except XMLSyntaxError as e:
-                    # Sometimes there is a invalid block of XML
-                    logger.exception(msg=e)
-                    logger.error(f"XMLSyntaxError occurred at {stix_package} with XML Content: {xml_content}")
-                except Exception as e:
-                    # Sometimes there is an error within the STIX parsing
-                    # such as `GDSParseError` but it can be different.
-                    logger.exception(msg=e)
-        return self.iocs
+            yield collection_name, self._iter_collection_blocks(client, collection_name, **kwargs)
+
+    def _iter_collection_blocks(
+        self, client: Union[Client11, Client10], collection_name: str, **kwargs
+    ) -> Iterator[List[IOCRecord]]:
+        """Polling a collection and parsing its content blocks one by one
+
+        The parsed iocs of the earlier calls stay in `self.iocs`, only the iocs of the block are yielded.
+
+        Args:
+            client (Union[Client11, Client10]): authenticated cabby client
+            collection_name (str): the name of the collection
+            **kwargs (dict): commonly used for `begin_date` and `end_date`
+
+        Yields:
+            List[IOCRecord]: the parsed IOCs of a block
+        """
+        content_block = client.poll(collection_name, **kwargs)
+        for block in content_block:
+            parsed_iocs, self.iocs = self.iocs, []
+            try:
+                self._parse_block(block)
+                block_iocs = self.iocs
+            finally:
+                self.iocs = parsed_iocs
+            yield block_iocs
+
+    def _parse_block(self, block) -> None:
+        """Parsing a content block into `self.iocs`
+
+        Args:
+            block: The content block polled from the server
+        """
+        try:
+            xml_content = etree.parse(BytesIO(block.content))
+            stix_package = STIXPackage.from_xml(xml_content)
+
+            indicators = stix_package.indicators
+            observables = stix_package.observables
+
+            if indicators and len(indicators) > 0:
+                self._parse_stix_indicators(indicators)
+            elif observables and len(observables) > 0:
+                self._parse_stix_observable(observables)
+
+        except XMLSyntaxError as e:
+            # Sometimes there is a invalid block of XML
+            logger.exception(msg=e)
+            logger.error(f"XMLSyntaxError occurred at {stix_package} with XML Content: {xml_content}")
+        except Exception as e:
+            # Sometimes there is an error within the STIX parsing
+            # such as `GDSParseError` but it can be different.
+            logger.exception(msg=e)
 
     def _parse_stix_observable(self, observables: Observables) -> None:
         """Parsing a STIX Observable object into list of IOCs
@@ -153,9 +235,7 @@ class STIX1Parser:
                 parser = self.CB_MAPPINGS[type(observable_props)](observable_props)
                 ioc_dict = parser.parse()  # type: ignore
                 if ioc_dict:
-                    ioc_id = str(uuid.uuid4())
-                    ioc = IOC_V2(self.cbcapi, ioc_id, ioc_dict)
-                    self.iocs.append(ioc)
+                    self.iocs.append(IOCRecord.from_dict(ioc_dict))
             except KeyError:
                 # If there is not parser for that object
                 return None
@@ -174,6 +254,7 @@ class STIX1Parser:
             if not indicator.observable:
                 return None
             logger.info(f"Parsing {indicator.id_}")
+            start = len(self.iocs)
             try:
                 if (
                     hasattr(indicator.observable, "observable_composition")
@@ -195,6 +276,30 @@ class STIX1Parser:
                 return None
             except AttributeError:
                 continue
+            finally:
+                rank = self._indicator_rank(indicator)
+                for ioc in self.iocs[start:]:
+                    set_rank(ioc, **rank)
+
+    @staticmethod
+    def _indicator_rank(indicator) -> dict:
+        """The recency and the confidence of an Indicator, the IOCs created from it are ranked by them
+
+        Args:
+            indicator (Indicator): Indicator object that comes from `STIXPackage`
+
+        Returns:
+            dict: The `timestamp`, the `confidence` and the `first_seen` of the IOCs
+                (see `cbc_importer.ranking.IOCRank`)
+        """
+        confidence = getattr(indicator, "confidence", None)
+        value = str(getattr(confidence, "value", None) or "").lower()
+        timestamp = latest_timestamp(getattr(indicator, "timestamp", None))
+        return {
+            "timestamp": timestamp,
+            "confidence": STIX1_CONFIDENCE.get(value, 0),
+            "first_seen": timestamp,
+        }
 
     def _create_ioc_from_observable_props(self, observable_props: Union[Address, DomainName, File, URI]) -> None:
         """Creates an IOC from observable properties
@@ -204,10 +309,8 @@ class STIX1Parser:
         """
         parser = self.CB_MAPPINGS[type(observable_props)](observable_props)
         ioc_dict = parser.parse()  # type: ignore
-        ioc_id = str(uuid.uuid4())
         if ioc_dict:
-            ioc = IOC_V2(self.cbcapi, ioc_id, ioc_dict)
-            self.iocs.append(ioc)
+            self.iocs.append(IOCRecord.from_dict(ioc_dict))
 
     @staticmethod
     def _get_collections(client_collections: List[Collection], collections: Union[list, str]) -> list:
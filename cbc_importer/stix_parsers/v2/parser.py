@@ -12,12 +12,11 @@
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
 
 import logging
-from typing import List, Union
+from typing import Iterator, List, Tuple, Union
 
 import stix2
 import taxii2client
 from cbc_sdk import CBCloudAPI
-from cbc_sdk.enterprise_edr import IOC_V2
 from stix2 import Indicator
 from stix2 import parse as stix2parse
 from stix2.exceptions import InvalidValueError
@@ -26,6 +25,8 @@ from stix2validator import validate_file
 from stix2validator import print_results
 from taxii2client import as_pages
 
+from cbc_importer.ranking import latest_timestamp, set_rank
+from cbc_importer.records import IOCRecord
 from cbc_importer.stix_parsers.v2.pattern_parser import STIXPatternParser
 
 logger = logging.getLogger(__name__)
@@ -33,7 +34,7 @@ logger = logging.getLogger(__name__)
 
 class STIX2Parser:
     """Parser for translating STIX Indicator
-    objects to `cbc_sdk.enterprise_edr.IOC_V2`.
+    objects to `cbc_importer.records.IOCRecord`.
 
     The parser can be used for 2.0 and 2.1
     by default it uses the 2.1 version.
@@ -47,7 +48,7 @@ class STIX2Parser:
         self.stix_version = stix_version
         self.cbcapi = cbcapi
 
-    def parse_file(self, file: str) -> List[IOC_V2]:
+    def parse_file(self, file: str) -> List[IOCRecord]:
         """Parsing STIX 2.0 and 2.1 content
 
         Args:
@@ -58,7 +59,7 @@ class STIX2Parser:
             ValueError: If STIX version is unsupported.
 
         Returns:
-            List[IOC_V2]: of parsed STIX Objects into IOCs.
+            List[IOCRecord]: of parsed STIX Objects into IOCs.
         """
         logger.info(f"Parsing a file {file}")
         if self.stix_version == "2.1" or self.stix_version == "2.0":
@@ -81,7 +82,7 @@ class STIX2Parser:
         server: taxii2client.Server,
         gather_data: Union[str, List[dict]] = "*",
         **kwargs,
-    ) -> List[IOC_V2]:
+    ) -> List[IOCRecord]:
         """Parsing a TAXII Server with STIX 2.0 and 2.1 data
 
         The structure of the `gather_data` follows:
@@ -124,16 +125,73 @@ class STIX2Parser:
                 kwarg which will query the server with specific time frame results.
 
         Returns:
-            List[IOC_V2]: of parsed STIX Objects into IOCs.
+            List[IOCRecord]: of parsed STIX Objects into IOCs.
+        """
+        return list(self.iter_taxii_server(server, gather_data, **kwargs))
+
+    def iter_taxii_server(
+        self,
+        server: taxii2client.Server,
+        gather_data: Union[str, List[dict]] = "*",
+        **kwargs,
+    ) -> Iterator[IOCRecord]:
+        """Lazily parsing a TAXII Server with STIX 2.0 and 2.1 data
+
+        Same as `parse_taxii_server`, but the IOCs are yielded page by page as they are
+        received from the server, so the whole collection is never held in memory.
+
+        Args:
+            server (taxii2client.Server): Initialized instance of a `taxii2client.Server` class.
+            gather_data (str | List[dict]): String or dict representing what data will be gathered.
+            **kwargs (dict): Dictionary to be provided in `as_pages`.
+
+        Yields:
+            IOCRecord: parsed STIX Objects into IOCs.
+        """
+        for _, pages in self.iter_taxii_collections(server, gather_data, **kwargs):
+            for iocs in pages:
+                yield from iocs
+
+    def iter_taxii_collections(
+        self,
+        server: taxii2client.Server,
+        gather_data: Union[str, List[dict]] = "*",
+        **kwargs,
+    ) -> Iterator[Tuple[str, Iterator[List[IOCRecord]]]]:
+        """Lazily parsing a TAXII Server collection by collection and page by page
+
+        Nothing is requested from a collection until its pages are iterated, so a collection
+        can be skipped without polling it.
+
+        Args:
+            server (taxii2client.Server): Initialized instance of a `taxii2client.Server` class.
+            gather_data (str | List[dict]): String or dict representing what data will be gathered.
+            **kwargs (dict): Dictionary to be provided in `as_pages`.
+
+        Yields:
+            Tuple[str, Iterator[List[IOCRecord]]]: the key of the collection and the parsed IOCs of its pages
         """
-        iocs = []
         collections_to_gather = self._gather_collections(server.api_roots, gather_data)
-        for collection in collections_to_gather:
-            for bundle in as_pages(collection.get_objects, per_request=500, **kwargs):
-                if bundle:
-                    stix_content = stix2parse(bundle, allow_custom=True, version=self.stix_version)
-                    iocs += self._parse_stix_objects(stix_content)
-        return iocs
+        for position, collection in enumerate(collections_to_gather):
+            key = getattr(collection, "url", None) or f"{position}/{collection.id}"
+            yield key, self._iter_collection_pages(collection, **kwargs)
+
+    def _iter_collection_pages(self, collection: taxii2client.Collection, **kwargs) -> Iterator[List[IOCRecord]]:
+        """Parsing the pages of a collection
+
+        Args:
+            collection (taxii2client.Collection): The collection
+            **kwargs (dict): Dictionary to be provided in `as_pages`.
+
+        Yields:
+            List[IOCRecord]: the parsed IOCs of a page
+        """
+        for bundle in as_pages(collection.get_objects, per_request=500, **kwargs):
+            if bundle:
+                stix_content = stix2parse(bundle, allow_custom=True, version=self.stix_version)
+                yield self._parse_stix_objects(stix_content)
+            else:
+                yield []
 
     def _gather_collections(
         self,
@@ -213,14 +271,14 @@ class STIX2Parser:
 
         return collections_to_gather
 
-    def _parse_stix_objects(self, stix_content: stix2.Bundle) -> List[IOC_V2]:
+    def _parse_stix_objects(self, stix_content: stix2.Bundle) -> List[IOCRecord]:
         """Parser for `stix2.Indicator`.
 
         Args:
             stix_content (stix2.Bundle): STIX Bundle Object containing the STIX Objects
 
         Returns:
-            List[IOC_V2]: of parsed STIX Objects into IOCs.
+            List[IOCRecord]: of parsed STIX Objects into IOCs.
         """
         iocs = []
         # Sometimes the Bundle doesn't have `objects`
@@ -231,8 +289,8 @@ class STIX2Parser:
                     iocs += self._parse_stix_indicator(stix_obj)
         return iocs
 
-    def _parse_stix_indicator(self, indicator: Indicator) -> List[IOC_V2]:
-        """Parsing a single STIX Indicator object into `IOC_V2`.
+    def _parse_stix_indicator(self, indicator: Indicator) -> List[IOCRecord]:
+        """Parsing a single STIX Indicator object into `IOCRecord`.
 
         Note: Sometimes there is more than one key:value in a single Indicator pattern
         this is why we return List here.
@@ -241,7 +299,7 @@ class STIX2Parser:
             indicator (stix2.Indicator): STIX Indicator Object.
 
         Returns:
-            List[IOC_V2]: of parsed STIX Objects into IOCs.
+            List[IOCRecord]: of parsed STIX Objects into IOCs.
         """
         logger.info(f"Parsing {indicator.id}")
         iocs = []
@@ -251,6 +309,14 @@ class STIX2Parser:
         except InvalidValueError:
             logger.warn(f"Indicator {indicator.id} has invalid pattern.")
             return []
+        timestamp = latest_timestamp(
+            getattr(indicator, "created", None),
+            getattr(indicator, "modified", None),
+            getattr(indicator, "valid_from", None),
+        )
+        first_seen = latest_timestamp(getattr(indicator, "created", None) or getattr(indicator, "valid_from", None))
+        confidence = getattr(indicator, "confidence", None) or 0
         for ioc in stix_pattern_parser.matched_iocs:
-            iocs.append(IOC_V2.create_equality(self.cbcapi, indicator.id, ioc["field"], ioc["value"]))
+            record = IOCRecord.create_equality(indicator.id, ioc["field"], ioc["value"])
+            iocs.append(set_rank(record, timestamp=timestamp, confidence=confidence, first_seen=first_seen))
         return iocs
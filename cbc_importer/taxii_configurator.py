@@ -11,12 +11,29 @@
 # * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
 
-from typing import Union
+from typing import Dict, List, Union
 
 import arrow
 from cabby import Client10, Client11
 from taxii2client.v20 import Server as Client20
 from taxii2client.v21 import Server as Client21
+from typer import BadParameter
+
+from cbc_importer.importer import LAYOUT_SEQUENTIAL, LAYOUT_TIERED, TIME_LAYOUTS
+from cbc_importer.utils import (
+    validate_layout,
+    validate_positive_int,
+    validate_priority,
+    validate_size_limit,
+)
+
+# The options of the feed which are counts, with their names in the errors
+COUNT_OPTIONS = {
+    "workers": "Workers",
+    "retention_days": "Retention days",
+    "max_delta_reports": "Max delta reports",
+    "merge_values": "Merge values",
+}
 
 
 class TAXIIConfigurator:
@@ -35,6 +52,8 @@ class TAXIIConfigurator:
         self.version = self._configuration["version"]
         self.server_name = self._configuration["name"]
         self.enabled = self._configuration["enabled"]
+        self.priority = 0
+        self.partitioned = False
         self.cbc_feed_options = {}
         self.search_options = {}
         self.client = self._get_client()
@@ -44,6 +63,7 @@ class TAXIIConfigurator:
         self._authenticate_client()
         self._set_search_options()
         self._set_cbc_feed_options()
+        self._set_priority()
 
     def _get_client(self) -> Union[Client10, Client11, Client20, Client21]:
         """Getting the correct TAXII Client
@@ -81,8 +101,83 @@ class TAXIIConfigurator:
             self.search_options["gather_data"] = self._configuration["options"]["roots"]
 
     def _set_cbc_feed_options(self) -> None:
-        """Setting the CBC Feed Options"""
-        self.cbc_feed_options = self._configuration["cbc_feed_options"]
+        """Setting the CBC Feed Options
+
+        Raises:
+            ValueError: If an option is not valid
+        """
+        self.cbc_feed_options = dict(self._configuration["cbc_feed_options"])
+        self.partitioned = self.cbc_feed_options.pop("partitioned", False)
+        options = self.cbc_feed_options
+        layout = options.get("layout", LAYOUT_SEQUENTIAL)
+        try:
+            validate_layout(layout)
+            for option, name in COUNT_OPTIONS.items():
+                if option in options:
+                    validate_positive_int(name)(options[option])
+            for option in ("max_report_bytes", "max_request_bytes"):
+                if option in options:
+                    validate_size_limit(options[option])
+            if options.get("overflow_shards") and layout != LAYOUT_SEQUENTIAL:
+                raise BadParameter("The overflow shards need the `sequential` layout")
+            if "retention_days" in options and layout not in TIME_LAYOUTS:
+                raise BadParameter("The retention needs the `daily` or the `weekly` layout")
+            if "max_delta_reports" in options and layout != LAYOUT_TIERED:
+                raise BadParameter("The delta reports need the `tiered` layout")
+            if "merge_values" in options:
+                if layout not in (LAYOUT_SEQUENTIAL, LAYOUT_TIERED) or options.get("overflow_shards"):
+                    raise BadParameter(
+                        "Merging the IOCs needs the `sequential` or `tiered` layout and no overflow shards"
+                    )
+            if self.partitioned:
+                if layout != LAYOUT_SEQUENTIAL:
+                    raise BadParameter("The partitions need the `sequential` layout")
+                if options.get("overflow_shards"):
+                    raise BadParameter("The partitions and the overflow shards cannot be used together")
+        except BadParameter as e:
+            raise ValueError(f"Invalid `cbc_feed_options` of {self.server_name}: {e}")
+
+    @staticmethod
+    def check_shared_feeds(configurators: List["TAXIIConfigurator"]) -> None:
+        """Check the servers that import into the same feed agree on how the feed is imported.
+
+        The servers sharing a feed are merged into a single upload, so they need the same `cbc_feed_options`.
+        A partitioned server shares its feed only with other partitioned servers, the uploads of the other
+        servers would replace or re-pack the reports of its partitions.
+
+        Args:
+            configurators (List[TAXIIConfigurator]): The configurations of the servers
+
+        Raises:
+            ValueError: If two servers share a feed with conflicting options
+        """
+        by_feed: Dict[str, TAXIIConfigurator] = {}
+        for configurator in configurators:
+            feed_id = configurator.cbc_feed_options.get("feed_id")
+            if not feed_id:
+                continue
+            first = by_feed.setdefault(feed_id, configurator)
+            if configurator.partitioned != first.partitioned:
+                raise ValueError(
+                    f"{first.server_name} and {configurator.server_name} import into feed {feed_id}, "
+                    "but only one of them is partitioned"
+                )
+            if not configurator.partitioned and configurator.cbc_feed_options != first.cbc_feed_options:
+                raise ValueError(
+                    f"{first.server_name} and {configurator.server_name} import into feed {feed_id}, "
+                    "but their `cbc_feed_options` differ"
+                )
+
+    def _set_priority(self) -> None:
+        """Setting the priority of the server, its IOCs are kept first when a feed is full
+
+        Raises:
+            ValueError: If the priority is not valid
+        """
+        try:
+            self.priority = validate_priority(self._configuration.get("priority", 0))
+        except BadParameter as e:
+            raise ValueError(f"Invalid `priority` of {self.server_name}: {e}")
 
     def _set_default_time_range_taxii1(self) -> None:
         """Setting the default time range for TAXII 1 Server"""
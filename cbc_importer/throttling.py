@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Rate limiting of the requests to CBC"""
+import logging
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+from cbc_sdk import CBCloudAPI
+
+logger = logging.getLogger(__name__)
+
+# The rate limiters of the CBCloudAPI instances, so all of the calls through an instance share one
+_LIMITERS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+class RateLimiter:
+    """Token bucket with an adaptive (AIMD) limit of the concurrent requests.
+
+    Every request takes a token from the bucket, which refills at `rate` tokens per second up to `burst`,
+    and a slot from the concurrency limit. After the request:
+
+    - a 429 response halves both the rate and the concurrency limit and, if the server sent `Retry-After`,
+      pauses all of the requests until then;
+    - a response slower than `latency_target` halves the concurrency limit;
+    - any other response increases the rate and the concurrency limit additively.
+
+    The limits are logged when they are decreased and at most every `LOG_INTERVAL` seconds when they
+    are increased, `metrics` returns their current values.
+    """
+
+    DECREASE_FACTOR = 0.5
+    LOG_INTERVAL = 60.0
+    # the smallest wait between the checks for a token, it absorbs the floating-point error of the refill
+    MIN_WAIT = 0.001
+
+    def __init__(
+        self,
+        rate: float = 25.0,
+        burst: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        concurrency: float = 4.0,
+        max_concurrency: float = 16.0,
+        latency_target: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """
+        Args:
+            rate (float): The starting number of requests per second
+            burst (float): (optional) The size of the token bucket, defaults to `rate`
+            max_rate (float): (optional) The highest rate it can grow to, defaults to four times `rate`
+            concurrency (float): The starting number of concurrent requests
+            max_concurrency (float): The highest number of concurrent requests
+            latency_target (float): The response time in seconds above which the concurrency is decreased
+            clock (Callable): The monotonic clock, used in tests
+            sleep (Callable): The sleep function, used in tests
+        """
+        self.rate = rate
+        self.min_rate = min(1.0, rate)
+        self.max_rate = max_rate or rate * 4
+        self.burst = burst or rate
+        self.concurrency = min(concurrency, max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._tokens = self.burst
+        self._paused_until = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._logged = self._updated
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a token and a free concurrency slot."""
+        with self._condition:
+            while self.in_flight >= int(self.concurrency):
+                self._condition.wait()
+            self.in_flight += 1
+
+        while True:
+            with self._condition:
+                now = self._clock()
+                self._refill(now)
+                wait = max(self._paused_until - now, 0.0)
+                if not wait and self._tokens >= 1 - 1e-9:
+                    self._tokens = max(self._tokens - 1, 0.0)
+                    self.requests += 1
+                    return
+                wait = wait or (1 - self._tokens) / self.rate
+            self._sleep(max(wait, self.MIN_WAIT))
+
+    def release(self, latency: float, status_code: Optional[int], retry_after: Optional[float] = None) -> None:
+        """Free the slot of a finished request and adapt the limits to its outcome.
+
+        Args:
+            latency (float): The response time in seconds
+            status_code (int): The status code of the response, None if there is no response
+            retry_after (float): (optional) The seconds to wait before the next request, from `Retry-After`
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if status_code == 429:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.DECREASE_FACTOR)
+                self.concurrency = max(1.0, self.concurrency * self.DECREASE_FACTOR)
+                self._tokens = min(self._tokens, 0.0)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, self._clock() + retry_after)
+                logger.warning(f"CBC is throttling the requests, lowering the limits: {self._format()}")
+            elif status_code is None or latency > self.latency_target:
+                self.concurrency = max(1.0, self.concurrency * self.DECREASE_FACTOR)
+                logger.info(f"CBC responds slowly ({latency:.2f}s), lowering the limits: {self._format()}")
+            else:
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                now = self._clock()
+                if now - self._logged >= self.LOG_INTERVAL:
+                    self._logged = now
+                    logger.info(f"CBC requests: {self._format()}")
+            self._condition.notify_all()
+
+    def metrics(self) -> dict:
+        """Return the current limits and counters.
+
+        Returns:
+            dict: The rate, the concurrency limit, the requests in flight and the counts of the
+                requests and the throttled responses
+        """
+        with self._condition:
+            return {
+                "rate": round(self.rate, 2),
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+            }
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens for the time passed since the last refill.
+
+        Args:
+            now (float): The current time of the clock
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _format(self) -> str:
+        """Format the current limits for the logs.
+
+        Returns:
+            str: The limits
+        """
+        return f"rate={self.rate:.2f}/s, concurrency={int(self.concurrency)}"
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse the `Retry-After` header, which is either seconds or an HTTP date.
+
+    Args:
+        value (str): The value of the header
+
+    Returns:
+        float | None: The seconds to wait, None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def install_rate_limiter(cb: CBCloudAPI, **kwargs) -> RateLimiter:
+    """Make all of the requests through a CBCloudAPI instance go through one shared rate limiter.
+
+    The limiter wraps the HTTP session of the instance, so it sees every request and the raw response,
+    including the status code and the headers, before the SDK turns the errors into exceptions.
+    Calling this again for the same instance returns the limiter that is already installed.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+        **kwargs: The arguments of `RateLimiter`
+
+    Returns:
+        RateLimiter: The rate limiter of the instance
+    """
+    if cb in _LIMITERS:
+        return _LIMITERS[cb]
+
+    limiter = RateLimiter(**kwargs)
+    _LIMITERS[cb] = limiter
+    session = getattr(getattr(cb, "session", None), "session", None)
+    if session is None:
+        # nothing to throttle if the instance does not make HTTP requests (e.g. it is mocked)
+        return limiter
+
+    send = session.request
+
+    def request(method, url, **request_kwargs):
+        limiter.acquire()
+        start = time.monotonic()
+        status_code, retry_after = None, None
+        try:
+            response = send(method, url, **request_kwargs)
+            status_code = response.status_code
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            return response
+        finally:
+            limiter.release(time.monotonic() - start, status_code, retry_after)
+
+    session.request = request
+    return limiter
+
+
+def get_rate_limiter(cb: CBCloudAPI) -> Optional[RateLimiter]:
+    """Return the rate limiter installed for a CBCloudAPI instance.
+
+    Args:
+        cb (CBCloudAPI): A reference to the CBCloudAPI object.
+
+    Returns:
+        RateLimiter | None: The rate limiter or None if there is no limiter installed
+    """
+    return _LIMITERS.get(cb)
@@ -12,7 +12,7 @@
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
 
 """CBC Helpers"""
-from typing import List, Union
+from typing import Callable, List, Literal, Union, overload
 
 import arrow
 import validators
@@ -25,6 +25,8 @@ from cbc_sdk.errors import (
 )
 from typer import BadParameter
 
+from cbc_importer.feed_cache import get_feed_cache
+
 """Feed Helpers"""
 
 
@@ -52,8 +54,19 @@ def create_feed(
     builder = Feed.create(cb, name, provider_url, summary, category)
     if reports:
         builder.add_reports(reports)
-    feed = builder.build()
-    return feed.save()
+    feed = builder.build().save()
+    get_feed_cache(cb).add_feed(feed)
+    return feed
+
+
+@overload
+def get_feed(cb: CBCloudAPI, feed_name: str = None, feed_id: str = None, return_all: Literal[False] = False) -> Feed:
+    ...
+
+
+@overload
+def get_feed(cb: CBCloudAPI, feed_name: str = None, feed_id: str = None, *, return_all: Literal[True]) -> List[Feed]:
+    ...
 
 
 def get_feed(
@@ -61,6 +74,9 @@ def get_feed(
 ) -> Union[Feed, List[Feed]]:
     """Return Feed by providing either feed name or feed id.
 
+    The feeds found by id are cached for the run, the feed names are looked up in an index of the feeds
+    which is built once per run (see `feed_cache.FeedIndex`).
+
     Args:
         cb (CBCloudAPI): A reference to the CBCloudAPI object.
         feed_name (str): Feed name
@@ -76,14 +92,15 @@ def get_feed(
         ValueError: neither feed_name nor feed_id is provided
     """
     if feed_id:
-        return cb.select(Feed, feed_id)
+        return get_feed_cache(cb).get_feed(cb, feed_id)
     elif feed_name:
+        index = get_feed_cache(cb).get_index(cb)
         if return_all:
             # if all feeds with specific base name are needed
-            return [feed for feed in cb.select(Feed) if feed.name.startswith(feed_name)]
+            return [Feed(cb, initial_data=info) for info in index.prefix(feed_name)]
 
         # otherwise, check for feed with specific name
-        feeds = [feed for feed in cb.select(Feed) if feed.name == feed_name]
+        feeds = [Feed(cb, initial_data=info) for info in index.exact(feed_name)]
 
         if not feeds:
             raise ObjectNotFoundError("No feeds named '{}'".format(feed_name))
@@ -155,6 +172,79 @@ def validate_severity(value: int) -> int:
     raise BadParameter("Severity must be between 1-10")
 
 
+def validate_layout(value: str) -> str:
+    """Validating the layout of the reports
+
+    Args:
+        value (str): The name of the layout
+
+    Raises:
+        BadParameter: Whenever the layout is not supported
+
+    Returns:
+        str: The name of the layout
+    """
+    # imported here, the importer depends on this module
+    from cbc_importer.importer import LAYOUTS
+
+    if value in LAYOUTS:
+        return value
+    raise BadParameter(f"Layout must be one of: {', '.join(LAYOUTS)}")
+
+
+def validate_positive_int(name: str) -> Callable[[int], int]:
+    """Make the validator of an option which is a count, like the number of workers
+
+    Args:
+        name (str): The name of the option, used in the error message
+
+    Returns:
+        Callable[[int], int]: The validator, it raises BadParameter whenever the value is not an integer
+            or it is less than 1
+    """
+
+    def validate(value: int) -> int:
+        if isinstance(value, int) and not isinstance(value, bool) and value >= 1:
+            return value
+        raise BadParameter(f"{name} must be at least 1")
+
+    return validate
+
+
+def validate_priority(value: int) -> int:
+    """Validating the priority of a source
+
+    Args:
+        value (int): The priority
+
+    Raises:
+        BadParameter: Whenever the value is not an integer
+
+    Returns:
+        int: The priority
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise BadParameter("Priority must be an integer")
+
+
+def validate_size_limit(value: int) -> int:
+    """Validating a size limit in bytes
+
+    Args:
+        value (int): The size limit
+
+    Raises:
+        BadParameter: Whenever the value is not an integer or it is less than 1024
+
+    Returns:
+        int: int greater than or equal to 1024
+    """
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 1024:
+        return value
+    raise BadParameter("Size limits must be at least 1024 bytes")
+
+
 def transform_date(value: str) -> arrow.Arrow:
     """Transform a str date to Arrow object
 
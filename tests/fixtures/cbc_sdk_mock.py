@@ -38,6 +38,7 @@ class CBCSDKMock:
         monkeypatch.setattr(api, "put_object", self._self_put_object())
         monkeypatch.setattr(api, "delete_object", self._self_delete_object())
         monkeypatch.setattr(api, "api_json_request", self._self_patch_object())
+        monkeypatch.setattr(api.session, "http_request", self._self_http_request())
 
     class StubResponse(object):
         """Stubbed response to object to support json function similar to requests package"""
@@ -264,3 +265,14 @@ class CBCSDKMock:
             pytest.fail("PATCH called for %s when it shouldn't be" % url)
 
         return _patch_object
+
+    def _self_http_request(self):
+        def _http_request(method, url, headers=None, data=None, **kwargs):
+            # the streamed bodies are joined and decoded, so they reach the same mocks as `post_object`
+            if method == "POST" and data is not None:
+                raw_data = b"".join(data)
+                assert len(raw_data) == len(data), "Content-Length does not match the streamed body"
+                return self._self_post_object()(url, json.loads(raw_data))
+            pytest.fail("HTTP %s called for %s when it shouldn't be" % (method, url))
+
+        return _http_request
@@ -277,6 +277,10 @@ REPORT_WITH_998_IOCS = {
     "title": "Report My STIX Feed",
     "iocs_v2": [IOC for i in range(998)],
     "iocs_total_count": 998,
+    "timestamp": 1643305793,
+    "id": "5d8e4b1c-6b5d-4bd2-9a3d-2b0b7f2c9a10",
 }
 
-REPORTS_GET_2_WITH_998_IOCS_1_1000 = {"results": [REPORT_WITH_998_IOCS, REPORT_WITH_1000_IOCS, REPORT_WITH_998_IOCS]}
+REPORT_WITH_998_IOCS_2 = dict(REPORT_WITH_998_IOCS, id="8c1f0e7a-2f4b-4c8e-b6d1-4e9a7c3b5d22")
+
+REPORTS_GET_2_WITH_998_IOCS_1_1000 = {"results": [REPORT_WITH_998_IOCS, REPORT_WITH_1000_IOCS, REPORT_WITH_998_IOCS_2]}
@@ -10,20 +10,29 @@
 # * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
 # * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
 # * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+import json
 import logging
 from pathlib import Path
 from unittest.mock import MagicMock, Mock, patch
 
+from cbc_sdk.enterprise_edr import IOC_V2
 from typer.testing import CliRunner
 
 from cbc_importer import __version__
 from cbc_importer.cli.connector import (
     cli,
+    group_servers,
+    process_journaled_server,
+    process_merged_servers,
     process_stix1_file,
     process_stix2_file,
     process_taxii1_server,
     process_taxii2_server,
 )
+from cbc_importer.importer import UploadPlan
+from cbc_importer.journal import ImportJournal
+from cbc_importer.ranking import get_rank
+from cbc_importer.records import ioc_raw_data
 from tests.fixtures import cbc_sdk_mock
 
 runner = CliRunner()
@@ -140,6 +149,12 @@ def test_process_file_xml(_, process_stix1_file):
             "feed_id": "55IOVthAZgmQHgr8eRF9rA",
             "severity": 5,
             "replace": True,
+            "sync": False,
+            "layout": "sequential",
+            "workers": 1,
+            "max_report_bytes": 1048576,
+            "max_request_bytes": 16777216,
+            "overflow_shards": False,
             "cb": cbc_sdk_mock,
         }
     )
@@ -156,11 +171,31 @@ def test_process_file_json(_, process_stix2_file):
             "feed_id": "55IOVthAZgmQHgr8eRF9rA",
             "severity": 5,
             "replace": True,
+            "sync": False,
+            "layout": "sequential",
+            "workers": 1,
+            "max_report_bytes": 1048576,
+            "max_request_bytes": 16777216,
+            "overflow_shards": False,
             "cb": cbc_sdk_mock,
         }
     )
 
 
+@patch("cbc_importer.cli.connector.process_stix2_file")
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+def test_process_file_plan(_, process_stix2_file, tmp_path):
+    """Testing the CLI command `process-file` with `--plan` writes the plan of the upload"""
+    plan_file = tmp_path / "plan.json"
+    result = runner.invoke(
+        cli, ["process-file", "./stix_file.json", "55IOVthAZgmQHgr8eRF9rA", "--plan", str(plan_file)]
+    )
+
+    assert result.exit_code == 0
+    assert isinstance(process_stix2_file.call_args.kwargs["plan"], UploadPlan)
+    assert json.loads(plan_file.read_text())["totals"]["api_calls"] == 0
+
+
 @patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
 def test_process_file_raises_sys_exit(_, caplog):
     """Testing the CLI command `process-file` (Invalid Extension)"""
@@ -185,6 +220,40 @@ def test_create_feed_not_quiet(_, utils_create_feed):
     utils_create_feed.assert_called()
 
 
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+@patch(
+    "cbc_importer.cli.connector.importer_compact_feed",
+    return_value={
+        "reports_before": 4,
+        "reports_after": 2,
+        "fill_before": 0.375,
+        "fill_after": 0.75,
+        "updated": 1,
+        "deleted": 2,
+        "unchanged": 1,
+        "duplicates": 3,
+    },
+)
+def test_compact_feed_dry_run(importer_compact_feed, _):
+    """Testing the CLI command `compact-feed` (dry run)"""
+    result = runner.invoke(cli, ["compact-feed", "55IOVthAZgmQHgr8eRF9rA", "--dry-run"])
+    assert result.exit_code == 0
+    importer_compact_feed.assert_called_with(
+        cbc_sdk_mock, "55IOVthAZgmQHgr8eRF9rA", dry_run=True, workers=1, max_report_bytes=1048576
+    )
+    assert "Reports before: 4 (37.5% full on average)" in result.stdout
+    assert "Reports after: 2 (75.0% full on average)" in result.stdout
+    assert "Reports to update: 1, to delete: 2, duplicated IOCs: 3" in result.stdout
+
+
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+@patch("cbc_importer.cli.connector.importer_compact_feed", side_effect=ValueError("The layout is not compacted"))
+def test_compact_feed_refused(*args):
+    """Testing the CLI command `compact-feed` fails for a feed whose layout is not compacted"""
+    result = runner.invoke(cli, ["compact-feed", "55IOVthAZgmQHgr8eRF9rA"])
+    assert result.exit_code == 1
+
+
 @patch("cbc_importer.cli.connector.CBCloudAPI")
 @patch("cbc_importer.cli.connector.utils_create_watchlist", return_value=Mock(id="90TuDxDYQtiGyg5qhwYCg"))
 def test_create_watchlist_quiet(*args, **kwargs):
@@ -235,7 +304,7 @@ def test_process_stix2_file(process_iocs, stix2_parser, caplog):
 def test_process_taxii1_server(process_iocs, stix1_parser, caplog):
     """Testing if the functions is calling the right callables."""
     with caplog.at_level(logging.INFO):
-        process_taxii1_server(MagicMock(), 1)
+        process_taxii1_server(MagicMock(partitioned=False), 1)
         process_iocs.assert_called()
         stix1_parser.assert_called()
         assert "Successfully imported " in caplog.text
@@ -246,7 +315,187 @@ def test_process_taxii1_server(process_iocs, stix1_parser, caplog):
 def test_process_taxii2_server(process_iocs, stix2_parser, caplog):
     """Testing if the functions is calling the right callables."""
     with caplog.at_level(logging.INFO):
-        process_taxii2_server(MagicMock(), 1)
+        process_taxii2_server(MagicMock(partitioned=False), 1)
         process_iocs.assert_called()
         stix2_parser.assert_called()
         assert "Successfully imported " in caplog.text
+
+
+@patch("cbc_importer.cli.connector.process_stix2_file")
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+def test_process_file_invalid_layout(_, process_stix2_file):
+    """Testing the CLI command `process-file` (Invalid Layout)"""
+    result = runner.invoke(cli, ["process-file", "./stix_file.json", "55IOVthAZgmQHgr8eRF9rA", "-l", "random"])
+    assert result.exit_code != 0
+    process_stix2_file.assert_not_called()
+
+
+@patch("cbc_importer.cli.connector.process_iocs")
+def test_process_journaled_server(process_iocs, cbcsdk_mock, tmp_path):
+    """Testing the IOCs are loaded from the journal, which is deleted afterwards."""
+    journal = ImportJournal.open(tmp_path, "Test", {})
+    iocs = [IOC_V2.create_equality(cbcsdk_mock.api, "ioc", "netconn_ipv4", "1.1.1.1")]
+    server_config = MagicMock(
+        cbc_feed_options={"feed_id": "feedid", "severity": 5, "replace": False}, partitioned=False
+    )
+    imported = []
+    process_iocs.side_effect = lambda cb, iocs, **kwargs: imported.extend(ioc_raw_data(ioc) for ioc in iocs)
+
+    process_journaled_server(server_config, cbcsdk_mock.api, iter([("collection", iter([iocs]))]), journal)
+
+    assert imported == [iocs[0]._info]
+    assert process_iocs.call_args.kwargs["journal"] is journal
+    assert not journal.directory.exists()
+
+
+@patch("cbc_importer.cli.connector.process_partitioned_iocs")
+def test_process_journaled_server_partitioned(process_partitioned_iocs, cbcsdk_mock, tmp_path):
+    """Testing the IOCs of a partitioned server are loaded from the journal collection by collection."""
+    journal = ImportJournal.open(tmp_path, "Test", {})
+    iocs = [IOC_V2.create_equality(cbcsdk_mock.api, "ioc", "netconn_ipv4", "1.1.1.1")]
+    server_config = MagicMock(
+        cbc_feed_options={"feed_id": "feedid", "severity": 5, "replace": True},
+        partitioned=True,
+        server_name="Test",
+        priority=0,
+    )
+    imported = {}
+
+    def on_process(cb, collections, **kwargs):
+        imported.update({key: [ioc_raw_data(ioc) for ioc in iocs] for key, iocs in collections})
+        return {"uploaded": 1, "deleted": 0, "unchanged": 0, "partitions_changed": 1, "dropped": 0}
+
+    process_partitioned_iocs.side_effect = on_process
+
+    process_journaled_server(server_config, cbcsdk_mock.api, iter([("collection", iter([iocs]))]), journal)
+
+    assert imported == {"collection": [iocs[0]._info]}
+    assert process_partitioned_iocs.call_args.kwargs["server_name"] == "Test"
+    assert process_partitioned_iocs.call_args.kwargs["journal"] is journal
+    assert not journal.directory.exists()
+
+
+def _merged_server(name, priority, feed_id="feedid", partitioned=False):
+    """A mocked configuration of a server"""
+    return MagicMock(
+        server_name=name,
+        priority=priority,
+        partitioned=partitioned,
+        cbc_feed_options={"feed_id": feed_id, "severity": 5, "replace": True},
+    )
+
+
+def test_group_servers():
+    """Testing the servers sharing a feed are grouped, in the order of the configuration."""
+    first, second, third = _merged_server("A", 0), _merged_server("B", 0, "other"), _merged_server("C", 0)
+    partitioned = _merged_server("D", 0, partitioned=True)
+    servers = [(first, {}), (second, {}), (third, {}), (partitioned, {})]
+
+    groups = group_servers(servers)
+
+    assert [[server.server_name for server, _ in group] for group in groups] == [["A", "C"], ["B"], ["D"]]
+
+
+@patch("cbc_importer.cli.connector.get_parser")
+@patch("cbc_importer.cli.connector.process_iocs")
+def test_process_merged_servers(process_iocs, get_parser, cbcsdk_mock):
+    """Testing the IOCs of the servers sharing a feed are uploaded once, the duplicates are kept once."""
+    api = cbcsdk_mock.api
+    low, high = _merged_server("Low", 0), _merged_server("High", 10)
+    iocs = {
+        low: [
+            IOC_V2.create_equality(api, "low-1", "netconn_ipv4", "1.1.1.1"),
+            IOC_V2.create_equality(api, "low-2", "netconn_ipv4", "2.2.2.2"),
+        ],
+        high: [IOC_V2.create_equality(api, "high-1", "netconn_ipv4", "1.1.1.1")],
+    }
+    get_parser.side_effect = lambda server_config, cb: MagicMock(
+        iter_taxii_server=MagicMock(return_value=iter(iocs[server_config]))
+    )
+    imported = []
+    process_iocs.side_effect = lambda cb, iocs, **kwargs: imported.extend(iocs)
+
+    process_merged_servers([low, high], api)
+
+    process_iocs.assert_called_once()
+    assert process_iocs.call_args.kwargs == {"journal": None, "plan": None, **low.cbc_feed_options}
+    assert [ioc.id for ioc in imported] == ["high-1", "low-2"]
+    assert [get_rank(ioc).source for ioc in imported] == ["High", "Low"]
+
+
+@patch("cbc_importer.cli.connector.get_parser")
+@patch("cbc_importer.cli.connector.process_iocs")
+def test_process_merged_servers_journaled(process_iocs, get_parser, cbcsdk_mock, tmp_path):
+    """Testing the IOCs of the merged servers are spooled with their source and the journal is deleted."""
+    api = cbcsdk_mock.api
+    journal = ImportJournal.open(tmp_path, "A+B", {})
+    first, second = _merged_server("A", 0), _merged_server("B", 0)
+    pages = {
+        first: [("collection", iter([[IOC_V2.create_equality(api, "a", "netconn_ipv4", "1.1.1.1")]]))],
+        second: [("collection", iter([[IOC_V2.create_equality(api, "b", "netconn_ipv4", "2.2.2.2")]]))],
+    }
+    get_parser.side_effect = lambda server_config, cb: MagicMock(
+        iter_taxii_collections=MagicMock(return_value=iter(pages[server_config]))
+    )
+    imported = []
+    process_iocs.side_effect = lambda cb, iocs, **kwargs: imported.extend(iocs)
+
+    process_merged_servers([first, second], api, journal)
+
+    assert {ioc.id: get_rank(ioc).source for ioc in imported} == {"a": "A", "b": "B"}
+    assert process_iocs.call_args.kwargs["journal"] is journal
+    assert not journal.directory.exists()
+
+
+@patch.object(Path, "read_text", return_value=None)
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+@patch("cbc_importer.cli.connector.process_taxii2_server")
+@patch("cbc_importer.cli.connector.process_merged_servers")
+@patch("yaml.safe_load")
+def test_process_server_merges_servers_sharing_a_feed(safe_load, process_merged_servers, process_taxii2_server, *args):
+    """Testing the CLI command `process-server` merges the servers that share a feed"""
+    servers = [
+        {
+            "name": name,
+            "version": 2.0,
+            "enabled": True,
+            "cbc_feed_options": {"replace": True, "severity": 5, "feed_id": feed_id},
+            "connection": {"url": "test.test"},
+            "proxies": None,
+            "auth": {"username": "guest", "password": "guest", "verify": True, "cert": None},
+            "options": {"added_after": "2022-01-01 00:00:00", "roots": "*"},
+        }
+        for name, feed_id in [("A", "feedid"), ("B", "otherfeed"), ("C", "feedid")]
+    ]
+    safe_load.return_value = {"cbc_auth_profile": "default", "servers": servers}
+    runner.invoke(cli, ["process-server", "--config-file", "./config.yml"])
+
+    process_merged_servers.assert_called_once()
+    assert [server.server_name for server in process_merged_servers.call_args.args[0]] == ["A", "C"]
+    assert process_taxii2_server.call_args.args[0].server_name == "B"
+
+
+@patch.object(Path, "read_text", return_value=None)
+@patch("cbc_importer.cli.connector.CBCloudAPI", return_value=cbc_sdk_mock)
+@patch("cbc_importer.cli.connector.process_merged_servers")
+@patch("yaml.safe_load")
+def test_process_server_conflicting_shared_feed(safe_load, process_merged_servers, *args):
+    """Testing the CLI command `process-server` refuses servers sharing a feed with different options"""
+    servers = [
+        {
+            "name": name,
+            "version": 2.0,
+            "enabled": True,
+            "cbc_feed_options": {"replace": replace, "severity": 5, "feed_id": "feedid"},
+            "connection": {"url": "test.test"},
+            "proxies": None,
+            "auth": {"username": "guest", "password": "guest", "verify": True, "cert": None},
+            "options": {"added_after": "2022-01-01 00:00:00", "roots": "*"},
+        }
+        for name, replace in [("A", True), ("B", False)]
+    ]
+    safe_load.return_value = {"cbc_auth_profile": "default", "servers": servers}
+    result = runner.invoke(cli, ["process-server", "--config-file", "./config.yml"])
+
+    assert isinstance(result.exception, ValueError)
+    process_merged_servers.assert_not_called()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the cache of the feeds and their reports."""
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+from cbc_sdk.errors import ObjectNotFoundError
+
+from cbc_importer.feed_cache import FeedIndex, get_feed_cache, get_reports, invalidate_feed, persist_feed_index
+from cbc_importer.importer import process_iocs, put_report
+from cbc_importer.utils import create_feed, get_feed
+from tests.fixtures.cbc_sdk_mock import CBCSDKMock
+from tests.fixtures.cbc_sdk_mock_responses import FEED_GET_RESP, REPORTS_GET_2_WITH_998_IOCS_1_1000
+
+FEEDS_URL = "/threathunter/feedmgr/v2/orgs/test/feeds"
+FEED_URL = f"{FEEDS_URL}/feedid"
+
+
+@pytest.fixture(scope="function")
+def cb():
+    """Create CBCloudAPI singleton"""
+    return CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+
+
+@pytest.fixture(scope="function")
+def cbcsdk_mock(monkeypatch, cb):
+    """Mocks CBC SDK for unit tests"""
+    return CBCSDKMock(monkeypatch, cb)
+
+
+@pytest.fixture(scope="function")
+def requests(cbcsdk_mock):
+    """Count the requests for the feed and its reports"""
+    counts = {"feed": 0, "reports": 0}
+
+    def on_get_feed(*args, **kwargs):
+        counts["feed"] += 1
+        return FEED_GET_RESP
+
+    def on_get_reports(*args, **kwargs):
+        counts["reports"] += 1
+        return REPORTS_GET_2_WITH_998_IOCS_1_1000
+
+    cbcsdk_mock.mock_request("GET", FEED_URL, on_get_feed)
+    cbcsdk_mock.mock_request("GET", f"{FEED_URL}/reports", on_get_reports)
+    cbcsdk_mock.mock_request("PUT", f"{FEED_URL}/reports/", lambda url, body, **kwargs: body)
+    return counts
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_feed_and_reports_fetched_once(cbcsdk_mock, requests):
+    """Test the feed and its reports are fetched once, the callers get their own list of the reports"""
+    api = cbcsdk_mock.api
+    feed = get_feed(api, feed_id="feedid")
+    reports = get_reports(api, feed)
+    fetched = dict(requests)
+
+    assert get_feed(api, feed_id="feedid") is feed
+    reports.clear()
+    assert len(get_reports(api, feed)) == 3
+    assert requests == fetched
+    assert get_feed_cache(api).metrics() == {"hits": 2, "misses": 2}
+
+
+def test_write_invalidates_reports(cbcsdk_mock, requests):
+    """Test the reports of a feed are fetched again after a report is written"""
+    api = cbcsdk_mock.api
+    feed = get_feed(api, feed_id="feedid")
+    get_reports(api, feed)
+    fetched = dict(requests)
+
+    report = {
+        "id": "report",
+        "timestamp": 1,
+        "title": "Report",
+        "description": "Report",
+        "severity": 5,
+        "iocs_v2": [{"id": "ioc", "match_type": "equality", "field": "netconn_ipv4", "values": ["1.1.1.1"]}],
+    }
+    put_report(api, feed, report)
+    get_reports(api, get_feed(api, feed_id="feedid"))
+
+    assert requests["reports"] == fetched["reports"] * 2
+
+
+def test_invalidate_feed(cbcsdk_mock, requests):
+    """Test an explicit invalidation drops the feed"""
+    api = cbcsdk_mock.api
+    get_feed(api, feed_id="feedid")
+    invalidate_feed(api, "feedid")
+    get_feed(api, feed_id="feedid")
+    invalidate_feed(api)
+    get_feed(api, feed_id="feedid")
+
+    assert get_feed_cache(api).metrics() == {"hits": 0, "misses": 3}
+
+
+def test_missing_feed_not_cached(cbcsdk_mock):
+    """Test a feed that is not found is looked up again"""
+    api = cbcsdk_mock.api
+    cbcsdk_mock.mock_request("GET", FEED_URL, ObjectNotFoundError(FEED_URL))
+    with pytest.raises(ObjectNotFoundError):
+        get_feed(api, feed_id="feedid")
+    assert get_feed_cache(api).metrics() == {"hits": 0, "misses": 1}
+    with pytest.raises(ObjectNotFoundError):
+        get_feed(api, feed_id="feedid")
+
+
+def test_process_iocs_shares_the_cache(cbcsdk_mock, requests):
+    """Test the reports are fetched again by a second import into the feed, after the first one wrote to it"""
+    api = cbcsdk_mock.api
+    iocs = [IOC_V2.create_equality(api, "ioc", "netconn_ipv4", "1.1.1.1")]
+
+    process_iocs(api, iocs, 5, "feedid", False)
+    fetched = dict(requests)
+    process_iocs(api, iocs, 5, "feedid", False)
+
+    assert requests["reports"] == fetched["reports"] * 2
+
+
+def _feed_info(feed_id, name):
+    """The raw data of a feed"""
+    return {"id": feed_id, "name": name, "provider_url": "https://example.com", "summary": "s", "category": "c"}
+
+
+def test_feed_index_lookups():
+    """Test the exact and the prefix lookups of the feed names"""
+    index = FeedIndex(
+        [_feed_info("c", "Base (shard 1)"), _feed_info("a", "Base"), _feed_info("b", "Other"), _feed_info("d", "Ba")]
+    )
+
+    assert [info["id"] for info in index.exact("Base")] == ["a"]
+    assert [info["id"] for info in index.prefix("Base")] == ["a", "c"]
+    assert [info["id"] for info in index.prefix("B")] == ["d", "a", "c"]
+    assert index.exact("Bas") == []
+    assert index.prefix("Z") == []
+
+
+def test_feed_index_listed_once(cbcsdk_mock):
+    """Test the feeds are listed once for all of the lookups by name, a created feed is added to the index"""
+    api = cbcsdk_mock.api
+    listed = []
+
+    def on_get(url, *args, **kwargs):
+        listed.append(url)
+        return {"results": [_feed_info("a", "Base"), _feed_info("b", "Base (shard 1)")]}
+
+    def on_post(url, body, **kwargs):
+        return {**body["feedinfo"], "id": "c"}
+
+    cbcsdk_mock.mock_request("GET", FEEDS_URL, on_get)
+    cbcsdk_mock.mock_request("POST", FEEDS_URL, on_post)
+
+    assert get_feed(api, feed_name="Base").id == "a"
+    create_feed(api, "Base (shard 2)", "https://example.com", "summary", "category")
+    assert [feed.id for feed in get_feed(api, feed_name="Base", return_all=True)] == ["a", "b", "c"]
+    assert len(listed) == 1
+
+
+def test_feed_index_persisted(cbcsdk_mock, tmp_path, monkeypatch):
+    """Test a persisted index is reused by a later run within its time to live"""
+    api = cbcsdk_mock.api
+    cbcsdk_mock.mock_request("GET", FEEDS_URL, {"results": [_feed_info("a", "Base")]})
+    persist_feed_index(api, 60, tmp_path)
+    get_feed(api, feed_name="Base")
+    assert (tmp_path / "test.json").exists()
+
+    later = CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+    persist_feed_index(later, 60, tmp_path)
+    assert len(get_feed_cache(later).get_index(later)) == 1
+
+    # an expired index is listed again, the org has no feeds by then
+    expired = CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+    persist_feed_index(expired, 60, tmp_path)
+    monkeypatch.setattr(
+        "cbc_importer.feed_cache.time.time", lambda: get_feed_cache(later).get_index(later).created + 61
+    )
+    monkeypatch.setattr(CBCloudAPI, "select", lambda self, cls, *args, **kwargs: iter([]))
+    assert len(get_feed_cache(expired).get_index(expired)) == 0
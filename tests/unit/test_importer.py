@@ -14,13 +14,47 @@
 
 """Tests for the importer."""
 import copy
+import json
+import logging
+import time
+from datetime import datetime, timezone
 
 import pytest
 from cbc_sdk import CBCloudAPI
-from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2, Feed
-from cbc_sdk.errors import ObjectNotFoundError
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2, Feed, Report
+from cbc_sdk.errors import InvalidObjectError, ObjectNotFoundError, ServerError
 
-from cbc_importer.importer import process_iocs
+from cbc_importer.importer import (
+    LAYOUT_DAILY,
+    LAYOUT_HASHED,
+    LAYOUT_TIERED,
+    LAYOUT_WEEKLY,
+    IOCStream,
+    PackingLimits,
+    PendingReport,
+    ReportsPayload,
+    ReportUploadError,
+    UploadPlan,
+    build_hashed_reports,
+    build_time_bucketed_reports,
+    compact_feed,
+    hash_buckets_count,
+    hashed_report_id,
+    ioc_size,
+    iocs_size,
+    is_delta_report,
+    plan_append,
+    plan_compaction,
+    post_payload,
+    process_iocs,
+    report_size,
+    time_bucket,
+    time_bucket_report_id,
+)
+from cbc_importer.journal import ImportInterrupted, ImportJournal
+from cbc_importer.ranking import set_rank, with_source
+from cbc_importer.records import IOCRecord
+from cbc_importer.retries import install_retry_policy
 from tests.fixtures.cbc_sdk_mock import CBCSDKMock
 from tests.fixtures.cbc_sdk_mock_responses import (
     FEED_GET_RESP,
@@ -28,7 +62,6 @@ from tests.fixtures.cbc_sdk_mock_responses import (
     REPORTS_2_1_IOC,
     REPORTS_2_WITH_1_AND_3,
     REPORTS_3_INIT_1000_IOCS,
-    REPORTS_4_INIT_1000_IOCS,
     REPORTS_GET_2_WITH_998_IOCS_1_1000,
     REPORTS_GET_NO_REPORTS,
 )
@@ -131,25 +164,14 @@ def test_process_iocs_append_with_existing_reports(cbcsdk_mock):
     api = cbcsdk_mock.api
     ioc = IOC_V2.create_query(api, "unsigned-chrome", "process_name:chrome.exe")
     iocs_list = [ioc for i in range(1004)]
-    counter_r = 1
+    put_reports = []
 
-    def on_post_report(url, body, **kwargs):
-        nonlocal counter_r
-        report_body = copy.deepcopy(body)
-        # remove the variable properties
-        for i in range(len(report_body["reports"])):
-            del report_body["reports"][i]["id"]
-            del report_body["reports"][i]["timestamp"]
-            if report_body["reports"][i].get("iocs_total_count"):
-                del report_body["reports"][i]["iocs_total_count"]
-            title = report_body["reports"][i]["title"]
-            assert "Report My STIX Feed" in title
-            # change the title to match the mock
-            report_body["reports"][i]["title"] = "Report My STIX Feed"
-            assert len(report_body["reports"][i]["iocs_v2"]) == 1000
-            counter_r += 1
-        assert report_body == REPORTS_4_INIT_1000_IOCS
-        return REPORTS_4_INIT_1000_IOCS
+    def on_put_report(url, body, **kwargs):
+        assert url.endswith(f"/reports/{body['id']}")
+        assert "Report My STIX Feed" in body["title"]
+        assert len(body["iocs_v2"]) == 1000
+        put_reports.append(body["id"])
+        return body
 
     def on_get_reports(url, *args, **kwargs):
         return REPORTS_GET_2_WITH_998_IOCS_1_1000
@@ -159,43 +181,36 @@ def test_process_iocs_append_with_existing_reports(cbcsdk_mock):
         "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
         FEED_GET_RESP,
     )
-    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
     cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
     assert process_iocs(api, iocs_list, 5, "feedid", False) is None
 
+    # the two reports with 998 iocs are updated, the full one is not sent and one new report is created
+    partial_ids = [REPORTS_GET_2_WITH_998_IOCS_1_1000["results"][i]["id"] for i in (0, 2)]
+    full_id = REPORTS_GET_2_WITH_998_IOCS_1_1000["results"][1]["id"]
+    assert len(put_reports) == 3
+    assert sorted(put_reports[:2]) == sorted(partial_ids)
+    assert len(set(put_reports)) == 3
+    assert full_id not in put_reports
+
 
 def test_process_iocs_append_with_existing_reports_no_new_needed(cbcsdk_mock):
     """Test process 2 iocs - append, existing 2 reports with 1 report each, no additional reports are required."""
     api = cbcsdk_mock.api
     ioc = IOC_V2.create_query(api, "unsigned-chrome", "process_name:chrome.exe")
     iocs_list = [ioc for i in range(2)]
-    counter_r = 1
+    put_reports = []
 
-    def on_post_report(url, body, **kwargs):
-        nonlocal counter_r
+    def on_put_report(url, body, **kwargs):
         report_body = copy.deepcopy(body)
-        expected_body = copy.deepcopy(REPORTS_2_WITH_1_AND_3)
+        expected_body = copy.deepcopy(REPORTS_2_WITH_1_AND_3["reports"][0])
         # remove the variable properties
-        for i in range(len(report_body["reports"])):
-            del report_body["reports"][i]["id"]
-            del report_body["reports"][i]["timestamp"]
-            del expected_body["reports"][i]["id"]
-            del expected_body["reports"][i]["timestamp"]
-            if report_body["reports"][i].get("iocs_total_count"):
-                del report_body["reports"][i]["iocs_total_count"]
-            if expected_body["reports"][i].get("iocs_total_count"):
-                del expected_body["reports"][i]["iocs_total_count"]
-            title = report_body["reports"][i]["title"]
-            assert "Report My STIX Feed" in title
-            # change the title to match the mock
-            report_body["reports"][i]["title"] = "Report My STIX Feed"
-            if counter_r == 1:
-                assert len(report_body["reports"][i]["iocs_v2"]) == 3
-            else:
-                assert len(report_body["reports"][i]["iocs_v2"]) == 1
-            counter_r += 1
+        del report_body["timestamp"]
+        del expected_body["timestamp"]
+        del expected_body["iocs_total_count"]
         assert report_body == expected_body
-        return REPORTS_2_WITH_1_AND_3
+        put_reports.append(body)
+        return body
 
     def on_get_reports(url, *args, **kwargs):
         return REPORTS_2_1_IOC
@@ -205,24 +220,27 @@ def test_process_iocs_append_with_existing_reports_no_new_needed(cbcsdk_mock):
         "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
         FEED_GET_RESP,
     )
-    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
     cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
     assert process_iocs(api, iocs_list, 5, "feedid", False) is None
 
+    # only the report that got the new iocs is sent
+    assert len(put_reports) == 1
+
 
 def test_process_iocs_append(cbcsdk_mock):
     """Test process 1 iocs - append, no existing reports"""
     api = cbcsdk_mock.api
     ioc = IOC_V2.create_query(api, "unsigned-chrome", "process_name:chrome.exe")
 
-    def on_post_report(url, body, **kwargs):
+    def on_put_report(url, body, **kwargs):
         report_body = copy.deepcopy(body)
+        assert url.endswith(f"/reports/{body['id']}")
         # remove the variable properties
-        if report_body["reports"]:
-            del report_body["reports"][0]["id"]
-            del report_body["reports"][0]["timestamp"]
-        assert report_body == REPORT_INIT_ONE_IOCS
-        return REPORT_INIT_ONE_IOCS
+        del report_body["id"]
+        del report_body["timestamp"]
+        assert report_body == REPORT_INIT_ONE_IOCS["reports"][0]
+        return body
 
     def on_get_reports(url, *args, **kwargs):
         return REPORTS_GET_NO_REPORTS
@@ -232,6 +250,1135 @@ def test_process_iocs_append(cbcsdk_mock):
         "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
         FEED_GET_RESP,
     )
-    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
     cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
     assert process_iocs(api, [ioc], 5, "feedid", False) is None
+
+
+def test_process_iocs_append_parser_failure(cbcsdk_mock):
+    """Test append uploads nothing if the iocs fail partway through, a re-run does not append them twice"""
+    api = cbcsdk_mock.api
+
+    def failing_iocs():
+        yield from _ipv4_iocs(api, 1500)
+        raise ConnectionError("The server went away")
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    # there is no PUT mock, so any upload would fail with a different error
+    with pytest.raises(ConnectionError):
+        process_iocs(api, failing_iocs(), 5, "feedid", False)
+
+
+def test_process_iocs_append_nothing_to_add(cbcsdk_mock):
+    """Test process 0 iocs - append, the existing reports are not sent again"""
+    api = cbcsdk_mock.api
+
+    def on_get_reports(url, *args, **kwargs):
+        return REPORTS_GET_2_WITH_998_IOCS_1_1000
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
+    # there are no PUT/POST mocks, so any upload would fail the test
+    assert process_iocs(api, [], 5, "feedid", False) is None
+
+
+def test_process_iocs_from_generator(cbcsdk_mock):
+    """Test process iocs coming from a generator - replace, enough for 3 reports"""
+    api = cbcsdk_mock.api
+    consumed = 0
+
+    def iocs_generator():
+        nonlocal consumed
+        for i in range(2500):
+            consumed += 1
+            yield IOC_V2.create_query(api, f"unsigned-chrome-{i}", "process_name:chrome.exe")
+
+    def on_post_report(url, body, **kwargs):
+        assert [len(report["iocs_v2"]) for report in body["reports"]] == [1000, 1000, 500]
+        assert body["reports"][2]["iocs_v2"][-1]["id"] == "unsigned-chrome-2499"
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    assert process_iocs(api, iocs_generator(), 5, "feedid", True) is None
+    assert consumed == 2500
+
+
+def test_process_iocs_no_iocs_replace(cbcsdk_mock):
+    """Test process 0 iocs - replace, the feed is emptied"""
+    api = cbcsdk_mock.api
+
+    def on_post_report(url, body, **kwargs):
+        assert body == {"reports": []}
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    assert process_iocs(api, iter([]), 5, "feedid", True) is None
+
+
+def test_process_iocs_uploads_reports_once(cbcsdk_mock):
+    """Test that the reports are built locally and uploaded with one request"""
+    api = cbcsdk_mock.api
+    ioc = IOC_V2.create_query(api, "unsigned-chrome", "process_name:chrome.exe")
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    process_iocs(api, [ioc for i in range(10000)], 5, "feedid", True)
+
+    # one GET for the feed and one POST with all of the reports
+    assert len(cbcsdk_mock._all_request_data) == 2
+    assert len(posted) == 1
+    assert len(posted[0]["reports"]) == 10
+    assert len({report["id"] for report in posted[0]["reports"]}) == 10
+
+
+def test_process_iocs_replace_invalid_ioc(cbcsdk_mock):
+    """Test that a malformed ioc is caught locally and nothing is uploaded"""
+    api = cbcsdk_mock.api
+    ioc = IOC_V2(api, "no-field", {"id": "no-field", "match_type": "equality", "values": ["1.2.3.4"]})
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    # there is no POST mock, so an upload would fail with a different error
+    with pytest.raises(InvalidObjectError):
+        process_iocs(api, [ioc], 5, "feedid", True)
+
+
+def _equality_ioc(value):
+    """Raw data of an equality ioc used by the sync tests"""
+    return {"id": f"ioc-{value}", "match_type": "equality", "field": "netconn_ipv4", "values": [value]}
+
+
+def _report(report_id, values, severity=5):
+    """Raw data of an existing report used by the sync tests"""
+    return {
+        "id": report_id,
+        "title": "Report My STIX Feed",
+        "description": "feed for stix taxii",
+        "timestamp": 1643305793,
+        "severity": severity,
+        "tags": [],
+        "iocs_v2": [_equality_ioc(value) for value in values],
+        "iocs_total_count": len(values),
+    }
+
+
+def test_process_iocs_sync(cbcsdk_mock, caplog):
+    """Test sync - only the reports that differ are updated or deleted"""
+    api = cbcsdk_mock.api
+    iocs = [
+        IOC_V2.create_equality(api, f"new-{value}", "netconn_ipv4", value)
+        for value in ["1.1.1.1", "4.4.4.4", "5.5.5.5"]
+    ]
+    put_reports, deleted_urls = [], []
+
+    def on_get_reports(url, *args, **kwargs):
+        return {
+            "results": [
+                _report("report-a", ["1.1.1.1", "2.2.2.2"]),
+                _report("report-b", ["3.3.3.3"]),
+                _report("report-c", ["4.4.4.4"]),
+            ]
+        }
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    def on_delete_report(url, body):
+        deleted_urls.append(url)
+        return None
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    cbcsdk_mock.mock_request("DELETE", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_delete_report)
+
+    with caplog.at_level(logging.INFO):
+        assert process_iocs(api, iocs, 5, "feedid", True, sync=True) is None
+
+    # report-a lost 2.2.2.2 and got the new 5.5.5.5, report-b is empty, report-c is not touched
+    assert len(put_reports) == 1
+    assert put_reports[0]["id"] == "report-a"
+    assert [ioc["values"] for ioc in put_reports[0]["iocs_v2"]] == [["1.1.1.1"], ["5.5.5.5"]]
+    assert deleted_urls == ["/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/report-b"]
+    assert "0 reports added, 1 updated, 1 deleted, 1 unchanged (1 iocs added, 2 iocs removed)" in caplog.text
+
+
+def test_process_iocs_sync_new_reports(cbcsdk_mock):
+    """Test sync - the existing reports are unchanged, the new iocs go into new reports"""
+    api = cbcsdk_mock.api
+    iocs = [IOC_V2.create_equality(api, f"new-{i}", "netconn_ipv4", f"10.0.{i // 256}.{i % 256}") for i in range(1500)]
+    iocs.append(IOC_V2.create_equality(api, "existing", "netconn_ipv4", "4.4.4.4"))
+    put_reports = []
+
+    def on_get_reports(url, *args, **kwargs):
+        return {"results": [_report("report-c", ["4.4.4.4"])]}
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+
+    assert process_iocs(api, iocs, 5, "feedid", False, sync=True) is None
+    assert [len(report["iocs_v2"]) for report in put_reports] == [1000, 500]
+    assert "report-c" not in [report["id"] for report in put_reports]
+
+
+def _ipv4_iocs(api, count):
+    """Distinct equality iocs used by the hashed layout tests"""
+    return [
+        IOC_V2.create_equality(api, f"ioc-{i}", "netconn_ipv4", f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+        for i in range(count)
+    ]
+
+
+def test_hash_buckets_count():
+    """Test the number of buckets grows in powers of two and is capped by the reports limit"""
+    assert hash_buckets_count(0) == 1
+    assert hash_buckets_count(750) == 1
+    assert hash_buckets_count(751) == 2
+    assert hash_buckets_count(2900) == 4
+    assert hash_buckets_count(100_000_000) == 8192
+
+
+def test_hash_buckets_count_keeps_current():
+    """Test the current number of buckets is kept within a factor of two of the ideal one"""
+    assert hash_buckets_count(751, current_count=1) == 1
+    assert hash_buckets_count(1501, current_count=1) == 4
+    assert hash_buckets_count(750, current_count=2) == 2
+    assert hash_buckets_count(700, current_count=4) == 1
+
+
+def test_process_iocs_invalid_layout(cbcsdk_mock):
+    """Test an unknown layout is rejected before anything is read or sent"""
+    with pytest.raises(ValueError):
+        process_iocs(cbcsdk_mock.api, [], 5, "feedid", False, layout="random")
+
+
+def test_process_iocs_hashed_replace_is_deterministic(cbcsdk_mock):
+    """Test hashed layout - the same iocs make the same reports with the same ids"""
+    api = cbcsdk_mock.api
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append({report["id"]: _ioc_values(report) for report in body["reports"]})
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    iocs = _ipv4_iocs(api, 2900)
+    process_iocs(api, iocs, 5, "feedid", True, layout=LAYOUT_HASHED)
+    process_iocs(api, reversed(iocs), 5, "feedid", True, layout=LAYOUT_HASHED)
+
+    assert len(posted[0]) == 4
+    assert posted[0] == posted[1]
+
+
+def _ioc_values(report):
+    """The values of the iocs in a report"""
+    return [ioc["values"] for ioc in report["iocs_v2"]]
+
+
+def test_process_iocs_hashed_sync_touches_one_report(cbcsdk_mock):
+    """Test hashed layout with sync - a new ioc changes only the report of its bucket"""
+    api = cbcsdk_mock.api
+    iocs = _ipv4_iocs(api, 2901)
+    feed = Feed(api, initial_data=FEED_GET_RESP["feedinfo"])
+    existing_reports = build_hashed_reports(api, feed, 5, [ioc._info for ioc in iocs[:-1]])
+    put_reports = []
+
+    def on_get_reports(url, *args, **kwargs):
+        return {"results": existing_reports}
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    process_iocs(api, iocs, 5, "feedid", True, sync=True, layout=LAYOUT_HASHED)
+
+    assert len(put_reports) == 1
+    assert put_reports[0]["id"] in {report["id"] for report in existing_reports}
+    assert ["10.0.11.84"] in _ioc_values(put_reports[0])
+
+
+def test_process_iocs_append_with_workers(cbcsdk_mock):
+    """Test process iocs - append with a pool of workers, all of the reports are uploaded"""
+    api = cbcsdk_mock.api
+    put_ids = []
+
+    def on_put_report(url, body, **kwargs):
+        put_ids.append(body["id"])
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    process_iocs(api, _ipv4_iocs(api, 20500), 5, "feedid", False, workers=4)
+
+    assert len(set(put_ids)) == 21
+
+
+def test_process_iocs_append_with_workers_errors(cbcsdk_mock):
+    """Test process iocs - append with a pool of workers, the failed reports are raised together"""
+    api = cbcsdk_mock.api
+    calls = 0
+
+    def on_put_report(url, body, **kwargs):
+        nonlocal calls
+        calls += 1
+        if len(body["iocs_v2"]) < 1000:
+            raise ServerError(503, "Service Unavailable")
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    install_retry_policy(api, attempts=2, sleep=lambda delay: None)
+    with pytest.raises(ReportUploadError) as error:
+        process_iocs(api, _ipv4_iocs(api, 5500), 5, "feedid", False, workers=3)
+
+    # the failing report is retried once and does not stop the other ones
+    assert calls == 7
+    assert len(error.value.errors) == 1
+    assert isinstance(error.value.errors[0][1], ServerError)
+
+
+def _mock_hashed_sync(cbcsdk_mock, existing_reports):
+    """Mock the requests of a hashed sync, return the uploaded and the deleted reports"""
+    put_reports, deleted_urls = [], []
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    def on_delete_report(url, body):
+        deleted_urls.append(url)
+        return None
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request(
+        "GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", {"results": existing_reports}
+    )
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    cbcsdk_mock.mock_request("DELETE", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_delete_report)
+    return put_reports, deleted_urls
+
+
+def test_process_iocs_hashed_sync_new_ioc_ids(cbcsdk_mock):
+    """Test hashed layout with sync - the same iocs with new ids do not change the reports"""
+    api = cbcsdk_mock.api
+    feed = Feed(api, initial_data=FEED_GET_RESP["feedinfo"])
+    existing_reports = build_hashed_reports(api, feed, 5, [ioc._info for ioc in _ipv4_iocs(api, 2900)])
+    put_reports, deleted_urls = _mock_hashed_sync(cbcsdk_mock, existing_reports)
+
+    iocs = _ipv4_iocs(api, 2900)
+    for ioc in iocs:
+        ioc._info["id"] = f"new-{ioc._info['id']}"
+    process_iocs(api, iocs, 5, "feedid", True, sync=True, layout=LAYOUT_HASHED)
+
+    assert put_reports == []
+    assert deleted_urls == []
+
+
+def test_process_iocs_hashed_sync_keeps_buckets_count(cbcsdk_mock):
+    """Test hashed layout with sync - crossing the threshold of the buckets does not rewrite the feed"""
+    api = cbcsdk_mock.api
+    iocs = _ipv4_iocs(api, 751)
+    feed = Feed(api, initial_data=FEED_GET_RESP["feedinfo"])
+    existing_reports = build_hashed_reports(api, feed, 5, [ioc._info for ioc in iocs[:-1]])
+    put_reports, deleted_urls = _mock_hashed_sync(cbcsdk_mock, existing_reports)
+
+    process_iocs(api, iocs, 5, "feedid", True, sync=True, layout=LAYOUT_HASHED)
+
+    assert len(existing_reports) == 1
+    assert [report["id"] for report in put_reports] == [existing_reports[0]["id"]]
+    assert deleted_urls == []
+
+
+def test_process_iocs_replace_retries_server_error(cbcsdk_mock):
+    """Test replace - a transient server error is retried with the same reports"""
+    api = cbcsdk_mock.api
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append([report["id"] for report in body["reports"]])
+        if len(posted) == 1:
+            raise ServerError(503, "Service Unavailable")
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    policy = install_retry_policy(api, sleep=lambda delay: None)
+    process_iocs(api, _ipv4_iocs(api, 1500), 5, "feedid", True)
+
+    # the retry sends the same report ids, so it is idempotent
+    assert len(posted) == 2
+    assert posted[0] == posted[1]
+    assert policy.metrics()["retries"] == 1
+
+
+def test_process_iocs_sync_delete_already_deleted(cbcsdk_mock):
+    """Test sync - a report that is already deleted does not fail the import"""
+    api = cbcsdk_mock.api
+
+    def on_delete_report(url, body):
+        raise ObjectNotFoundError(url)
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request(
+        "GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", {"results": [_report("gone", ["1.1.1.1"])]}
+    )
+    cbcsdk_mock.mock_request("DELETE", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_delete_report)
+    assert process_iocs(api, [], 5, "feedid", False, sync=True) is None
+
+
+def test_process_iocs_append_resumed_from_journal(cbcsdk_mock, tmp_path):
+    """Test append with a journal - the iocs of the reports uploaded before the interruption are skipped"""
+    api = cbcsdk_mock.api
+    journal = ImportJournal.open(tmp_path, "Test Server", {})
+    journal.record_report("uploaded")
+    put_reports = []
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports",
+        {"results": [_report("uploaded", ["1.1.1.1", "2.2.2.2"])]},
+    )
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    iocs = [IOC_V2.create_equality(api, f"ioc-{i}", "netconn_ipv4", f"{i}.{i}.{i}.{i}") for i in range(1, 4)]
+    process_iocs(api, iocs, 5, "feedid", False, journal=journal)
+
+    assert len(put_reports) == 1
+    assert _ioc_values(put_reports[0]) == [["1.1.1.1"], ["2.2.2.2"], ["3.3.3.3"]]
+    assert journal.uploaded_reports == {"uploaded"}
+
+
+def test_process_iocs_interrupted(cbcsdk_mock, tmp_path):
+    """Test a stopped import does not upload any more reports and records the uploaded ones"""
+    api = cbcsdk_mock.api
+    journal = ImportJournal.open(tmp_path, "Test Server", {})
+    put_reports = []
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body["id"])
+        journal.stop()
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    with pytest.raises(ImportInterrupted):
+        process_iocs(api, _ipv4_iocs(api, 3500), 5, "feedid", False, journal=journal)
+
+    # the reports queued before the stop are finished, the rest of them are not sent
+    assert 1 <= len(put_reports) < 4
+    assert journal.uploaded_reports == set(put_reports)
+
+
+def _long_query_iocs(api, count):
+    """Query iocs of about 2KB each, used by the packing tests"""
+    return [IOC_V2.create_query(api, f"query-{i}", f"process_name:{i}-{'a' * 2000}.exe") for i in range(count)]
+
+
+def test_process_iocs_replace_packs_by_size(cbcsdk_mock):
+    """Test the reports are packed by the size of their iocs, not only by the count"""
+    api = cbcsdk_mock.api
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    process_iocs(api, _long_query_iocs(api, 100), 5, "feedid", True, max_report_bytes=25 * 1024)
+
+    reports = posted[0]["reports"]
+    assert sum(len(report["iocs_v2"]) for report in reports) == 100
+    assert len(reports) == 10
+    assert all(report_size(report) <= 25 * 1024 for report in reports)
+
+
+def test_process_iocs_replace_splits_request(cbcsdk_mock):
+    """Test the reports that do not fit into the replacing request are uploaded one by one"""
+    api = cbcsdk_mock.api
+    posted = []
+    put_ids = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append(body)
+        return body
+
+    def on_put_report(url, body, **kwargs):
+        put_ids.append(body["id"])
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    process_iocs(
+        api, _long_query_iocs(api, 100), 5, "feedid", True, max_report_bytes=25 * 1024, max_request_bytes=60 * 1024
+    )
+
+    assert len(posted) == 1
+    assert len(posted[0]["reports"]) == 2
+    assert len(put_ids) == 8
+    assert not {report["id"] for report in posted[0]["reports"]} & set(put_ids)
+
+
+def test_ioc_stream_limits():
+    """Test the batches are capped by the count and the size, an oversized ioc gets a new report on its own"""
+    small = {"id": "small", "match_type": "equality", "field": "netconn_ipv4", "values": ["1.2.3.4"]}
+    large = {"id": "large", "match_type": "query", "values": ["a" * 500]}
+    stream = IOCStream([small, small, small, large, small])
+
+    assert stream.take(2, 1000) == [small, small]
+    # the large ioc does not fit into a report that is being filled up
+    assert stream.take(10, ioc_size(small) + 100, fresh=False) == [small]
+    assert stream.take(10, 100, fresh=False) == []
+    # a new report takes it on its own
+    assert list(stream.batches(10, 100)) == [[large], [small]]
+
+
+def _existing_report(api, report_id, count):
+    """An existing report of the feed holding `count` equality iocs"""
+    iocs = [_equality_ioc(f"{report_id}-{i}") for i in range(count)]
+    return Report(api, initial_data={"id": report_id, "title": report_id, "severity": 5, "iocs_v2": iocs})
+
+
+def test_plan_append_first_fit_decreasing(cb):
+    """Test the appended iocs fill the report with the most room left and no new report is opened"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "half", 500), _existing_report(cb, "full", 1000), _existing_report(cb, "few", 100)]
+    iocs = [_equality_ioc(f"new-{i}") for i in range(600)]
+
+    reports, summary = plan_append(cb, feed, existing, iocs, 5)
+
+    assert [report["id"] for report in reports] == ["few"]
+    assert len(reports[0]["iocs_v2"]) == 700
+    assert summary["updated"] == 1
+    assert summary["added"] == 0
+    assert summary["unchanged"] == 2
+    assert summary["iocs_added"] == 600
+    assert summary["fill_before"] == pytest.approx(1600 / 3000)
+    assert summary["fill_after"] == pytest.approx(2200 / 3000)
+
+
+def test_plan_append_spills_into_new_reports(cb):
+    """Test the iocs that do not fit into the existing reports go in new reports, the largest ones first"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "almost-full", 990)]
+    large = [IOC_V2.create_query(cb, f"query-{i}", f"process_name:{'a' * 500}-{i}.exe")._info for i in range(3)]
+    iocs = [_equality_ioc(f"new-{i}") for i in range(1500)] + large
+
+    reports, summary = plan_append(cb, feed, existing, iocs, 5, PackingLimits(report_bytes=200 * 1024))
+
+    assert summary["updated"] == 1
+    assert summary["added"] == 2
+    assert summary["iocs_added"] == 1503
+    # the large iocs are placed first, so they take the room left in the existing report
+    assert reports[0]["id"] == "almost-full"
+    assert [ioc["id"] for ioc in reports[0]["iocs_v2"][990:993]] == ["query-0", "query-1", "query-2"]
+    assert sum(len(report["iocs_v2"]) for report in reports) == 990 + 1503
+
+
+def test_plan_compaction(cb):
+    """Test the emptiest reports are moved into the free room of the fuller ones and the duplicates removed"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [
+        _existing_report(cb, "full", 1000),
+        _existing_report(cb, "half", 500),
+        _existing_report(cb, "small", 200),
+        _existing_report(cb, "tiny", 10),
+    ]
+    # a copy of an ioc of the full report
+    existing[3]._info["iocs_v2"].append(_equality_ioc("full-0"))
+
+    reports, deleted_ids, summary = plan_compaction(cb, feed, existing)
+
+    assert [report["id"] for report in reports] == ["half"]
+    assert len(reports[0]["iocs_v2"]) == 710
+    assert deleted_ids == ["tiny", "small"]
+    assert summary["duplicates"] == 1
+    assert summary["unchanged"] == 1
+    assert summary["reports_before"] == 4
+    assert summary["reports_after"] == 2
+
+
+def test_plan_compaction_only_duplicates(cb):
+    """Test a full report that held duplicates is uploaded, a report of duplicates only is deleted"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "full", 1000), _existing_report(cb, "copy", 0)]
+    existing[0]._info["iocs_v2"][999] = _equality_ioc("full-0")
+    existing[1]._info["iocs_v2"] = [_equality_ioc("full-1")]
+
+    reports, deleted_ids, summary = plan_compaction(cb, feed, existing)
+
+    assert [(report["id"], len(report["iocs_v2"])) for report in reports] == [("full", 999)]
+    assert deleted_ids == ["copy"]
+    assert summary["duplicates"] == 2
+
+
+def _partial_reports():
+    """Two reports with room left, the iocs of one of them fit into the other"""
+    return {
+        "results": [
+            {"id": report_id, "title": report_id, "severity": 5, "iocs_v2": [_equality_ioc(f"{report_id}-0")]}
+            for report_id in ("first", "second")
+        ]
+    }
+
+
+def test_compact_feed(cbcsdk_mock):
+    """Test the compaction uploads the updated reports before it deletes the emptied ones"""
+    api = cbcsdk_mock.api
+    requests = []
+
+    def on_put_report(url, body, **kwargs):
+        requests.append(("PUT", body["id"]))
+        return body
+
+    def on_delete_report(url, body):
+        requests.append(("DELETE", url.rsplit("/", 1)[-1]))
+        return None
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", _partial_reports())
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    cbcsdk_mock.mock_request("DELETE", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_delete_report)
+
+    summary = compact_feed(api, "feedid", workers=4)
+
+    assert summary["reports_before"] == 2
+    assert summary["reports_after"] == 1
+    assert [method for method, _ in requests] == ["PUT", "DELETE"]
+    assert requests[0][1] != requests[1][1]
+
+
+def test_compact_feed_dry_run(cbcsdk_mock):
+    """Test the dry run of the compaction does not write anything"""
+    api = cbcsdk_mock.api
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", _partial_reports())
+    # there are no PUT/DELETE mocks, so any write would fail the test
+    summary = compact_feed(api, "feedid", dry_run=True)
+
+    assert summary["updated"] == 1
+    assert summary["deleted"] == 1
+
+
+def test_process_iocs_full_feed_drops_lowest_ranked(cbcsdk_mock, monkeypatch, caplog):
+    """Test a full feed keeps the iocs of the higher priority source and counts the dropped iocs by source"""
+    monkeypatch.setattr("cbc_importer.importer.REPORTS_BATCH_SIZE", 1)
+    api = cbcsdk_mock.api
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    low = [IOC_V2.create_equality(api, f"low-{i}", "netconn_ipv4", f"10.0.{i // 256}.{i % 256}") for i in range(600)]
+    high = [IOC_V2.create_equality(api, f"high-{i}", "netconn_ipv4", f"10.1.{i // 256}.{i % 256}") for i in range(600)]
+    iocs = list(with_source(low, "Low")) + list(with_source(high, "High", priority=1))
+
+    with caplog.at_level(logging.INFO):
+        process_iocs(api, iocs, 5, "feedid", True)
+
+    kept = [ioc["id"] for ioc in posted[0]["reports"][0]["iocs_v2"]]
+    assert len(kept) == 1000
+    assert all(f"high-{i}" in kept for i in range(600))
+    assert "200 iocs are dropped (Low: 200)" in caplog.text
+
+
+def test_plan_append_full_feed_drops_lowest_ranked(cb, monkeypatch):
+    """Test the first-fit decreasing gives way to the rank order when the feed cannot hold all of the iocs"""
+    monkeypatch.setattr("cbc_importer.importer.REPORTS_BATCH_SIZE", 1)
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "almost-full", 997)]
+    large = [IOC_V2.create_query(cb, f"query-{i}", f"process_name:{'a' * 500}-{i}.exe")._info for i in range(2)]
+    iocs = [_equality_ioc(f"new-{i}") for i in range(3)] + large
+    overflow = []
+
+    reports, summary = plan_append(cb, feed, existing, iocs, 5, overflow=overflow)
+
+    assert [ioc["id"] for ioc in reports[0]["iocs_v2"][997:]] == ["ioc-new-0", "ioc-new-1", "ioc-new-2"]
+    assert summary["dropped"] == 2
+    assert overflow == large
+
+
+DAY = 86400
+
+
+def _first_seen_iocs(api, count, first_seen, prefix="10.0"):
+    """Equality iocs first seen at the same time"""
+    rank = {"first_seen": first_seen}
+    return [
+        set_rank(IOC_V2.create_equality(api, f"{prefix}-{i}", "netconn_ipv4", f"{prefix}.{i // 256}.{i % 256}"), **rank)
+        for i in range(count)
+    ]
+
+
+def test_time_bucket():
+    """Test the buckets start at midnight UTC, the weeks on Monday"""
+    thursday_noon = datetime(2024, 5, 9, 12, tzinfo=timezone.utc).timestamp()
+    assert time_bucket(thursday_noon, LAYOUT_DAILY) == datetime(2024, 5, 9, tzinfo=timezone.utc).timestamp()
+    assert time_bucket(thursday_noon, LAYOUT_WEEKLY) == datetime(2024, 5, 6, tzinfo=timezone.utc).timestamp()
+
+
+def test_process_iocs_daily_replace(cbcsdk_mock):
+    """Test the daily layout groups the iocs by the day they are first seen"""
+    api = cbcsdk_mock.api
+    posted = []
+
+    def on_post_report(url, body, **kwargs):
+        posted.append(body)
+        return body
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    today = time_bucket(time.time(), LAYOUT_DAILY)
+    iocs = _first_seen_iocs(api, 1200, today + 3600) + _first_seen_iocs(api, 10, today - DAY + 60, "10.1")
+    process_iocs(api, iocs, 5, "feedid", True, layout=LAYOUT_DAILY)
+
+    feed = Feed(api, initial_data=FEED_GET_RESP["feedinfo"])
+    reports = posted[0]["reports"]
+    assert [report["timestamp"] for report in reports] == [today, today, today - DAY]
+    assert [len(report["iocs_v2"]) for report in reports] == [1000, 200, 10]
+    assert [report["id"] for report in reports] == [
+        time_bucket_report_id(feed, LAYOUT_DAILY, today, 0),
+        time_bucket_report_id(feed, LAYOUT_DAILY, today, 1),
+        time_bucket_report_id(feed, LAYOUT_DAILY, today - DAY, 0),
+    ]
+
+
+def test_process_iocs_weekly_append_expires_old_reports(cbcsdk_mock):
+    """Test the reports of the weeks past the retention are deleted and the rest are left untouched"""
+    api = cbcsdk_mock.api
+    feed = Feed(api, initial_data=FEED_GET_RESP["feedinfo"])
+    this_week = time_bucket(time.time(), LAYOUT_WEEKLY)
+    old_iocs = [ioc._info for ioc in _first_seen_iocs(api, 5, 0, "10.1")]
+    kept_iocs = [ioc._info for ioc in _first_seen_iocs(api, 5, 0, "10.2")]
+    existing_reports = build_time_bucketed_reports(
+        api, feed, 5, {this_week - 10 * 7 * DAY: old_iocs, this_week - 7 * DAY: kept_iocs}, LAYOUT_WEEKLY
+    )
+    put_reports = []
+    deleted_ids = []
+
+    def on_get_reports(url, *args, **kwargs):
+        return {"results": existing_reports}
+
+    def on_put_report(url, body, **kwargs):
+        put_reports.append(body)
+        return body
+
+    def on_delete_report(url, body):
+        deleted_ids.append(url.rsplit("/", 1)[-1])
+
+    cbcsdk_mock.mock_request(
+        "GET",
+        "/threathunter/feedmgr/v2/orgs/test/feeds/feedid",
+        FEED_GET_RESP,
+    )
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_get_reports)
+    cbcsdk_mock.mock_request("PUT", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_put_report)
+    cbcsdk_mock.mock_request("DELETE", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports/", on_delete_report)
+    iocs = _first_seen_iocs(api, 3, 0, "10.3") + [IOC_V2(api, ioc["id"], ioc) for ioc in kept_iocs]
+    process_iocs(api, iocs, 5, "feedid", False, layout=LAYOUT_WEEKLY, retention_days=30)
+
+    assert [report["id"] for report in put_reports] == [time_bucket_report_id(feed, LAYOUT_WEEKLY, this_week)]
+    assert len(put_reports[0]["iocs_v2"]) == 3
+    assert deleted_ids == [existing_reports[1]["id"]]
+
+
+def test_process_iocs_retention_needs_time_layout(cbcsdk_mock):
+    """Test the retention is refused with the sequential layout"""
+    with pytest.raises(ValueError):
+        process_iocs(cbcsdk_mock.api, [], 5, "feedid", False, retention_days=7)
+
+
+def _delta_report(api, report_id, count):
+    """An existing delta report of the tiered layout"""
+    report = _existing_report(api, report_id, count)
+    report._info["tags"] = ["delta"]
+    return report
+
+
+def test_plan_compaction_merges_delta_reports(cb):
+    """Test the delta reports are merged even when the base reports are full, the new reports are base reports"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "base", 990), _delta_report(cb, "delta-1", 20), _delta_report(cb, "delta-2", 20)]
+
+    reports, deleted_ids, summary = plan_compaction(cb, feed, existing)
+
+    assert len(reports) == 1
+    assert reports[0]["id"] in ("delta-1", "delta-2")
+    assert len(reports[0]["iocs_v2"]) == 40
+    assert not is_delta_report(reports[0])
+    assert deleted_ids == [{"delta-1": "delta-2", "delta-2": "delta-1"}[reports[0]["id"]]]
+    assert summary["unchanged"] == 1
+
+
+def test_plan_compaction_keeps_partitions_apart(cb):
+    """Test only the reports with the same tags are merged and the rebuilt reports keep their title and tags"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, report_id, 10) for report_id in ("a-1", "a-2", "b-1")]
+    for report in existing:
+        report._info["tags"] = [f"partition-{report.id[0]}"]
+    delta = _delta_report(cb, "b-delta", 5)
+    delta._info["tags"].append("partition-b")
+
+    reports, deleted_ids, summary = plan_compaction(cb, feed, existing + [delta])
+
+    assert sorted((report["id"], len(report["iocs_v2"])) for report in reports) == [("a-2", 20), ("b-1", 15)]
+    assert {report["id"]: report["tags"] for report in reports} == {"a-2": ["partition-a"], "b-1": ["partition-b"]}
+    assert {report["id"]: report["title"] for report in reports} == {"a-2": "a-2", "b-1": "b-1"}
+    assert sorted(deleted_ids) == ["a-1", "b-delta"]
+
+
+@pytest.mark.parametrize("layout", [LAYOUT_HASHED, LAYOUT_DAILY, LAYOUT_WEEKLY])
+def test_plan_compaction_refuses_bucketed_layouts(cb, layout):
+    """Test the reports laid out in buckets are not compacted, their iocs would leave their buckets"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    bucket = time_bucket(datetime(2024, 5, 9, tzinfo=timezone.utc).timestamp(), layout)
+    if layout == LAYOUT_HASHED:
+        report_id = hashed_report_id(feed, 2, 1)
+    else:
+        report_id = time_bucket_report_id(feed, layout, bucket)
+    existing = [_existing_report(cb, report_id, 10), _existing_report(cb, "other", 10)]
+    existing[0]._info["timestamp"] = bucket
+
+    with pytest.raises(ValueError, match=layout):
+        plan_compaction(cb, feed, existing)
+
+
+def test_plan_append_keeps_tags(cb):
+    """Test a report that is filled up keeps its title and its tags"""
+    feed = Feed(cb, initial_data={"id": "feedid", "name": "Feed", "summary": "Feed summary"})
+    existing = [_existing_report(cb, "tagged", 10)]
+    existing[0]._info["tags"] = ["partition-a"]
+
+    reports, _ = plan_append(cb, feed, existing, [_equality_ioc("new")], 5)
+
+    assert [(report["id"], report["title"], report["tags"]) for report in reports] == [
+        ("tagged", "tagged", ["partition-a"])
+    ]
+
+
+class _StoredReports:
+    """The reports of the feed, kept by the mocked requests"""
+
+    def __init__(self, cbcsdk_mock, reports):
+        """Mock the requests to the reports of the feed"""
+        self.reports = {report["id"]: report for report in reports}
+        self.puts = []
+        url = "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports"
+        cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid", FEED_GET_RESP)
+        cbcsdk_mock.mock_request("GET", url, lambda *args, **kwargs: {"results": list(self.reports.values())})
+        cbcsdk_mock.mock_request("PUT", f"{url}/", self.on_put)
+        cbcsdk_mock.mock_request("DELETE", f"{url}/", lambda url, body: self.reports.pop(url.rsplit("/", 1)[-1]))
+
+    def on_put(self, url, body, **kwargs):
+        """Create or update a report"""
+        self.reports[body["id"]] = body
+        self.puts.append(body)
+        return body
+
+
+def test_process_iocs_tiered_append(cbcsdk_mock):
+    """Test the tiered layout appends only the new iocs in a delta report, the base reports are untouched"""
+    api = cbcsdk_mock.api
+    base = {"id": "base", "title": "base", "severity": 5, "iocs_v2": [_equality_ioc(f"10.9.0.{i}") for i in range(5)]}
+    stored = _StoredReports(cbcsdk_mock, [base])
+    iocs = [IOC_V2(api, ioc["id"], ioc) for ioc in base["iocs_v2"]] + _ipv4_iocs(api, 3)[1:]
+
+    process_iocs(api, iocs, 5, "feedid", False, layout=LAYOUT_TIERED)
+
+    assert len(stored.puts) == 1
+    assert stored.puts[0]["tags"] == ["delta"]
+    assert len(stored.puts[0]["iocs_v2"]) == 2
+    assert stored.reports["base"] is base
+
+
+def test_process_iocs_merge_values_replace(cbcsdk_mock):
+    """Test the equality iocs of a field are merged into iocs of up to `merge_values` values"""
+    api = cbcsdk_mock.api
+    uploaded = []
+
+    def on_post_report(url, body, **kwargs):
+        uploaded.extend(body["reports"])
+        return body
+
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid", FEED_GET_RESP)
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+
+    process_iocs(api, _ipv4_iocs(api, 2500), 5, "feedid", True, merge_values=1000)
+
+    assert len(uploaded) == 1
+    assert [len(ioc["values"]) for ioc in uploaded[0]["iocs_v2"]] == [1000, 1000, 500]
+    assert {ioc["field"] for ioc in uploaded[0]["iocs_v2"]} == {"netconn_ipv4"}
+
+
+def test_process_iocs_merge_values_append(cbcsdk_mock):
+    """Test the values already in the feed are left out of the merged iocs when appending"""
+    api = cbcsdk_mock.api
+    base = {"id": "base", "title": "base", "severity": 5, "iocs_v2": [_equality_ioc(f"10.0.0.{i}") for i in range(5)]}
+    stored = _StoredReports(cbcsdk_mock, [base])
+
+    process_iocs(api, _ipv4_iocs(api, 20), 5, "feedid", False, merge_values=10)
+
+    iocs = [ioc for report in stored.reports.values() for ioc in report["iocs_v2"]]
+    values = [value for ioc in iocs for value in ioc["values"]]
+    assert len(iocs) == 7
+    assert sorted(values) == sorted(ioc._info["values"][0] for ioc in _ipv4_iocs(api, 20))
+
+
+def test_process_iocs_merge_values_layout(cbcsdk_mock):
+    """Test merging the iocs needs the sequential or the tiered layout and no overflow shards"""
+    api = cbcsdk_mock.api
+    with pytest.raises(ValueError):
+        process_iocs(api, [], 5, "feedid", True, layout=LAYOUT_HASHED, merge_values=10)
+    with pytest.raises(ValueError):
+        process_iocs(api, [], 5, "feedid", True, overflow_shards=True, merge_values=10)
+
+
+def test_process_iocs_tiered_merges_deltas(cbcsdk_mock):
+    """Test the delta reports are merged into the base reports once there are too many of them"""
+    api = cbcsdk_mock.api
+    base = {"id": "base", "title": "base", "severity": 5, "iocs_v2": [_equality_ioc(f"10.9.0.{i}") for i in range(5)]}
+    delta = {"id": "delta", "title": "delta", "severity": 5, "tags": ["delta"], "iocs_v2": [_equality_ioc("10.1.0.0")]}
+    stored = _StoredReports(cbcsdk_mock, [base, delta])
+
+    process_iocs(api, _ipv4_iocs(api, 3)[1:], 5, "feedid", False, layout=LAYOUT_TIERED, max_delta_reports=1)
+
+    assert list(stored.reports) == ["base"]
+    assert not is_delta_report(stored.reports["base"])
+    assert len(stored.reports["base"]["iocs_v2"]) == 8
+
+
+def test_process_iocs_plan_append(cbcsdk_mock, tmp_path):
+    """Test planning an append records the filled report and writes nothing"""
+    api = cbcsdk_mock.api
+    base = {"id": "base", "title": "base", "severity": 5, "iocs_v2": [_equality_ioc(f"10.9.0.{i}") for i in range(5)]}
+    stored = _StoredReports(cbcsdk_mock, [base])
+    plan = UploadPlan()
+
+    process_iocs(api, _ipv4_iocs(api, 3)[1:], 5, "feedid", False, plan=plan)
+
+    assert stored.puts == []
+    assert stored.reports == {"base": base}
+    written = plan.write(tmp_path / "plan.json")
+    assert json.loads((tmp_path / "plan.json").read_text()) == written
+    feed_plan = written["feeds"][0]
+    assert feed_plan["feed_id"] == "feedid"
+    assert (feed_plan["created"], feed_plan["updated"], feed_plan["kept"], feed_plan["deleted"]) == (0, 1, 0, 0)
+    assert feed_plan["reports"][0]["iocs"] == 7
+    assert feed_plan["iocs_after"] == 7
+    assert feed_plan["api_calls"] == {"replace": 0, "put": 1, "delete": 0, "total": 1}
+    assert feed_plan["payload_bytes"] == feed_plan["reports"][0]["bytes"] > 0
+
+
+def test_process_iocs_plan_replace(cbcsdk_mock):
+    """Test planning a replacement counts the reports it removes, the request is not sent"""
+    api = cbcsdk_mock.api
+    base = {"id": "base", "title": "base", "severity": 5, "iocs_v2": [_equality_ioc(f"10.9.0.{i}") for i in range(5)]}
+    delta = {"id": "delta", "title": "delta", "severity": 5, "tags": ["delta"], "iocs_v2": [_equality_ioc("10.1.0.0")]}
+    _StoredReports(cbcsdk_mock, [base, delta])
+    plan = UploadPlan()
+
+    process_iocs(api, _ipv4_iocs(api, 3), 5, "feedid", True, plan=plan)
+
+    totals = plan.to_dict()["totals"]
+    assert (totals["created"], totals["updated"], totals["kept"], totals["deleted"]) == (1, 0, 0, 2)
+    assert totals["iocs_uploaded"] == 3
+    assert totals["api_calls"] == 1
+
+
+def test_process_iocs_plan_marks_compaction(cbcsdk_mock):
+    """Test planning a tiered append marks the due merge of the delta reports instead of merging them"""
+    api = cbcsdk_mock.api
+    delta = {"id": "delta", "title": "delta", "severity": 5, "tags": ["delta"], "iocs_v2": [_equality_ioc("10.1.0.0")]}
+    stored = _StoredReports(cbcsdk_mock, [delta])
+    plan = UploadPlan()
+
+    process_iocs(api, _ipv4_iocs(api, 3)[1:], 5, "feedid", False, layout=LAYOUT_TIERED, max_delta_reports=1, plan=plan)
+
+    feed_plan = plan.to_dict()["feeds"][0]
+    assert feed_plan["compaction"] is True
+    assert feed_plan["created"] == 1
+    assert list(stored.reports) == ["delta"]
+
+
+def test_reports_payload_streams_the_body():
+    """Test the body replacing the reports is sent in bounded chunks and matches its length"""
+    reports = [
+        {"id": str(count), "title": "t", "severity": 5, "iocs_v2": [_equality_ioc(f"10.0.0.{count}")]}
+        for count in range(50)
+    ]
+    payload = ReportsPayload([PendingReport.from_body(report) for report in reports], chunk_bytes=512)
+
+    chunks = list(payload)
+    body = b"".join(chunks)
+    assert json.loads(body) == {"reports": reports}
+    assert len(payload) == len(body)
+    assert len(chunks) > 1
+    # a chunk is cut once it reaches the limit, so it holds at most one report past it
+    assert max(len(chunk) for chunk in chunks) < 512 + max(report_size(report) for report in reports)
+    # a retried request serializes the body again
+    assert b"".join(payload) == body
+
+
+def test_reports_payload_builds_reports_lazily(monkeypatch):
+    """Test the length of the body is counted without building the reports, which are built once as they are sent"""
+    records = [IOCRecord.create_equality(f"ioc-{count}", "netconn_ipv4", f"10.0.0.{count}") for count in range(30)]
+    reports = [
+        PendingReport({"id": str(count), "title": "t", "severity": 5}, batch, iocs_size(batch))
+        for count, batch in enumerate([records[:10], records[10:29], records[29:], []])
+    ]
+    built = []
+    body = PendingReport.body
+    monkeypatch.setattr(PendingReport, "body", lambda report: built.append(report.id) or body(report))
+    payload = ReportsPayload(reports, chunk_bytes=512)
+
+    length = len(payload)
+    assert built == []
+    # the first chunk is sent once the first report fills it, the other reports are not built yet
+    next(iter(payload))
+    assert built == ["0"]
+    built.clear()
+    data = b"".join(payload)
+    assert built == ["0", "1", "2", "3"]
+    assert length == len(data)
+    assert [report["iocs_v2"] for report in json.loads(data)["reports"]] == [
+        [record.to_dict() for record in batch] for batch in [records[:10], records[10:29], records[29:], []]
+    ]
+    assert all(report.size() == report_size(body(report)) for report in reports)
+
+
+def test_reports_payload_empty():
+    """Test the body replacing the reports with no reports"""
+    payload = ReportsPayload([])
+    assert b"".join(payload) == b'{"reports":[]}'
+    assert len(payload) == len(b'{"reports":[]}')
+
+
+def test_post_payload_error_message(cbcsdk_mock):
+    """Test an error message in the response of a streamed request is raised"""
+    api = cbcsdk_mock.api
+    url = "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports"
+    cbcsdk_mock.mock_request("POST", url, lambda *args, **kwargs: {"errorMessage": "Bad reports"})
+
+    with pytest.raises(ServerError, match="Bad reports"):
+        post_payload(api, url, ReportsPayload([]))
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the journal of the imports."""
+import os
+import signal
+
+import pytest
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.journal import (
+    PHASE_UPLOADING,
+    ImportInterrupted,
+    ImportJournal,
+    stop_on_sigterm,
+)
+from cbc_importer.ranking import IOCRank, get_rank, set_rank
+
+CONFIGURATION = {"name": "Test Server", "version": 2.1}
+
+
+def _ioc(cbcsdk_mock, value):
+    """An equality ioc"""
+    return IOC_V2.create_equality(cbcsdk_mock.api, f"ioc-{value}", "netconn_ipv4", value)
+
+
+def _collections(cbcsdk_mock, polled, **pages):
+    """Collections with pages of iocs, the polled collections are recorded"""
+
+    def iter_pages(key, values):
+        polled.append(key)
+        for page in values:
+            yield [_ioc(cbcsdk_mock, value) for value in page]
+
+    for key, values in pages.items():
+        yield key, iter_pages(key, values)
+
+
+def test_spool_and_read(tmp_path, cbcsdk_mock):
+    """Test the iocs of all of the pages are spooled and read back"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    polled = []
+    journal.spool(_collections(cbcsdk_mock, polled, a=[["1.1.1.1"], ["2.2.2.2"]], b=[["3.3.3.3"]]))
+
+    assert journal.phase == PHASE_UPLOADING
+    assert [ioc.values for ioc in journal.spooled_iocs()] == [["1.1.1.1"], ["2.2.2.2"], ["3.3.3.3"]]
+    assert (tmp_path / "Test_Server" / "state.json").exists()
+
+    journal.finish()
+    assert not (tmp_path / "Test_Server").exists()
+
+
+def test_spooled_collections(tmp_path, cbcsdk_mock):
+    """Test the spooled iocs are read back by collection"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    journal.spool(_collections(cbcsdk_mock, [], a=[["1.1.1.1"], ["2.2.2.2"]], b=[["3.3.3.3"]]))
+
+    collections = [(key, [ioc.values for ioc in iocs]) for key, iocs in journal.spooled_collections()]
+    assert collections == [("a", [["1.1.1.1"], ["2.2.2.2"]]), ("b", [["3.3.3.3"]])]
+
+
+def test_spool_keeps_rank(tmp_path, cbcsdk_mock):
+    """Test the rank of the spooled iocs is read back, so they are ranked and bucketed as before"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    rank = IOCRank("Server", 2, 1700000000.0, 85, 1690000000.0)
+    ioc = set_rank(_ioc(cbcsdk_mock, "1.1.1.1"), **rank._asdict())
+    journal.spool([("a", iter([[ioc, _ioc(cbcsdk_mock, "2.2.2.2")]]))])
+
+    assert [get_rank(ioc) for ioc in journal.spooled_iocs()] == [rank, IOCRank()]
+    assert [get_rank(ioc) for _, iocs in journal.spooled_collections() for ioc in iocs] == [rank, IOCRank()]
+
+
+def test_resume_interrupted_spool(tmp_path, cbcsdk_mock):
+    """Test a resumed import skips the completed collections and the spooled pages"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    polled = []
+    collections = _collections(cbcsdk_mock, polled, a=[["1.1.1.1"]], b=[["2.2.2.2"], ["3.3.3.3"]], c=[["4.4.4.4"]])
+
+    def interrupt():
+        # stop after the first page of the collection `b`
+        for key, pages in collections:
+            if key == "b":
+                pages = _stop_after_first(journal, pages)
+            yield key, pages
+
+    with pytest.raises(ImportInterrupted):
+        journal.spool(interrupt())
+
+    resumed = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    assert resumed.resumed
+    assert resumed.completed_collections == {"a"}
+    polled.clear()
+    resumed.spool(_collections(cbcsdk_mock, polled, a=[["1.1.1.1"]], b=[["2.2.2.2"], ["3.3.3.3"]], c=[["4.4.4.4"]]))
+
+    # `a` is not polled again and the first page of `b` is not spooled twice
+    assert polled == ["b", "c"]
+    assert [ioc.values[0] for ioc in resumed.spooled_iocs()] == ["1.1.1.1", "2.2.2.2", "3.3.3.3", "4.4.4.4"]
+
+
+def _stop_after_first(journal, pages):
+    """Request the stop once the first page is handed over"""
+    for page in pages:
+        yield page
+        journal.stop()
+
+
+def test_uploading_phase_does_not_poll(tmp_path, cbcsdk_mock):
+    """Test a journal whose parsing is complete does not read the server again"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    journal.spool(_collections(cbcsdk_mock, [], a=[["1.1.1.1"]]))
+    journal.record_report("report-1")
+
+    resumed = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    polled = []
+    resumed.spool(_collections(cbcsdk_mock, polled, a=[["1.1.1.1"]]))
+    assert polled == []
+    assert resumed.uploaded_reports == {"report-1"}
+
+
+def test_configuration_change_discards_journal(tmp_path, cbcsdk_mock):
+    """Test the journal of another configuration is not resumed"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    journal.spool(_collections(cbcsdk_mock, [], a=[["1.1.1.1"]]))
+
+    resumed = ImportJournal.open(tmp_path, "Test Server", dict(CONFIGURATION, version=2.0))
+    assert not resumed.resumed
+    assert list(resumed.spooled_iocs()) == []
+
+
+def test_partially_written_entry_is_skipped(tmp_path, cbcsdk_mock):
+    """Test a log entry cut off by a crash is ignored"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    journal.spool(_collections(cbcsdk_mock, [], a=[["1.1.1.1"]]))
+    journal.record_report("report-1")
+    with open(tmp_path / "Test_Server" / "reports.log", "a") as log_file:
+        log_file.write('"report-')
+
+    assert ImportJournal.open(tmp_path, "Test Server", CONFIGURATION).uploaded_reports == {"report-1"}
+
+
+def test_stop_on_sigterm(tmp_path):
+    """Test SIGTERM stops the import at the next checkpoint and the handler is restored"""
+    journal = ImportJournal.open(tmp_path, "Test Server", CONFIGURATION)
+    previous = signal.getsignal(signal.SIGTERM)
+    with stop_on_sigterm(journal):
+        os.kill(os.getpid(), signal.SIGTERM)
+        with pytest.raises(ImportInterrupted):
+            journal.check()
+    assert signal.getsignal(signal.SIGTERM) is previous
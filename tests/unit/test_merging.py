@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for merging the equality iocs."""
+import json
+
+from cbc_importer.merging import merge_equality_iocs
+from cbc_importer.ranking import IOCRank, get_rank, rank_iocs, set_rank
+from cbc_importer.records import IOCRecord, ioc_raw_data
+
+
+def _ioc(ioc_id, field="netconn_domain", *values, **rank):
+    """An equality record with a rank"""
+    return set_rank(IOCRecord.create_equality(ioc_id, field, *(values or [f"{ioc_id}.example.com"])), **rank)
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_merge_equality_iocs():
+    """Test the equality iocs of a field are merged in the order they come, the other iocs are kept as they are"""
+    query = IOCRecord("q", "query", ["process_name:evil.exe"])
+    linked = IOCRecord("l", "equality", ["4.4.4.4"], field="netconn_ipv4", link="https://example.com")
+    iocs = rank_iocs(
+        [
+            _ioc("a", "netconn_ipv4", "1.1.1.1", priority=2),
+            _ioc("d", "netconn_domain", "d.example.com"),
+            query,
+            _ioc("b", "netconn_ipv4", "2.2.2.2", "1.1.1.1"),
+            linked,
+            _ioc("c", "netconn_ipv4", "3.3.3.3"),
+        ]
+    )
+
+    merged = merge_equality_iocs(iocs, 2, 1000)
+
+    assert [ioc.values for ioc in merged] == [
+        ["1.1.1.1", "2.2.2.2"],
+        ["d.example.com"],
+        ["process_name:evil.exe"],
+        ["4.4.4.4"],
+        ["3.3.3.3"],
+    ]
+    assert get_rank(merged[0]) == IOCRank(priority=2)
+    # the ioc that is not merged with others and the ones that are not equality iocs are kept as they are
+    assert merged[1:] == [iocs[1], query, linked, iocs[5]]
+    # the id of a merged ioc depends on its field and its values only
+    again = merge_equality_iocs([_ioc("x", "netconn_ipv4", "1.1.1.1"), _ioc("y", "netconn_ipv4", "2.2.2.2")], 2, 1000)
+    assert again[0].id == merged[0].id not in ("a", "b")
+
+
+def test_merge_equality_iocs_bounds_and_known_values():
+    """Test a merged ioc is bounded by its count of values and its serialized size, the known values are left out"""
+    iocs = [_ioc(f"ioc-{i}", "netconn_ipv4", f"10.0.0.{i}") for i in range(10)]
+
+    by_count = merge_equality_iocs(iocs, 4, 10000)
+    by_size = merge_equality_iocs(iocs, 100, 150)
+    known = merge_equality_iocs(iocs, 100, 10000, {("netconn_ipv4", "10.0.0.1"), ("netconn_domain", "10.0.0.2")})
+
+    assert [len(ioc.values) for ioc in by_count] == [4, 4, 2]
+    assert all(len(json.dumps(ioc_raw_data(ioc), separators=(",", ":"))) < 150 for ioc in by_size)
+    assert sum(len(ioc.values) for ioc in by_size) == 10 and len(by_size) > 1
+    assert [len(ioc.values) for ioc in known] == [9]
+    assert "10.0.0.1" not in known[0].values
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the partitions of the reports by collection."""
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.partitions import partition_tag, process_partitioned_iocs
+from tests.fixtures.cbc_sdk_mock import CBCSDKMock
+from tests.fixtures.cbc_sdk_mock_responses import FEED_GET_RESP
+
+REPORTS_URL = "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports"
+
+
+@pytest.fixture(scope="function")
+def cb():
+    """Create CBCloudAPI singleton"""
+    return CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+
+
+@pytest.fixture(scope="function")
+def cbcsdk_mock(monkeypatch, cb):
+    """Mocks CBC SDK for unit tests"""
+    return CBCSDKMock(monkeypatch, cb)
+
+
+class FakeReports:
+    """The reports of the feed, kept by the mocked requests"""
+
+    def __init__(self, cbcsdk_mock, reports=()):
+        """Mock the requests to the reports of the feed"""
+        self.reports = {report["id"]: report for report in reports}
+        self.puts = []
+        self.deletes = []
+        cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid", FEED_GET_RESP)
+        cbcsdk_mock.mock_request("GET", REPORTS_URL, lambda *args, **kwargs: {"results": list(self.reports.values())})
+        cbcsdk_mock.mock_request("PUT", f"{REPORTS_URL}/", self.on_put)
+        cbcsdk_mock.mock_request("DELETE", f"{REPORTS_URL}/", self.on_delete)
+
+    def on_put(self, url, body, **kwargs):
+        """Create or update a report"""
+        self.reports[body["id"]] = body
+        self.puts.append(body)
+        return body
+
+    def on_delete(self, url, body):
+        """Delete a report"""
+        report_id = url.rsplit("/", 1)[-1]
+        self.reports.pop(report_id)
+        self.deletes.append(report_id)
+
+    def partition(self, tag):
+        """The values of the iocs in the reports of a partition"""
+        return sorted(
+            ioc["values"][0] for report in self.reports.values() if tag in report["tags"] for ioc in report["iocs_v2"]
+        )
+
+
+def _iocs(api, *values):
+    """Equality iocs"""
+    return [IOC_V2.create_equality(api, f"ioc-{value}", "netconn_ipv4", value) for value in values]
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_partition_tag():
+    """Test the tags are stable and differ by server and collection"""
+    assert partition_tag("Server", "a") == partition_tag("Server", "a")
+    assert len({partition_tag("Server", "a"), partition_tag("Server", "b"), partition_tag("Other", "a")}) == 3
+
+
+def test_partitions_append(cbcsdk_mock):
+    """Test every collection gets its own reports and a later run appends only the new iocs"""
+    api = cbcsdk_mock.api
+    fake = FakeReports(cbcsdk_mock)
+    collections = [("a", _iocs(api, "1.1.1.1", "2.2.2.2")), ("b", _iocs(api, "3.3.3.3"))]
+    process_partitioned_iocs(api, iter(collections), 5, "feedid", False, "Server")
+
+    assert fake.partition(partition_tag("Server", "a")) == ["1.1.1.1", "2.2.2.2"]
+    assert fake.partition(partition_tag("Server", "b")) == ["3.3.3.3"]
+    assert [report["title"] for report in fake.puts] == [
+        "Report My STIX Feed (Server / a)",
+        "Report My STIX Feed (Server / b)",
+    ]
+
+    fake.puts.clear()
+    summary = process_partitioned_iocs(api, [("a", _iocs(api, "1.1.1.1", "4.4.4.4"))], 5, "feedid", False, "Server")
+    assert len(fake.puts) == 1
+    assert fake.partition(partition_tag("Server", "a")) == ["1.1.1.1", "2.2.2.2", "4.4.4.4"]
+    assert summary["partitions_changed"] == 1
+
+
+def test_partitions_replace_one_collection(cbcsdk_mock):
+    """Test replacing a collection leaves the reports of the other collections and the untagged reports alone"""
+    api = cbcsdk_mock.api
+    untagged = {"id": "untagged", "title": "untagged", "severity": 5, "tags": [], "iocs_v2": []}
+    fake = FakeReports(cbcsdk_mock, [untagged])
+    collections = [("a", _iocs(api, "1.1.1.1", "2.2.2.2")), ("b", _iocs(api, "3.3.3.3"))]
+    process_partitioned_iocs(api, collections, 5, "feedid", True, "Server")
+    fake.puts.clear()
+
+    process_partitioned_iocs(api, [("a", _iocs(api, "2.2.2.2", "5.5.5.5"))], 5, "feedid", True, "Server")
+
+    assert len(fake.puts) == 1
+    assert fake.deletes == []
+    assert fake.partition(partition_tag("Server", "a")) == ["2.2.2.2", "5.5.5.5"]
+    assert fake.partition(partition_tag("Server", "b")) == ["3.3.3.3"]
+    assert fake.reports["untagged"] is untagged
+
+
+def test_partitions_unchanged_collection(cbcsdk_mock):
+    """Test a collection whose iocs did not change uploads nothing"""
+    api = cbcsdk_mock.api
+    fake = FakeReports(cbcsdk_mock)
+    process_partitioned_iocs(api, [("a", _iocs(api, "1.1.1.1"))], 5, "feedid", False, "Server", sync=True)
+    fake.puts.clear()
+
+    summary = process_partitioned_iocs(api, [("a", _iocs(api, "1.1.1.1"))], 5, "feedid", False, "Server", sync=True)
+
+    assert fake.puts == []
+    assert summary == {
+        "uploaded": 0,
+        "deleted": 0,
+        "unchanged": 1,
+        "partitions_changed": 0,
+        "dropped": 0,
+        "dropped_by_partition": {},
+    }
+
+
+@pytest.mark.parametrize("replace", [True, False])
+def test_partitions_share_the_feed_cap(cbcsdk_mock, monkeypatch, replace):
+    """Test the cap of the reports holds across the partitions and the dropped iocs are counted by partition"""
+    monkeypatch.setattr("cbc_importer.partitions.REPORTS_BATCH_SIZE", 3)
+    monkeypatch.setattr("cbc_importer.importer.IOCS_BATCH_SIZE", 2)
+    api = cbcsdk_mock.api
+    untagged = {"id": "untagged", "title": "untagged", "severity": 5, "tags": [], "iocs_v2": []}
+    fake = FakeReports(cbcsdk_mock, [untagged])
+    collections = [("a", _iocs(api, "1.1.1.1", "2.2.2.2", "3.3.3.3")), ("b", _iocs(api, "4.4.4.4", "5.5.5.5"))]
+
+    summary = process_partitioned_iocs(api, collections, 5, "feedid", replace, "Server")
+
+    assert len(fake.reports) == 3
+    assert fake.partition(partition_tag("Server", "a")) == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+    assert fake.partition(partition_tag("Server", "b")) == []
+    assert summary["dropped"] == 2
+    assert summary["dropped_by_partition"] == {"b": 2}
+
+
+def test_partitions_need_sequential_layout(cbcsdk_mock):
+    """Test the partitions are refused with another layout"""
+    with pytest.raises(ValueError):
+        process_partitioned_iocs(cbcsdk_mock.api, [], 5, "feedid", True, "Server", layout="hashed")
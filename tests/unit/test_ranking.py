@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the ranking of the iocs."""
+from datetime import datetime, timezone
+
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.ranking import (
+    IOCRank,
+    count_by_source,
+    get_rank,
+    latest_timestamp,
+    rank_iocs,
+    rank_top_iocs,
+    set_rank,
+    unique_iocs,
+    with_source,
+)
+from cbc_importer.records import IOCRecord
+
+
+@pytest.fixture(scope="function")
+def cb():
+    """Create CBCloudAPI singleton"""
+    return CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+
+
+def _ioc(cb, ioc_id, **rank):
+    """An equality ioc with a rank"""
+    return set_rank(IOC_V2.create_equality(cb, ioc_id, "netconn_domain", f"{ioc_id}.example.com"), **rank)
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_latest_timestamp():
+    """Test the latest of the dates is taken and the missing dates are skipped"""
+    older = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    newer = datetime(2023, 6, 1, tzinfo=timezone.utc)
+    assert latest_timestamp(older, None, newer) == newer.timestamp()
+    assert latest_timestamp(None) == 0.0
+
+
+def test_get_rank_default(cb):
+    """Test an ioc without a rank ranks the lowest and the rank is not uploaded"""
+    ioc = IOC_V2.create_equality(cb, "ioc", "netconn_ipv4", "1.1.1.1")
+    assert get_rank(ioc) == IOCRank()
+    set_rank(ioc, confidence=50)
+    assert get_rank(ioc).confidence == 50
+    assert "_rank" not in ioc._info
+
+
+def test_rank_iocs(cb):
+    """Test the iocs are ordered by priority, then recency, then confidence, the ties keep their order"""
+    iocs = [
+        _ioc(cb, "old", timestamp=1.0, confidence=90),
+        _ioc(cb, "tie-a", timestamp=2.0),
+        _ioc(cb, "priority", priority=1),
+        _ioc(cb, "confident", timestamp=2.0, confidence=50),
+        _ioc(cb, "tie-b", timestamp=2.0),
+    ]
+    assert [ioc.id for ioc in rank_iocs(iocs)] == ["priority", "confident", "tie-a", "tie-b", "old"]
+
+
+def test_rank_top_iocs(cb):
+    """Test the iocs beyond the most valuable ones are left out while the iocs are read"""
+    iocs = [_ioc(cb, f"ioc-{i}", timestamp=float(i % 5), confidence=i) for i in range(11)]
+    read = []
+    left_out = []
+
+    def reading():
+        for ioc in iocs:
+            read.append(ioc)
+            yield ioc
+
+    def leave_out(batch):
+        # never more than twice the kept iocs are held
+        assert len(read) - len(left_out) <= 4
+        left_out.extend(batch)
+
+    top = rank_top_iocs(reading(), 2, leave_out)
+
+    assert top == rank_iocs(iocs)[:2]
+    assert sorted(ioc.id for ioc in left_out) == sorted(ioc.id for ioc in rank_iocs(iocs)[2:])
+    assert rank_top_iocs(iocs[:2], 2, leave_out) == rank_iocs(iocs[:2])
+
+
+def test_unique_iocs(cb):
+    """Test the iocs repeating the content of an earlier ioc are dropped, whatever their id"""
+    iocs = [
+        IOCRecord.create_equality("a", "netconn_ipv4", "1.1.1.1"),
+        IOC_V2.create_equality(cb, "b", "netconn_ipv4", "1.1.1.1"),
+        IOCRecord.create_equality("c", "netconn_ipv4", "1.1.1.1", "2.2.2.2"),
+        IOCRecord.create_equality("d", "netconn_domain", "1.1.1.1"),
+    ]
+    assert [ioc.id for ioc in unique_iocs(iocs)] == ["a", "c", "d"]
+
+
+def test_unique_iocs_keeps_most_valuable(cb):
+    """Test the most valuable copy of an ioc is kept in the place of the first copy"""
+    iocs = [_ioc(cb, "low"), _ioc(cb, "other"), _ioc(cb, "high", priority=1), _ioc(cb, "tie", priority=1)]
+    for ioc in iocs[2:]:
+        ioc._info["values"] = iocs[0]._info["values"]
+
+    assert [ioc.id for ioc in unique_iocs(iocs)] == ["high", "other"]
+
+
+def test_with_source_keeps_rank(cb):
+    """Test the source is recorded without losing the rest of the rank"""
+    iocs = list(with_source([_ioc(cb, "ioc", timestamp=5.0)], "Server", 3))
+    assert get_rank(iocs[0]) == IOCRank("Server", 3, 5.0, 0)
+
+
+def test_count_by_source(cb):
+    """Test the iocs among the raw data are counted by their source"""
+    iocs = list(with_source([_ioc(cb, "a"), _ioc(cb, "b")], "First")) + [_ioc(cb, "c")]
+    assert count_by_source(iocs, [iocs[1]._info, iocs[2]._info]) == {"First": 1, "unknown": 1}
+    assert count_by_source(iocs) == {"First": 2, "unknown": 1}
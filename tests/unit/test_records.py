@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the records of the iocs."""
+import pickle
+
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.importer import process_iocs
+from cbc_importer.ranking import IOCRank, count_by_source, get_rank, set_rank, with_source
+from cbc_importer.records import IOCRecord, ioc_key, ioc_raw_data
+from tests.fixtures.cbc_sdk_mock import CBCSDKMock
+from tests.fixtures.cbc_sdk_mock_responses import FEED_GET_RESP, REPORTS_GET_NO_REPORTS
+
+
+@pytest.fixture(scope="function")
+def cb():
+    """Create CBCloudAPI singleton"""
+    return CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+
+
+@pytest.fixture(scope="function")
+def cbcsdk_mock(monkeypatch, cb):
+    """Mocks CBC SDK for unit tests"""
+    return CBCSDKMock(monkeypatch, cb)
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_record_raw_data_matches_ioc_v2(cb):
+    """Test a record has the same raw data as the `IOC_V2` of the SDK"""
+    record = IOCRecord.create_equality("ioc", "netconn_ipv4", "1.1.1.1", "2.2.2.2")
+    ioc = IOC_V2.create_equality(cb, "ioc", "netconn_ipv4", "1.1.1.1", "2.2.2.2")
+
+    assert ioc_raw_data(record) == ioc_raw_data(ioc)
+    assert ioc_key(ioc_raw_data(record)) == ("equality", "netconn_ipv4", ("1.1.1.1", "2.2.2.2"))
+    # the raw data is a new dictionary, changing it does not change the record
+    ioc_raw_data(record)["values"].append("3.3.3.3")
+    assert record.values == ["1.1.1.1", "2.2.2.2"]
+
+
+def test_record_from_dict():
+    """Test the raw data of a query ioc round trips, it has no field"""
+    data = {"id": "query", "match_type": "query", "values": ["process_name:evil.exe"]}
+    record = IOCRecord.from_dict(data)
+
+    assert record.field is None
+    assert record.to_dict() == data
+
+
+def test_record_is_compact_and_picklable():
+    """Test a record has no dictionary and it is pickled with its rank"""
+    record = set_rank(IOCRecord.create_equality("ioc", "netconn_domain", "example.com"), source="Server", priority=2)
+
+    assert not hasattr(record, "__dict__")
+    copy = pickle.loads(pickle.dumps(record))
+    assert copy == record
+    assert get_rank(copy) == IOCRank("Server", 2)
+    assert "rank" not in copy.to_dict()
+
+
+def test_record_hash():
+    """Test the records are hashed by their content, so the copies of an ioc are found in a set"""
+    record = IOCRecord.create_equality("ioc", "netconn_domain", "example.com")
+    copy = IOCRecord.create_equality("ioc", "netconn_domain", "example.com")
+
+    assert hash(record) == hash(copy) == hash(ioc_key(record.to_dict()))
+    assert len({record, copy, IOCRecord.create_equality("other", "netconn_domain", "example.com")}) == 2
+
+
+def test_count_by_source_records():
+    """Test the raw data of the records is matched to them by its content"""
+    iocs = list(with_source([IOCRecord.create_equality(name, "netconn_domain", name) for name in "ab"], "First"))
+    iocs.append(IOCRecord.create_equality("c", "netconn_domain", "c"))
+
+    assert count_by_source(iocs, [ioc_raw_data(iocs[1]), ioc_raw_data(iocs[2])]) == {"First": 1, "unknown": 1}
+
+
+def test_process_iocs_records(cbcsdk_mock):
+    """Test the records are uploaded as the raw data of the iocs"""
+    api = cbcsdk_mock.api
+    uploaded = []
+
+    def on_post_report(url, body, **kwargs):
+        uploaded.extend(ioc for report in body["reports"] for ioc in report["iocs_v2"])
+        return body
+
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid", FEED_GET_RESP)
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", REPORTS_GET_NO_REPORTS)
+    cbcsdk_mock.mock_request("POST", "/threathunter/feedmgr/v2/orgs/test/feeds/feedid/reports", on_post_report)
+    iocs = [IOCRecord.create_equality(f"ioc-{i}", "netconn_ipv4", f"10.0.0.{i}") for i in range(3)]
+
+    process_iocs(api, iocs, 5, "feedid", True)
+
+    assert uploaded == [ioc.to_dict() for ioc in iocs]
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the retries of the writes to CBC."""
+from unittest.mock import Mock
+
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.errors import ClientError, InvalidObjectError, ServerError, TimeoutError
+
+from cbc_importer.retries import (
+    CircuitOpenError,
+    RetryPolicy,
+    get_retry_policy,
+    install_retry_policy,
+)
+
+
+class FakeClock:
+    """Clock that only moves when something sleeps"""
+
+    def __init__(self):
+        """Start at 0"""
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        """Return the current time"""
+        return self.now
+
+    def sleep(self, seconds):
+        """Move the time forward"""
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(scope="function")
+def clock():
+    """Fake clock for the policy"""
+    return FakeClock()
+
+
+def _policy(clock, **kwargs):
+    """Policy with the fake clock and the longest delays"""
+    return RetryPolicy(clock=clock, sleep=clock.sleep, jitter=lambda low, high: high, **kwargs)
+
+
+def test_retries_transient_errors(clock):
+    """Test the transient errors are retried with exponential backoff"""
+    request = Mock(side_effect=[ServerError(503, "down"), TimeoutError(), ClientError(429, "slow down"), "ok"])
+    policy = _policy(clock, base_delay=1, max_delay=3)
+
+    assert policy.call("PUT reports", request, "body") == "ok"
+    assert request.call_count == 4
+    assert clock.slept == [1, 2, 3]
+    assert policy.metrics() == {"retries": 3, "open_circuits": []}
+
+
+def test_jitter_is_bounded(clock):
+    """Test the random delay is picked between 0 and the backoff"""
+    jitter = Mock(return_value=0.5)
+    policy = RetryPolicy(base_delay=2, clock=clock, sleep=clock.sleep, jitter=jitter)
+    policy.call("PUT reports", Mock(side_effect=[ServerError(500, "error"), ServerError(500, "error"), None]))
+    assert [call.args for call in jitter.call_args_list] == [(0, 2), (0, 4)]
+
+
+def test_gives_up_after_attempts(clock):
+    """Test the last error is raised once the attempts are used up"""
+    request = Mock(side_effect=ServerError(503, "down"))
+    with pytest.raises(ServerError):
+        _policy(clock, attempts=3).call("PUT reports", request)
+    assert request.call_count == 3
+
+
+@pytest.mark.parametrize("error", [ClientError(400, "bad request"), InvalidObjectError("invalid")])
+def test_does_not_retry_permanent_errors(clock, error):
+    """Test the errors that fail the same way every time are raised at once"""
+    request = Mock(side_effect=error)
+    with pytest.raises(type(error)):
+        _policy(clock).call("PUT reports", request)
+    assert request.call_count == 1
+
+
+def test_circuit_opens_and_resets(clock):
+    """Test the circuit opens after the failures in a row and lets one trial through after the timeout"""
+    policy = _policy(clock, attempts=1, failure_threshold=2, reset_timeout=60)
+    failing = Mock(side_effect=ServerError(503, "down"))
+    for _ in range(2):
+        with pytest.raises(ServerError):
+            policy.call("PUT reports", failing)
+
+    # the circuit is per endpoint
+    with pytest.raises(CircuitOpenError):
+        policy.call("PUT reports", failing)
+    assert policy.call("DELETE reports", Mock(return_value="ok")) == "ok"
+    assert failing.call_count == 2
+    assert policy.metrics()["open_circuits"] == ["PUT reports"]
+
+    clock.now += 60
+    assert policy.call("PUT reports", Mock(return_value="ok")) == "ok"
+    assert policy.metrics()["open_circuits"] == []
+
+
+def test_failed_trial_opens_circuit_again(clock):
+    """Test a failed trial request opens the circuit for another timeout"""
+    policy = _policy(clock, attempts=1, failure_threshold=1, reset_timeout=60)
+    failing = Mock(side_effect=ServerError(503, "down"))
+    with pytest.raises(ServerError):
+        policy.call("PUT reports", failing)
+    clock.now += 60
+    with pytest.raises(ServerError):
+        policy.call("PUT reports", failing)
+    with pytest.raises(CircuitOpenError):
+        policy.call("PUT reports", failing)
+
+
+def test_install_retry_policy():
+    """Test all of the writes of the CBCloudAPI instance share the same policy"""
+    api = CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+    policy = install_retry_policy(api, attempts=2)
+    assert install_retry_policy(api) is policy
+    assert get_retry_policy(api) is policy
+    assert policy.attempts == 2
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the overflow of the iocs into sibling feeds."""
+import re
+from collections import Counter
+
+import pytest
+from cbc_sdk import CBCloudAPI
+from cbc_sdk.enterprise_edr.threat_intelligence import IOC_V2
+
+from cbc_importer.importer import process_iocs
+from cbc_importer.sharding import ShardManifest, ioc_digest, process_sharded_iocs, shard_name
+from tests.fixtures.cbc_sdk_mock import CBCSDKMock
+
+FEEDS_URL = "/threathunter/feedmgr/v2/orgs/test/feeds"
+
+
+@pytest.fixture(scope="function")
+def cb():
+    """Create CBCloudAPI singleton"""
+    return CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+
+
+@pytest.fixture(scope="function")
+def cbcsdk_mock(monkeypatch, cb):
+    """Mocks CBC SDK for unit tests"""
+    return CBCSDKMock(monkeypatch, cb)
+
+
+class FakeFeeds:
+    """The feeds of the org, backed by the mocked requests"""
+
+    def __init__(self, cbcsdk_mock):
+        """Mock the requests to the feeds and their reports"""
+        self.feeds = {}
+        self.reports = {}
+        self.puts = []
+        self.created = []
+        cbcsdk_mock.mock_request("GET", FEEDS_URL, self.on_get)
+        cbcsdk_mock.mock_request("POST", FEEDS_URL, self.on_post)
+        cbcsdk_mock.mock_request("PUT", FEEDS_URL, self.on_put)
+
+    def add(self, feed_id, name):
+        """Add a feed"""
+        self.feeds[feed_id] = {
+            "id": feed_id,
+            "name": name,
+            "provider_url": "https://example.com",
+            "summary": "feed for stix taxii",
+            "category": "STIX",
+        }
+        self.reports[feed_id] = {}
+
+    def on_get(self, url, *args, **kwargs):
+        """List the feeds, get a feed or its reports"""
+        match = re.fullmatch(rf"{FEEDS_URL}(?:/(\w+))?(/reports)?", url)
+        feed_id, reports = match.groups()
+        if reports:
+            return {"results": list(self.reports[feed_id].values())}
+        if feed_id:
+            return {"feedinfo": self.feeds[feed_id]}
+        return {"results": list(self.feeds.values())}
+
+    def on_post(self, url, body, **kwargs):
+        """Create a feed or replace its reports"""
+        match = re.fullmatch(rf"{FEEDS_URL}/(\w+)/reports", url)
+        if match:
+            self.reports[match.group(1)] = {report["id"]: report for report in body["reports"]}
+            self.puts.append(match.group(1))
+            return {"success": True}
+        feed_id = f"shard{len(self.created) + 1}"
+        self.add(feed_id, body["feedinfo"]["name"])
+        self.created.append(feed_id)
+        return self.feeds[feed_id]
+
+    def on_put(self, url, body, **kwargs):
+        """Create or update a report"""
+        feed_id = re.fullmatch(rf"{FEEDS_URL}/(\w+)/reports/.*", url).group(1)
+        self.reports[feed_id][body["id"]] = body
+        self.puts.append(feed_id)
+        return body
+
+    def iocs_count(self, feed_id):
+        """The count of the iocs in the reports of a feed"""
+        return sum(len(report["iocs_v2"]) for report in self.reports[feed_id].values())
+
+
+def _ipv4_iocs(api, count):
+    """Distinct equality iocs"""
+    return [
+        IOC_V2.create_equality(api, f"ioc-{i}", "netconn_ipv4", f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+        for i in range(count)
+    ]
+
+
+@pytest.fixture(scope="function")
+def feeds(cbcsdk_mock, monkeypatch):
+    """The base feed, which holds two reports at most"""
+    monkeypatch.setattr("cbc_importer.importer.REPORTS_BATCH_SIZE", 2)
+    feeds = FakeFeeds(cbcsdk_mock)
+    feeds.add("basefeed", "Base")
+    return feeds
+
+
+# ==================================== UNIT TESTS BELOW ====================================
+
+
+def test_overflow_creates_shard(cbcsdk_mock, feeds, tmp_path):
+    """Test the iocs that do not fit into the base feed go in a new shard, which is recorded in the manifest"""
+    api = cbcsdk_mock.api
+    iocs = _ipv4_iocs(api, 2500)
+    process_sharded_iocs(api, iocs, 5, "basefeed", False, manifest_dir=tmp_path)
+
+    assert feeds.created == ["shard1"]
+    assert feeds.feeds["shard1"]["name"] == shard_name("Base", 1) == "Base (shard 1)"
+    assert feeds.iocs_count("basefeed") == 2000
+    assert feeds.iocs_count("shard1") == 500
+
+    manifest = ShardManifest.open(tmp_path, "basefeed")
+    assert manifest.shards == ["basefeed", "shard1"]
+    assert Counter(manifest.iocs.values()) == {0: 2000, 1: 500}
+    shard_iocs = [ioc for report in feeds.reports["shard1"].values() for ioc in report["iocs_v2"]]
+    assert {manifest.iocs[ioc_digest(ioc)] for ioc in shard_iocs} == {1}
+
+
+def test_overflow_appends_to_the_right_shard(cbcsdk_mock, feeds, tmp_path):
+    """Test a later run skips the known iocs and only the shard with room is updated"""
+    api = cbcsdk_mock.api
+    process_sharded_iocs(api, _ipv4_iocs(api, 2500), 5, "basefeed", False, manifest_dir=tmp_path)
+    feeds.puts.clear()
+
+    process_sharded_iocs(api, _ipv4_iocs(api, 2505), 5, "basefeed", False, manifest_dir=tmp_path)
+
+    assert feeds.created == ["shard1"]
+    assert feeds.puts == ["shard1"]
+    assert feeds.iocs_count("basefeed") == 2000
+    assert feeds.iocs_count("shard1") == 505
+
+
+def test_overflow_adopts_shard_without_manifest(cbcsdk_mock, feeds, tmp_path):
+    """Test a shard missing from the manifest is found by its name and its iocs are not added again"""
+    api = cbcsdk_mock.api
+    process_sharded_iocs(api, _ipv4_iocs(api, 2500), 5, "basefeed", False, manifest_dir=tmp_path)
+    ShardManifest.open(tmp_path, "basefeed").path.unlink()
+    feeds.puts.clear()
+
+    shard_iocs = [
+        IOC_V2(api, ioc["id"], ioc) for report in feeds.reports["shard1"].values() for ioc in report["iocs_v2"]
+    ]
+    process_sharded_iocs(api, shard_iocs, 5, "basefeed", False, manifest_dir=tmp_path)
+
+    assert feeds.puts == []
+    assert ShardManifest.open(tmp_path, "basefeed").shards == ["basefeed", "shard1"]
+
+
+def test_process_iocs_overflow_needs_sequential_layout(cbcsdk_mock):
+    """Test the overflow shards are refused with the hashed layout"""
+    with pytest.raises(ValueError):
+        process_iocs(cbcsdk_mock.api, [], 5, "basefeed", False, layout="hashed", overflow_shards=True)
+
+
+def test_overflow_replace_keeps_iocs_in_their_shards(cbcsdk_mock, feeds, tmp_path):
+    """Test replacing gives every shard the known iocs it holds, the iocs that are gone are removed"""
+    api = cbcsdk_mock.api
+    process_sharded_iocs(api, _ipv4_iocs(api, 2500), 5, "basefeed", False, manifest_dir=tmp_path)
+    shard_ids = {ioc["id"] for report in feeds.reports["shard1"].values() for ioc in report["iocs_v2"]}
+
+    process_sharded_iocs(api, _ipv4_iocs(api, 1500), 5, "basefeed", True, manifest_dir=tmp_path)
+
+    assert feeds.created == ["shard1"]
+    new_shard_ids = {ioc["id"] for report in feeds.reports["shard1"].values() for ioc in report["iocs_v2"]}
+    assert new_shard_ids == {ioc_id for ioc_id in shard_ids if int(ioc_id.split("-")[1]) < 1500}
+    assert feeds.iocs_count("basefeed") + feeds.iocs_count("shard1") == 1500
+    assert len(ShardManifest.open(tmp_path, "basefeed").iocs) == 1500
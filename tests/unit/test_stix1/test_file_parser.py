@@ -1,7 +1,7 @@
 import pytest
-from cbc_sdk.enterprise_edr import IOC_V2
 from sdv.errors import ValidationError
 
+from cbc_importer.records import IOCRecord
 from cbc_importer.stix_parsers.v1.parser import STIX1Parser
 
 XML_FEED_TEST_VALID = "./tests/fixtures/files/stix_v1.2.xml"
@@ -28,7 +28,7 @@ def test_parser_valid_file_12(cbcsdk_mock):
     parser = STIX1Parser(cbcsdk_mock.api)
     objs = parser.parse_file(XML_FEED_TEST_VALID)
     assert len(objs) == 4
-    assert isinstance(objs[0], IOC_V2)
+    assert isinstance(objs[0], IOCRecord)
 
 
 def test_parser_raises_value_error(monkeypatch, cbcsdk_mock):
@@ -54,3 +54,24 @@ def test_parse_server_general_exception(caplog, monkeypatch, taxii1_server_mock,
         collections,
     )
     assert "Test Exception" in caplog.text
+
+
+def test_iter_taxii_server(taxii1_server_mock, cbcsdk_mock):
+    """Test lazily polling one collection."""
+    parser = STIX1Parser(cbcsdk_mock.api)
+    iocs = parser.iter_taxii_server(taxii1_server_mock, ["COLLECTION_1"])
+
+    assert not isinstance(iocs, list)
+    assert len(list(iocs)) == 4
+    assert parser.iocs == []
+
+
+def test_iter_taxii_server_closed_early(taxii1_server_mock, cbcsdk_mock):
+    """Test the earlier iocs of the parser are kept when the generator is not exhausted."""
+    parser = STIX1Parser(cbcsdk_mock.api)
+    parser.parse_taxii_server(taxii1_server_mock, ["COLLECTION_1"])
+
+    iocs = parser.iter_taxii_server(taxii1_server_mock, ["COLLECTION_1"])
+    next(iocs)
+    iocs.close()
+    assert len(parser.iocs) == 4
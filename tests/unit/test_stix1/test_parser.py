@@ -1,6 +1,10 @@
 import uuid
+from datetime import datetime, timezone
 from unittest import mock
 
+from stix.indicator import Indicator
+
+from cbc_importer.ranking import get_rank
 from cbc_importer.stix_parsers.v1.parser import STIX1Parser
 
 STIX_FILE_HASHES = "./tests/fixtures/files/stix_1x_sample_objects/file_hashes.xml"
@@ -69,6 +73,21 @@ def test_parsing_indicator_multiple_domains(cbcsdk_mock):
     assert len(iocs[0].values) == 3
 
 
+def test_parsing_indicator_sets_rank(cbcsdk_mock):
+    """Test the IOCs are ranked by the timestamp of their indicator."""
+    parser = STIX1Parser(cbcsdk_mock.api)
+    iocs = parser.parse_file(STIX_SIMPLE_DNS_WATCHLIST)
+    assert get_rank(iocs[0]).timestamp == datetime(2014, 5, 8, 9, tzinfo=timezone.utc).timestamp()
+    assert get_rank(iocs[0]).confidence == 0
+
+
+def test_indicator_rank_confidence():
+    """Test the confidence vocabulary of STIX 1 is mapped on the scale of STIX 2."""
+    indicator = Indicator()
+    indicator.confidence = "High"
+    assert STIX1Parser._indicator_rank(indicator)["confidence"] == 85
+
+
 def test_parsing_indicator_raises_key_error(cbcsdk_mock):
     """Test parsing indicator to raise KeyError"""
     parser = STIX1Parser(cbcsdk_mock.api)
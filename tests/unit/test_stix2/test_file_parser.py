@@ -1,6 +1,6 @@
 import pytest
-from cbc_sdk.enterprise_edr import IOC_V2
 
+from cbc_importer.records import IOCRecord
 from cbc_importer.stix_parsers.v2.parser import STIX2Parser
 
 JSON_FEED_TEST_VALID_21 = "./tests/fixtures/files/stix_v2.1.json"
@@ -38,7 +38,7 @@ def test_parser_valid_file_21(cbcsdk_mock):
     parser = STIX2Parser(cbcsdk_mock.api)
     objs = parser.parse_file(JSON_FEED_TEST_VALID_21)
     assert len(objs) == 4
-    assert isinstance(objs[0], IOC_V2)
+    assert isinstance(objs[0], IOCRecord)
 
 
 def test_parser_parse_stix_indicator_with_pattern_error_21(cbcsdk_mock):
@@ -64,7 +64,7 @@ def test_parser_valid_file_20(cbcsdk_mock):
     parser = STIX2Parser(cbcsdk_mock.api, stix_version="2.0")
     objs = parser.parse_file(JSON_FEED_TEST_VALID_20)
     assert len(objs) == 4
-    assert isinstance(objs[0], IOC_V2)
+    assert isinstance(objs[0], IOCRecord)
 
 
 def test_parser_parse_stix_indicator_with_pattern_error_20(cbcsdk_mock):
@@ -39,3 +39,10 @@ def test_parse_feed(cbcsdk_mock, taxii2_server_mock):
     """Test parse feed."""
     iocs = STIX2Parser(cbcsdk_mock.api).parse_taxii_server(taxii2_server_mock)
     assert len(iocs) == 16
+
+
+def test_iter_taxii_server(cbcsdk_mock, taxii2_server_mock):
+    """Test lazily parsing a feed."""
+    iocs = STIX2Parser(cbcsdk_mock.api).iter_taxii_server(taxii2_server_mock)
+    assert not isinstance(iocs, list)
+    assert len(list(iocs)) == 16
@@ -1,6 +1,9 @@
+from datetime import datetime, timezone
+
 from stix2 import Bundle, Indicator
 from stix2.exceptions import InvalidValueError
 
+from cbc_importer.ranking import get_rank
 from cbc_importer.stix_parsers.v2.parser import STIX2Parser
 
 JSON_FEED_TEST_VALID = "./src/tests/fixtures/files/stix_v2.1.json"
@@ -187,3 +190,20 @@ def test_parser_parse_stix_indicator_with_ip_domain(cbcsdk_mock):
     assert objs[2].values == ["2001:0db8:dead:beef:dead:beef:dead:0001"]
     assert objs[3].field == "netconn_domain"
     assert objs[3].values == ["example.com"]
+
+
+def test_parser_parse_stix_indicator_sets_rank(cbcsdk_mock):
+    """Test the IOCs are ranked by the recency and the confidence of their Indicator."""
+    parser = STIX2Parser(cbcsdk_mock.api)
+    indicator = STIXFactory.create_stix_indicator(
+        pattern="[url:value = 'http://example.com']",
+        created="2023-01-01T00:00:00Z",
+        modified="2023-06-01T00:00:00Z",
+        valid_from="2023-03-01T00:00:00Z",
+        confidence=70,
+    )
+    objs = parser._parse_stix_indicator(indicator)
+    rank = get_rank(objs[0])
+    assert rank.timestamp == datetime(2023, 6, 1, tzinfo=timezone.utc).timestamp()
+    assert rank.confidence == 70
+    assert "rank" not in objs[0].to_dict()
@@ -50,6 +50,29 @@ def test_get_client_raises_value_error(example_configuration):
         TAXIIConfigurator(example_configuration["servers"][1])
 
 
+def test_cbc_feed_options_invalid_layout(example_configuration):
+    """Test for validating the layout of the feed options"""
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "random"
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+
+
+@pytest.mark.parametrize("workers", ["4", 0])
+def test_cbc_feed_options_invalid_workers(example_configuration, workers):
+    """Test for validating the workers of the feed options"""
+    example_configuration["servers"][0]["cbc_feed_options"]["workers"] = workers
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+
+
+def test_cbc_feed_options_overflow_shards_hashed(example_configuration):
+    """Test for validating the overflow shards need the sequential layout"""
+    example_configuration["servers"][0]["cbc_feed_options"]["overflow_shards"] = True
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "hashed"
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+
+
 def test_get_search_options_1x(example_configuration):
     """Test for setting the search options"""
     example_configuration["servers"][0]["options"]["collection_management_uri"] = "/test/"
@@ -150,3 +173,84 @@ def test_authenticate_client_taxii2(example_configuration):
     assert configurator.client._password == "guest"
     assert configurator.client._verify
     assert configurator.client._cert is None
+
+
+def test_priority(example_configuration):
+    """Test for setting the priority of the server, it defaults to 0"""
+    assert TAXIIConfigurator(example_configuration["servers"][0]).priority == 0
+    example_configuration["servers"][0]["priority"] = 2
+    assert TAXIIConfigurator(example_configuration["servers"][0]).priority == 2
+
+
+def test_priority_invalid(example_configuration):
+    """Test for validating the priority of the server"""
+    example_configuration["servers"][0]["priority"] = "high"
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+
+
+def test_cbc_feed_options_retention_days(example_configuration):
+    """Test for validating the retention needs a time layout"""
+    example_configuration["servers"][0]["cbc_feed_options"]["retention_days"] = 30
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "weekly"
+    assert TAXIIConfigurator(example_configuration["servers"][0]).cbc_feed_options["retention_days"] == 30
+
+
+def test_cbc_feed_options_max_delta_reports(example_configuration):
+    """Test for validating the delta reports need the tiered layout"""
+    example_configuration["servers"][0]["cbc_feed_options"]["max_delta_reports"] = 5
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "tiered"
+    assert TAXIIConfigurator(example_configuration["servers"][0]).cbc_feed_options["max_delta_reports"] == 5
+
+
+def test_cbc_feed_options_merge_values(example_configuration):
+    """Test for validating the merged IOCs need a suitable layout"""
+    example_configuration["servers"][0]["cbc_feed_options"]["merge_values"] = 0
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+    example_configuration["servers"][0]["cbc_feed_options"]["merge_values"] = 1000
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "hashed"
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "tiered"
+    assert TAXIIConfigurator(example_configuration["servers"][0]).cbc_feed_options["merge_values"] == 1000
+
+
+def test_cbc_feed_options_partitioned(example_configuration):
+    """Test for reading the partitions out of the options of the feed"""
+    example_configuration["servers"][0]["cbc_feed_options"]["partitioned"] = True
+    configurator = TAXIIConfigurator(example_configuration["servers"][0])
+    assert configurator.partitioned
+    assert "partitioned" not in configurator.cbc_feed_options
+    assert example_configuration["servers"][0]["cbc_feed_options"]["partitioned"]
+
+
+def test_cbc_feed_options_partitioned_hashed(example_configuration):
+    """Test for validating the partitions need the sequential layout"""
+    example_configuration["servers"][0]["cbc_feed_options"]["partitioned"] = True
+    example_configuration["servers"][0]["cbc_feed_options"]["layout"] = "hashed"
+    with pytest.raises(ValueError):
+        TAXIIConfigurator(example_configuration["servers"][0])
+
+
+def test_check_shared_feeds(example_configuration):
+    """Test for validating the servers sharing a feed have the same options and are all partitioned or none"""
+    servers = example_configuration["servers"][:2]
+    for server in servers:
+        server["cbc_feed_options"] = {"feed_id": "feedid", "replace": True, "severity": 5}
+    TAXIIConfigurator.check_shared_feeds([TAXIIConfigurator(server) for server in servers])
+
+    servers[1]["cbc_feed_options"]["replace"] = False
+    with pytest.raises(ValueError, match="differ"):
+        TAXIIConfigurator.check_shared_feeds([TAXIIConfigurator(server) for server in servers])
+
+    servers[1]["cbc_feed_options"]["partitioned"] = True
+    with pytest.raises(ValueError, match="partitioned"):
+        TAXIIConfigurator.check_shared_feeds([TAXIIConfigurator(server) for server in servers])
+
+    servers[0]["cbc_feed_options"]["partitioned"] = True
+    TAXIIConfigurator.check_shared_feeds([TAXIIConfigurator(server) for server in servers])
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# *******************************************************
+# © 2024 Broadcom. All Rights Reserved. Carbon Black.
+# SPDX-License-Identifier: BSD-2-Clause
+# *******************************************************
+# *
+# * DISCLAIMER. THIS PROGRAM IS PROVIDED TO YOU "AS IS" WITHOUT
+# * WARRANTIES OR CONDITIONS OF ANY KIND, WHETHER ORAL OR WRITTEN,
+# * EXPRESS OR IMPLIED. THE AUTHOR SPECIFICALLY DISCLAIMS ANY IMPLIED
+# * WARRANTIES OR CONDITIONS OF MERCHANTABILITY, SATISFACTORY QUALITY,
+# * NON-INFRINGEMENT AND FITNESS FOR A PARTICULAR PURPOSE.
+
+"""Tests for the rate limiting of the requests to CBC."""
+import logging
+import threading
+from unittest.mock import Mock
+
+import pytest
+from cbc_sdk import CBCloudAPI
+
+from cbc_importer.throttling import (
+    RateLimiter,
+    get_rate_limiter,
+    install_rate_limiter,
+    parse_retry_after,
+)
+
+
+class FakeClock:
+    """Clock that only moves when something sleeps"""
+
+    def __init__(self):
+        """Start at 0"""
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        """Return the current time"""
+        return self.now
+
+    def sleep(self, seconds):
+        """Move the time forward"""
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(scope="function")
+def clock():
+    """Fake clock for the limiter"""
+    return FakeClock()
+
+
+def test_token_bucket(clock):
+    """Test the requests over the burst wait for new tokens"""
+    limiter = RateLimiter(rate=2, burst=2, max_rate=2, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.1, 200)
+    assert clock.slept == [pytest.approx(0.5)]
+    assert limiter.metrics()["requests"] == 3
+
+
+def test_throttled_response_decreases_limits(clock):
+    """Test a 429 halves the limits and pauses the requests for `Retry-After`"""
+    limiter = RateLimiter(rate=10, concurrency=8, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.release(0.1, 429, retry_after=3)
+
+    assert limiter.metrics() == {"rate": 5.0, "concurrency": 4, "in_flight": 0, "requests": 1, "throttled": 1}
+    limiter.acquire()
+    assert clock.now >= 3
+
+
+def test_slow_response_decreases_concurrency(clock):
+    """Test a slow response halves only the concurrency"""
+    limiter = RateLimiter(rate=10, concurrency=8, latency_target=1, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.release(2.5, 200)
+    assert limiter.metrics()["concurrency"] == 4
+    assert limiter.metrics()["rate"] == 10
+
+
+def test_fast_responses_increase_limits(clock):
+    """Test the limits grow additively up to the maximum"""
+    limiter = RateLimiter(rate=10, max_rate=11, concurrency=2, max_concurrency=3, clock=clock, sleep=clock.sleep)
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release(0.1, 200)
+    assert limiter.metrics()["rate"] == 11
+    assert limiter.metrics()["concurrency"] == 3
+
+
+def test_increased_limits_are_logged(clock, caplog):
+    """Test the increased limits are logged at most once per interval"""
+    limiter = RateLimiter(rate=10, clock=clock, sleep=clock.sleep)
+    with caplog.at_level(logging.INFO, logger="cbc_importer.throttling"):
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(0.1, 200)
+        assert not caplog.records
+        clock.now += RateLimiter.LOG_INTERVAL
+        limiter.acquire()
+        limiter.release(0.1, 200)
+    assert len(caplog.records) == 1
+    assert "rate=" in caplog.records[0].getMessage()
+
+
+def test_concurrency_limit_blocks():
+    """Test a request waits while the concurrency limit is reached"""
+    limiter = RateLimiter(rate=100, concurrency=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def second_request():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=second_request)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(0.1, 200)
+    assert acquired.wait(1)
+    thread.join()
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("5", 5.0), ("-1", 0.0), (None, None), ("soon", None), ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0)],
+)
+def test_parse_retry_after(value, expected):
+    """Test parsing the `Retry-After` header"""
+    assert parse_retry_after(value) == expected
+
+
+def test_install_rate_limiter():
+    """Test all of the requests of the CBCloudAPI instance go through the same limiter"""
+    api = CBCloudAPI(url="https://example.com", org_key="test", token="abcd/1234", ssl_verify=False)
+    api.session.session.request = Mock(return_value=Mock(status_code=429, headers={"Retry-After": "0"}))
+
+    limiter = install_rate_limiter(api, rate=50)
+    assert install_rate_limiter(api) is limiter
+    assert get_rate_limiter(api) is limiter
+
+    api.session.session.request("GET", "https://example.com/test")
+    assert limiter.metrics()["throttled"] == 1
+    assert limiter.metrics()["rate"] == 25
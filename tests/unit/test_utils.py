@@ -30,8 +30,12 @@ from cbc_importer.utils import (
     create_feed,
     create_watchlist,
     get_feed,
+    validate_layout,
+    validate_priority,
+    validate_positive_int,
     validate_provider_url,
     validate_severity,
+    validate_size_limit,
 )
 from tests.fixtures.cbc_sdk_credentials_mock import MockCredentialProvider
 from tests.fixtures.cbc_sdk_mock import CBCSDKMock
@@ -219,3 +223,51 @@ def test_validate_severity_invalid(test_input):
     """Test for validation of the severity raising BadParameter"""
     with pytest.raises(BadParameter):
         validate_severity(test_input)
+
+
+def test_validate_layout():
+    """Test for validation of the layout"""
+    assert validate_layout("hashed") == "hashed"
+
+
+def test_validate_layout_invalid():
+    """Test for validation of the layout raising BadParameter"""
+    with pytest.raises(BadParameter):
+        validate_layout("random")
+
+
+def test_validate_positive_int():
+    """Test for validation of the options which are counts"""
+    assert validate_positive_int("Workers")(8) == 8
+
+
+@pytest.mark.parametrize(
+    "test_input",
+    [(0), (-1), ("4"), (True)],
+)
+def test_validate_positive_int_invalid(test_input):
+    """Test for validation of the options which are counts raising BadParameter with the name of the option"""
+    with pytest.raises(BadParameter, match="Retention days must be at least 1"):
+        validate_positive_int("Retention days")(test_input)
+
+
+def test_validate_size_limit():
+    """Test for validation of the size limits"""
+    assert validate_size_limit(1024 * 1024) == 1024 * 1024
+
+
+@pytest.mark.parametrize(
+    "test_input",
+    [(0), (1023), ("1048576"), (True)],
+)
+def test_validate_size_limit_invalid(test_input):
+    """Test for validation of the size limits raising BadParameter"""
+    with pytest.raises(BadParameter):
+        validate_size_limit(test_input)
+
+
+def test_validate_priority():
+    """Test for validation of the priority"""
+    assert validate_priority(-1) == -1
+    with pytest.raises(BadParameter):
+        validate_priority("high")
@@ -17,11 +17,12 @@ import copy
 import pytest
 from cbc_sdk.credential_providers.default import default_provider_object
 from cbc_sdk.credentials import Credentials
+from cbc_sdk.errors import ObjectNotFoundError
 
 from cbc_importer.cli.wizard import CBCloudAPI, cli
 from tests.fixtures.cbc_sdk_credentials_mock import MockCredentialProvider
 from tests.fixtures.cbc_sdk_mock import CBCSDKMock
-from tests.fixtures.cbc_sdk_mock_responses import FEED_GET_RESP
+from tests.fixtures.cbc_sdk_mock_responses import FEED_GET_ALL_RESP, FEED_GET_RESP
 from tests.fixtures.config_mock import (
     CREATE_CONFIG_DATA,
     MIGRATED_DATA,
@@ -145,6 +146,45 @@ def test_migrate_file_exists_no_proxy(monkeypatch, cbcsdk_mock):
     assert dump_called
 
 
+def test_migrate_feed_not_found(monkeypatch, cbcsdk_mock, capsys):
+    """Test for migrating config with a feed that is not found - the config is migrated with a warning."""
+    monkeypatch.setattr("cbc_importer.cli.wizard.get_cb", lambda: cbcsdk_mock.api)
+    cbcsdk_mock.mock_request(
+        "GET", "/threathunter/feedmgr/v2/orgs/A1B2C3D4/feeds/90TuDxDYQtiGyg5qhwYCg", ObjectNotFoundError("feed")
+    )
+    dumped = []
+    answers = iter(["1", ""])
+
+    monkeypatch.setattr("builtins.input", lambda the_prompt="": next(answers))
+    monkeypatch.setattr("yaml.safe_load", lambda x: OLD_CONFIG_DATA)
+    monkeypatch.setattr("yaml.dump", lambda data, config, **kwargs: dumped.append(data))
+    monkeypatch.setattr("os.path.exists", lambda x: True)
+    monkeypatch.setattr("builtins.open", open_file_mock)
+    cli()
+    assert dumped == [MIGRATED_DATA]
+    assert "The feed 90TuDxDYQtiGyg5qhwYCg of my_site_name_1 was not found" in capsys.readouterr().out
+
+
+def test_migrate_feed_base_name(monkeypatch, cbcsdk_mock):
+    """Test for migrating config with the feed given by its name - the id is found in the index of the feeds."""
+    monkeypatch.setattr("cbc_importer.cli.wizard.get_cb", lambda: cbcsdk_mock.api)
+    cbcsdk_mock.mock_request("GET", "/threathunter/feedmgr/v2/orgs/A1B2C3D4/feeds", FEED_GET_ALL_RESP)
+    old_config_data = copy.deepcopy(OLD_CONFIG_DATA)
+    site = old_config_data["sites"]["my_site_name_1"]
+    site["feed_base_name"] = "IBM IRIS Feed"
+    del site["feed_id"]
+    dumped = []
+    answers = iter(["1", ""])
+
+    monkeypatch.setattr("builtins.input", lambda the_prompt="": next(answers))
+    monkeypatch.setattr("yaml.safe_load", lambda x: old_config_data)
+    monkeypatch.setattr("yaml.dump", lambda data, config, **kwargs: dumped.append(data))
+    monkeypatch.setattr("os.path.exists", lambda x: True)
+    monkeypatch.setattr("builtins.open", open_file_mock)
+    cli()
+    assert dumped == [MIGRATED_DATA]
+
+
 def test_generate_config(monkeypatch):
     """Test generate config - successful case"""
     called = -1